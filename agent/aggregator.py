@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+
+Summary = Tuple[Hashable, int, float, str, str]
+
+
+class AlertAggregator:
+    # Первый алерт с данным отпечатком проходит сразу, повторы в пределах
+    # окна только считаются. По закрытии окна выдаётся одна сводка.
+    # Записи упорядочены по началу окна, поэтому flush() смотрит только на
+    # истёкшие записи в голове словаря.
+
+    def __init__(self, window: float = 60.0, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        self.suppressed_total = 0
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def offer(self, fingerprint: Hashable, message: str, level: str,
+              now: Optional[float] = None) -> Tuple[bool, List[Summary]]:
+        now = self.clock() if now is None else now
+        summaries: List[Summary] = []
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                self.suppressed_total += 1
+                return False, summaries
+            if entry is not None:
+                del self._entries[fingerprint]
+                if entry[1]:
+                    summaries.append((fingerprint, entry[1], now - entry[0], entry[2], entry[3]))
+            self._entries[fingerprint] = [now, 0, message, level]
+            while len(self._entries) > self.max_keys:
+                key, old = self._entries.popitem(last=False)
+                if old[1]:
+                    summaries.append((key, old[1], now - old[0], old[2], old[3]))
+        return True, summaries
+
+    def flush(self, now: Optional[float] = None) -> List[Summary]:
+        now = self.clock() if now is None else now
+        summaries: List[Summary] = []
+        with self._lock:
+            while self._entries:
+                key, entry = next(iter(self._entries.items()))
+                if now - entry[0] < self.window:
+                    break
+                del self._entries[key]
+                if entry[1]:
+                    summaries.append((key, entry[1], now - entry[0], entry[2], entry[3]))
+        return summaries
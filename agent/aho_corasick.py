@@ -0,0 +1,76 @@
+from collections import deque
+from typing import Iterable, List, Set, Tuple
+
+
+class KeywordAutomaton:
+    # Автомат Ахо-Корасик: все ключевые слова ищутся за один проход по строке,
+    # независимо от их количества.
+
+    __slots__ = ("keywords", "_goto", "_fail", "_out")
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: Tuple[str, ...] = tuple(keywords)
+        goto = [{}]
+        out: List[Tuple[int, ...]] = [()]
+        for index, keyword in enumerate(self.keywords):
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] = out[state] + (index,)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(char, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = tuple(goto)
+        self._fail = tuple(fail)
+        self._out = tuple(out)
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def _states(self, text: str):
+        goto, fail = self._goto, self._fail
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            yield state
+
+    def matches(self, text: str):
+        out = self._out
+        for end, state in enumerate(self._states(text)):
+            for index in out[state]:
+                yield end, index
+
+    def search(self, text: str) -> bool:
+        out = self._out
+        for state in self._states(text):
+            if out[state]:
+                return True
+        return False
+
+    def find_all(self, text: str) -> Set[int]:
+        out = self._out
+        found: Set[int] = set()
+        for state in self._states(text):
+            if out[state]:
+                found.update(out[state])
+        return found
@@ -6,45 +6,199 @@ from typing import List, Optional
 from dotenv import load_dotenv
 import os
 
+from agent import metrics
+from agent.aggregator import AlertAggregator
+from agent.dispatcher import Dispatcher, RetryAfter
+from agent.events import make_event
+from agent.sinks import Sink, create_sink
+
 load_dotenv()
 
 logger = logging.getLogger("SecMon")
 logger.setLevel(logging.INFO)
-handler = RotatingFileHandler("secmon.log", maxBytes=5*1024*1024, backupCount=3)
-handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s"))
-logger.addHandler(handler)
+handler: Optional[logging.Handler] = None
 
+TG_API_URL = "https://api.telegram.org"
+TG_MAX_MESSAGE = 4096
 TG_TOKEN: Optional[str] = None
 TG_CHAT_ID: Optional[str] = None
 ALERT_METHODS: List[str] = ["telegram", "log"]
 
+session: Optional[requests.Session] = None
+dispatcher: Optional[Dispatcher] = None
+aggregator: Optional[AlertAggregator] = None
+sinks: List[Sink] = []
+
+ALERTS = metrics.counter("secmon_alerts_total", "Alerts emitted", ["monitor", "level"])
+SUPPRESSED = metrics.counter("secmon_alerts_suppressed_total", "Repeated alerts folded into summaries", ["monitor"])
+SEND_ERRORS = metrics.counter("secmon_telegram_send_errors_total", "Synchronous Telegram sends that failed")
+DISPATCH_DEPTH = metrics.gauge("secmon_dispatch_queue_depth", "Items waiting in a delivery queue", ["queue"])
+DISPATCH_ITEMS = metrics.gauge("secmon_dispatch_items", "Delivery queue totals since start", ["queue", "result"])
+
+def setup_logging(log_file: str) -> None:
+    global handler
+    if handler is not None:
+        logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(str(Path(log_file).resolve()), maxBytes=5*1024*1024,
+                                  backupCount=3, delay=True)
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s"))
+    logger.addHandler(handler)
+
 def init(config_data: dict) -> None:
-    global TG_TOKEN, TG_CHAT_ID, ALERT_METHODS
+    global TG_TOKEN, TG_CHAT_ID, ALERT_METHODS, TG_API_URL, dispatcher, aggregator, sinks
     TG_TOKEN = os.getenv("TELEGRAM_TOKEN") or config_data.get("telegram_token")
-    TG_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID") or config_data.get("telegram_chat_id")   
+    TG_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID") or config_data.get("telegram_chat_id")
     ALERT_METHODS = config_data.get("alert_methods", ["telegram", "log"])
-    
+    TG_API_URL = config_data.get("telegram_api_url", "https://api.telegram.org").rstrip("/")
+
     if "telegram" in ALERT_METHODS and (not TG_TOKEN or not TG_CHAT_ID):
         raise ValueError("Telegram token or chat ID not provided in settings.json or .env")
-    
-    log_file = config_data.get("log_file", "secmon.log")
-    handler.baseFilename = str(Path(log_file).resolve())
+
+    setup_logging(config_data.get("log_file", "secmon.log"))
+
+    if dispatcher is not None:
+        dispatcher.stop()
+    dispatcher = Dispatcher(
+        send_telegram_batch,
+        name="telegram-dispatcher",
+        maxsize=config_data.get("telegram_queue_size", 1000),
+        overflow=config_data.get("telegram_overflow", "drop_oldest"),
+        batch_interval=config_data.get("telegram_batch_interval", 2.0),
+        split=split_messages,
+        rate=config_data.get("telegram_rate", 1.0),
+        burst=config_data.get("telegram_burst", 5),
+        on_error=logger.error,
+    )
+    window = config_data.get("alert_dedup_window", 60)
+    aggregator = AlertAggregator(window, config_data.get("alert_dedup_max_keys", 10000)) if window > 0 else None
+    for sink in sinks:
+        sink.stop()
+    sinks = [create_sink(options, on_error=logger.error) for options in config_data.get("event_sinks", [])]
+
+def get_session() -> requests.Session:
+    global session
+    if session is None:
+        session = requests.Session()
+    return session
+
+def start_dispatcher() -> None:
+    if dispatcher is not None and "telegram" in ALERT_METHODS:
+        dispatcher.start()
+    for sink in sinks:
+        sink.start()
+
+def stop_dispatcher(timeout: float = 5.0) -> None:
+    if dispatcher is not None:
+        dispatcher.stop(timeout)
+    for sink in sinks:
+        sink.stop(timeout)
+
+def dispatcher_stats() -> dict:
+    return dispatcher.stats() if dispatcher is not None else {}
+
+def sink_stats() -> dict:
+    return {sink.name: sink.stats() for sink in sinks}
+
+def collect_metrics() -> None:
+    queues = dict(sink_stats())
+    if dispatcher is not None:
+        queues["telegram"] = dispatcher.stats()
+    for name, stats in queues.items():
+        DISPATCH_DEPTH.set(stats["depth"], queue=name)
+        for result in ("enqueued", "dropped", "sent", "failed", "retries"):
+            DISPATCH_ITEMS.set(stats[result], queue=name, result=result)
+
+metrics.on_collect(collect_metrics)
+
+def split_messages(messages: list) -> list:
+    # Склеиваем алерты в сообщения не длиннее лимита Telegram.
+    chunks, current, size = [], [], 0
+    for message in messages:
+        message = message[:TG_MAX_MESSAGE]
+        extra = len(message) + (2 if current else 0)
+        if current and size + extra > TG_MAX_MESSAGE:
+            chunks.append(current)
+            current, size = [], 0
+            extra = len(message)
+        current.append(message)
+        size += extra
+    if current:
+        chunks.append(current)
+    return chunks
+
+def post_telegram(text: str) -> requests.Response:
+    url = f"{TG_API_URL}/bot{TG_TOKEN}/sendMessage"
+    payload = {"chat_id": TG_CHAT_ID, "text": text}
+    return get_session().post(url, json=payload, timeout=5)
+
+def send_telegram_batch(messages: list) -> None:
+    response = post_telegram("\n\n".join(messages))
+    if response.status_code == 429:
+        try:
+            delay = response.json().get("parameters", {}).get("retry_after", 1)
+        except ValueError:
+            delay = 1
+        raise RetryAfter(delay, f"Telegram rate limit: {response.text}")
+    if response.status_code != 200:
+        raise RuntimeError(f"Telegram API error: {response.text}")
 
 def send_telegram_alert(message: str) -> None:
     if "telegram" not in ALERT_METHODS or not TG_TOKEN or not TG_CHAT_ID:
         return
-    url = f"https://api.telegram.org/bot{TG_TOKEN}/sendMessage"
-    payload = {"chat_id": TG_CHAT_ID, "text": message}
     try:
-        response = requests.post(url, json=payload, timeout=5)
+        response = post_telegram(message)
         if response.status_code != 200:
+            SEND_ERRORS.inc()
             logger.error(f"Telegram API error: {response.text}")
     except Exception as e:
+        SEND_ERRORS.inc()
         logger.error(f"Telegram send error: {e}")
 
-def alert(message: str, level: str = "INFO") -> None:
+def _format_summary(count: int, elapsed: float, message: str) -> str:
+    first_line = message.splitlines()[0] if message else ""
+    return f" Повтор ×{count} за {int(elapsed)}с: {first_line}"
+
+def _emit_summary(fingerprint, count: int, elapsed: float, message: str, level: str) -> None:
+    monitor, rule, _ = fingerprint
+    _emit(_format_summary(count, elapsed, message), level, monitor=monitor, rule=rule,
+          suppressed=count, window=round(elapsed, 3))
+
+def flush_aggregated() -> None:
+    # Сводки по окнам, которые закрылись без новых алертов.
+    if aggregator is None:
+        return
+    for summary in aggregator.flush():
+        _emit_summary(*summary)
+
+def _emit(message: str, level: str, monitor: Optional[str] = None, rule: Optional[str] = None,
+          **fields) -> None:
+    ALERTS.inc(monitor=monitor or "agent", level=level.upper())
+    if sinks:
+        event = make_event(message, level, monitor=monitor, rule=rule, **fields)
+        for sink in sinks:
+            sink.put(event)
     log_level = getattr(logging, level.upper(), logging.INFO)
     if "log" in ALERT_METHODS:
         logger.log(log_level, message)
     if "telegram" in ALERT_METHODS:
-        send_telegram_alert(message)
+        if dispatcher is not None and dispatcher.running:
+            dispatcher.put(message)
+        else:
+            send_telegram_alert(message)
+
+def alert(message: str, level: str = "INFO", monitor: Optional[str] = None,
+          rule: Optional[str] = None, key=None, **fields) -> None:
+    # Алерты с указанным key группируются по (monitor, rule, key):
+    # повторы в пределах окна подавляются и выдаются одной сводкой.
+    # fields (pid, exe, rule_ids, addresses, ...) попадают в структурированное событие.
+    if aggregator is None or key is None:
+        _emit(message, level, monitor=monitor, rule=rule, **fields)
+        return
+    passed, summaries = aggregator.offer((monitor, rule, key), message, level)
+    for summary in summaries:
+        _emit_summary(*summary)
+    if not passed:
+        SUPPRESSED.inc(monitor=monitor or "agent")
+    if passed:
+        _emit(message, level, monitor=monitor, rule=rule, **fields)
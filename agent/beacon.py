@@ -0,0 +1,252 @@
+import heapq
+import itertools
+import math
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from typing import Hashable, List, Optional
+
+from agent import metrics, rule_engine
+
+SKETCH_WIDTH = 4096
+SKETCH_DEPTH = 4
+TOP_K = 2048
+FANOUT_BITS = 4096
+FANOUT_MAX_EXES = 256
+
+Finding = namedtuple("Finding", ["rule", "rule_id", "exe", "remote_ip", "remote_port", "reason"])
+
+TRACKED = metrics.gauge("secmon_beacon_tracked_endpoints", "Endpoints in the heavy-hitters table")
+FINDINGS = metrics.counter("secmon_beacon_findings_total", "Beaconing and fan-out detections", ["rule"])
+
+
+class CountMinSketch:
+    # depth строк по width счётчиков: оценка сверху числа появлений ключа
+    # при фиксированной памяти (width * depth * 4 байта).
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self._rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    def _cells(self, key: Hashable):
+        value = hash(key)
+        # Двойное хэширование: depth независимых индексов из одного hash().
+        step = (hash((value, 0x9E3779B9)) | 1)
+        return [(value + i * step) % self.width for i in range(self.depth)]
+
+    def add(self, key: Hashable, count: int = 1) -> int:
+        # Консервативное обновление: растут только минимальные счётчики,
+        # это заметно уменьшает переоценку.
+        cells = self._cells(key)
+        estimate = min(row[cell] for row, cell in zip(self._rows, cells)) + count
+        for row, cell in zip(self._rows, cells):
+            if row[cell] < estimate:
+                row[cell] = min(estimate, 0xFFFFFFFF)
+        return estimate
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(key)))
+
+
+class Endpoint:
+    # Статистика одной точки (exe, IP, порт) из списка частых: интервалы
+    # между новыми соединениями по Уэлфорду (среднее и дисперсия за O(1)).
+    __slots__ = ("count", "last", "intervals", "mean", "m2", "alerted")
+
+    def __init__(self, count: int, now: float):
+        self.count = count
+        self.last = now
+        self.intervals = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.alerted = False
+
+    def observe(self, now: float, reset_after: float) -> None:
+        interval = now - self.last
+        self.last = now
+        if interval > reset_after:
+            # Длинный перерыв обрывает серию: периодичность считается заново.
+            self.intervals, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.intervals += 1
+        delta = interval - self.mean
+        self.mean += delta / self.intervals
+        self.m2 += delta * (interval - self.mean)
+
+    def jitter(self) -> float:
+        # Коэффициент вариации интервалов: 0 - идеально ровный маяк.
+        if self.intervals < 2 or self.mean <= 0:
+            return math.inf
+        return math.sqrt(self.m2 / self.intervals) / self.mean
+
+
+class HeavyHitters:
+    # Top-K по оценке count-min: в таблице только самые частые точки, при
+    # переполнении вытесняется точка с наименьшим счётом, если новая её
+    # обогнала. Минимум ищется по куче с ленивым удалением устаревших записей.
+
+    def __init__(self, capacity: int = TOP_K):
+        self.capacity = capacity
+        self.entries = {}
+        self._heap = []
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[Endpoint]:
+        return self.entries.get(key)
+
+    def _push(self, key: Hashable, count: int) -> None:
+        heapq.heappush(self._heap, (count, next(self._order), key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(entry.count, next(self._order), k) for k, entry in self.entries.items()]
+            heapq.heapify(self._heap)
+
+    def _min(self):
+        while self._heap:
+            count, _, key = self._heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry.count == count:
+                return key, entry
+            heapq.heappop(self._heap)
+        return None, None
+
+    def offer(self, key: Hashable, estimate: int, now: float, reset_after: float) -> Optional[Endpoint]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry.count = estimate
+            entry.observe(now, reset_after)
+            self._push(key, estimate)
+            return entry
+        if len(self.entries) >= self.capacity:
+            victim, lowest = self._min()
+            if lowest is None or lowest.count >= estimate:
+                return None
+            del self.entries[victim]
+            heapq.heappop(self._heap)
+        entry = Endpoint(estimate, now)
+        self.entries[key] = entry
+        self._push(key, estimate)
+        return entry
+
+
+class Fanout:
+    # Число разных адресов за окно на один exe - линейный подсчёт по битовой
+    # карте фиксированного размера (FANOUT_BITS бит) вместо множества адресов.
+    __slots__ = ("bits", "zeros", "started", "alerted")
+
+    def __init__(self, now: float, size: int):
+        self.bits = bytearray(size // 8)
+        self.zeros = size
+        self.started = now
+        self.alerted = False
+
+    def add(self, key: Hashable) -> None:
+        index = hash(key) % (len(self.bits) * 8)
+        byte, bit = divmod(index, 8)
+        if not self.bits[byte] & (1 << bit):
+            self.bits[byte] |= 1 << bit
+            self.zeros -= 1
+
+    def estimate(self) -> float:
+        size = len(self.bits) * 8
+        if self.zeros == 0:
+            return float(size * math.log(size))
+        return -size * math.log(self.zeros / size)
+
+
+class BeaconTracker:
+    # Потоковая статистика новых соединений при постоянной памяти:
+    # count-min + top-K для периодичности, битовые карты для веера.
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, top_k: int = TOP_K,
+                 fanout_bits: int = FANOUT_BITS, fanout_max_exes: int = FANOUT_MAX_EXES):
+        self.sketch = CountMinSketch(width, depth)
+        self.top = HeavyHitters(top_k)
+        self.fanout_bits = fanout_bits
+        self.fanout_max_exes = fanout_max_exes
+        self.fanout: "OrderedDict[str, Fanout]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, exe: str, remote_ip: str, remote_port: int, now: float,
+                beacon_rules=(), fanout_rules=()) -> List[Finding]:
+        with self._lock:
+            findings = []
+            if beacon_rules:
+                findings.extend(self._beacon(exe, remote_ip, remote_port, now, beacon_rules))
+            if fanout_rules:
+                findings.extend(self._fanout(exe, remote_ip, remote_port, now, fanout_rules))
+            return findings
+
+    def _beacon(self, exe, remote_ip, remote_port, now, rules) -> List[Finding]:
+        key = (exe, remote_ip, remote_port)
+        estimate = self.sketch.add(key)
+        reset_after = max(rule.max_interval for rule in rules) * 2
+        entry = self.top.offer(key, estimate, now, reset_after)
+        if entry is None or entry.alerted:
+            return []
+        for rule in rules:
+            if exe in rule.exclude or entry.intervals + 1 < rule.min_connections:
+                continue
+            jitter = entry.jitter()
+            if rule.min_interval <= entry.mean <= rule.max_interval and jitter <= rule.max_jitter:
+                entry.alerted = True
+                return [Finding("beacon", rule.rule_id, exe, remote_ip, remote_port,
+                                f"{entry.intervals + 1} соединений каждые {entry.mean:.0f}с "
+                                f"(разброс {jitter * 100:.0f}%)")]
+        return []
+
+    def _fanout(self, exe, remote_ip, remote_port, now, rules) -> List[Finding]:
+        window = max(rule.window for rule in rules)
+        state = self.fanout.get(exe)
+        if state is None or now - state.started >= window:
+            state = Fanout(now, self.fanout_bits)
+            self.fanout[exe] = state
+        self.fanout.move_to_end(exe)
+        while len(self.fanout) > self.fanout_max_exes:
+            self.fanout.popitem(last=False)
+        state.add((remote_ip, remote_port))
+        if state.alerted:
+            return []
+        destinations = state.estimate()
+        for rule in rules:
+            if exe in rule.exclude or now - state.started > rule.window:
+                continue
+            if destinations >= rule.min_destinations:
+                state.alerted = True
+                return [Finding("fanout", rule.rule_id, exe, remote_ip, remote_port,
+                                f"~{destinations:.0f} разных адресов за {rule.window:.0f}с")]
+        return []
+
+
+tracker = BeaconTracker()
+
+
+def init(config_data: dict) -> None:
+    global tracker
+    tracker = BeaconTracker(
+        width=config_data.get("beacon_sketch_width", SKETCH_WIDTH),
+        top_k=config_data.get("beacon_top_k", TOP_K),
+        fanout_max_exes=config_data.get("fanout_max_exes", FANOUT_MAX_EXES),
+    )
+
+
+def enabled() -> bool:
+    return bool(rule_engine.RULESET.beacon_rules or rule_engine.RULESET.fanout_rules)
+
+
+def observe(exe: str, remote_ip: str, remote_port: int, now: float) -> List[Finding]:
+    ruleset = rule_engine.RULESET
+    findings = tracker.observe(exe, remote_ip, remote_port, now, ruleset.beacon_rules, ruleset.fanout_rules)
+    for finding in findings:
+        FINDINGS.inc(rule=finding.rule)
+    return findings
+
+
+def collect_metrics() -> None:
+    TRACKED.set(len(tracker.top))
+
+
+metrics.on_collect(collect_metrics)
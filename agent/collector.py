@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import logging
+import signal
+import socket
+import struct
+import sys
+import zlib
+from typing import Optional, Tuple
+
+from agent import metrics
+
+# Кадр агента: длина сжатого тела, номер пачки, затем zlib(JSON-строки событий).
+# Ответ коллектора: номер пачки и число принятых событий - после записи на диск.
+FRAME = struct.Struct("!IQ")
+ACK = struct.Struct("!QI")
+MAX_FRAME = 16 * 1024 * 1024
+# Защита от zip-бомбы: больше этого в одной пачке не распаковываем.
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+DEFAULT_PORT = 9470
+
+logger = logging.getLogger("SecMon.collector")
+
+EVENTS = metrics.counter("secmon_collector_events_total", "Events received from agents")
+FRAMES = metrics.counter("secmon_collector_frames_total", "Frames received from agents")
+RECEIVED_BYTES = metrics.counter("secmon_collector_bytes_total", "Compressed bytes received from agents")
+ERRORS = metrics.counter("secmon_collector_errors_total", "Connections closed on protocol errors")
+CONNECTIONS = metrics.gauge("secmon_collector_connections", "Connected agents")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def parse_address(address: str) -> Tuple[int, object]:
+    # "unix:/run/secmon.sock" или "host:port" (порт по умолчанию 9470).
+    # ":port" - пустой хост, коллектор слушает на всех интерфейсах.
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    host, colon, port = address.rpartition(":")
+    if not colon:
+        return socket.AF_INET, (port or "127.0.0.1", DEFAULT_PORT)
+    return socket.AF_INET, (host.strip("[]"), int(port))
+
+
+def pack_frame(seq: int, payload: bytes) -> bytes:
+    return FRAME.pack(len(payload), seq) + payload
+
+
+def decode_payload(payload: bytes) -> bytes:
+    # Любая ошибка разбора пачки - ошибка протокола: соединение закрывается
+    # и попадает в счётчик ошибок, а не роняет обработчик.
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, MAX_BATCH_BYTES)
+    except (zlib.error, ValueError) as e:
+        raise ProtocolError(f"пачка повреждена: {e}") from e
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ProtocolError("пачка повреждена или больше допустимого размера")
+    if data and not data.endswith(b"\n"):
+        raise ProtocolError("пачка не заканчивается переводом строки")
+    return data
+
+
+class Collector:
+    # Сервер приёма событий от агентов на asyncio: одно ядро, тысячи
+    # соединений. Тело пачки уже состоит из JSON-строк, поэтому оно
+    # не разбирается, а после распаковки пишется в выходной файл как есть.
+    # Подтверждение уходит после записи; пока запись медленная, сокет
+    # не читается и агент копит события в своём дисковом буфере.
+
+    def __init__(self, output, max_frame: int = MAX_FRAME):
+        self.output = output
+        self.max_frame = max_frame
+        self.events = 0
+        self.frames = 0
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers = {}
+
+    def write(self, data: bytes) -> int:
+        count = data.count(b"\n")
+        if count:
+            self.output.write(data)
+            self.output.flush()
+        self.events += count
+        self.frames += 1
+        EVENTS.inc(count)
+        FRAMES.inc()
+        return count
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._handlers[asyncio.current_task()] = writer
+        self.connections += 1
+        CONNECTIONS.set(self.connections)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME.size)
+                except asyncio.IncompleteReadError:
+                    return
+                length, seq = FRAME.unpack(header)
+                if length > self.max_frame:
+                    raise ProtocolError(f"кадр {length} байт больше {self.max_frame}")
+                payload = await reader.readexactly(length)
+                RECEIVED_BYTES.inc(length)
+                count = self.write(decode_payload(payload))
+                writer.write(ACK.pack(seq, count))
+                await writer.drain()
+        except (ProtocolError, asyncio.IncompleteReadError, ConnectionError) as e:
+            ERRORS.inc()
+            logger.warning("соединение закрыто: %s", e)
+        finally:
+            self._handlers.pop(asyncio.current_task(), None)
+            self.connections -= 1
+            CONNECTIONS.set(self.connections)
+            writer.close()
+
+    async def close(self) -> None:
+        # Закрываем соединения агентов сами: необработанная пачка не
+        # подтверждена, и агент перешлёт её после переподключения.
+        if self._server is not None:
+            self._server.close()
+        handlers = list(self._handlers.items())
+        for _, writer in handlers:
+            writer.close()
+        if handlers:
+            await asyncio.gather(*(task for task, _ in handlers), return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def start(self, address: str) -> asyncio.AbstractServer:
+        family, addr = parse_address(address)
+        if family == socket.AF_UNIX:
+            self._server = await asyncio.start_unix_server(self.handle, path=addr)
+        else:
+            self._server = await asyncio.start_server(self.handle, addr[0], addr[1])
+        return self._server
+
+    async def serve(self, address: str, stop: Optional[asyncio.Event] = None) -> None:
+        await self.start(address)
+        stop = stop or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        try:
+            await stop.wait()
+        finally:
+            await self.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SecMon event collector")
+    parser.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}",
+                        help="host:port or unix:/path/to.sock")
+    parser.add_argument("--output", default="-", help="JSON-lines file for received events (- = stdout)")
+    parser.add_argument("--metrics-listen", help="host:port for the Prometheus endpoint")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(name)s: %(message)s")
+
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "ab")
+    metrics_server = None
+    if args.metrics_listen:
+        host, _, port = args.metrics_listen.rpartition(":")
+        metrics_server = metrics.start_http_server(int(port), host or "127.0.0.1")
+    try:
+        asyncio.run(Collector(output).serve(args.listen))
+    finally:
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if output is not sys.stdout.buffer:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import heapq
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class ConnectionTable:
+    # Записи раскладываются по корзинам "колеса" по времени истечения.
+    # expire() разбирает только наступившие корзины. TTL считается от first_seen,
+    # как и раньше: долгоживущее соединение снова попадает в алерты раз в ttl.
+
+    def __init__(self, ttl: float, bucket_width: Optional[float] = None):
+        self.ttl = ttl
+        self.bucket_width = bucket_width or max(ttl / 60.0, 1.0)
+        self._entries: Dict[Hashable, List[float]] = {}
+        self._wheel: Dict[int, List[Hashable]] = {}
+        self._slots: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        entry = self._entries.get(key)
+        return (entry[0], entry[1]) if entry is not None else None
+
+    def touch(self, key: Hashable, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[1] = now
+            return False
+        self._entries[key] = [now, now]
+        self._schedule(key, now + self.ttl)
+        return True
+
+    def discard(self, key: Hashable) -> None:
+        # Ключ остаётся в корзине и будет пропущен при её разборе.
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._wheel.clear()
+        self._slots.clear()
+
+    def _schedule(self, key: Hashable, deadline: float) -> None:
+        slot = int(deadline // self.bucket_width)
+        bucket = self._wheel.get(slot)
+        if bucket is None:
+            self._wheel[slot] = bucket = []
+            heapq.heappush(self._slots, slot)
+        bucket.append(key)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        now_slot = int(now // self.bucket_width)
+        removed = 0
+        deferred = []
+        while self._slots and self._slots[0] <= now_slot:
+            slot = heapq.heappop(self._slots)
+            for key in self._wheel.pop(slot, ()):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                deadline = entry[0] + self.ttl
+                if int(deadline // self.bucket_width) != slot:
+                    # Ключ удалён и добавлен заново: запись ждёт в своей корзине.
+                    continue
+                if deadline <= now:
+                    del self._entries[key]
+                    removed += 1
+                else:
+                    deferred.append((key, deadline))
+        for key, deadline in deferred:
+            self._schedule(key, deadline)
+        return removed
@@ -0,0 +1,141 @@
+import threading
+from collections import deque
+from typing import Callable, List, Optional
+
+from agent.ratelimit import TokenBucket
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class RetryAfter(Exception):
+    def __init__(self, delay: float, message: str = ""):
+        super().__init__(message or f"retry after {delay}s")
+        self.delay = delay
+
+
+class Dispatcher:
+    # Ограниченная очередь с фоновым потоком доставки. Поток мониторинга
+    # только кладёт элемент в очередь; отправка, пачки, лимит частоты и
+    # повторы с backoff происходят в потоке диспетчера.
+
+    def __init__(self, send: Callable[[list], None], name: str = "dispatcher",
+                 maxsize: int = 1000, overflow: str = DROP_OLDEST,
+                 batch_size: int = 50, batch_interval: float = 1.0,
+                 split: Optional[Callable[[list], List[list]]] = None,
+                 rate: float = 0.0, burst: Optional[float] = None,
+                 max_retries: int = 5, backoff: float = 1.0, backoff_max: float = 60.0,
+                 on_error: Optional[Callable[[str], None]] = None):
+        self.send = send
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.split = split or (lambda items: [items])
+        self.bucket = TokenBucket(rate, burst if burst is not None else max(rate, 1.0))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.on_error = on_error
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.max_depth = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def put(self, item) -> bool:
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                self.dropped += 1
+                if self.overflow == DROP_NEWEST:
+                    return False
+                self._queue.popleft()
+            self._queue.append(item)
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = len(self._queue)
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        # Остаток очереди пытаемся доставить до истечения timeout.
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _take(self) -> list:
+        with self._cond:
+            if len(self._queue) < self.batch_size and not self._stop.is_set():
+                self._cond.wait(self.batch_interval)
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take()
+            if not batch:
+                if self._stop.is_set():
+                    return
+                continue
+            for chunk in self.split(batch):
+                self._deliver(chunk)
+
+    def _deliver(self, chunk: list) -> None:
+        for attempt in range(self.max_retries + 1):
+            delay = self.bucket.consume(1)
+            if delay > 0:
+                self._stop.wait(delay)
+            try:
+                self.send(chunk)
+                self.sent += len(chunk)
+                return
+            except RetryAfter as e:
+                wait = e.delay
+                error = e
+            except Exception as e:
+                wait = min(self.backoff * (2 ** attempt), self.backoff_max)
+                error = e
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            # При остановке повторы идут без пауз, их число ограничено max_retries.
+            self._stop.wait(wait)
+        self.failed += len(chunk)
+        if self.on_error is not None:
+            self.on_error(f"{self.name}: не удалось доставить {len(chunk)} сообщений: {error}")
@@ -0,0 +1,279 @@
+import argparse
+import bisect
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from agent import metrics
+
+# Заголовок: сигнатура, версия, число диапазонов IPv4 и IPv6. Дальше
+# диапазоны (отсортированы по началу, не пересекаются), в конце - JSON-список
+# строк (названия AS и наборы меток), на которые ссылаются диапазоны.
+MAGIC = b"SMEN"
+VERSION = 1
+HEADER = struct.Struct("!4sHxxII")
+RECORD_V4 = struct.Struct("!4s4sI2sII")
+RECORD_V6 = struct.Struct("!16s16sI2sII")
+CACHE_SIZE = 4096
+
+ENRICHMENT_DB: Optional[str] = None
+
+Enrichment = namedtuple("Enrichment", ["asn", "country", "org", "tags"])
+
+LOOKUPS = metrics.counter("secmon_enrichment_lookups_total", "Remote address enrichment lookups", ["result"])
+RANGES = metrics.gauge("secmon_enrichment_ranges", "Ranges in the enrichment database")
+
+
+class _Ranges:
+    # Последовательность начал диапазонов для bisect прямо по mmap: адреса
+    # хранятся в сетевом порядке байт, поэтому сравнение bytes совпадает
+    # с числовым.
+
+    def __init__(self, mm, offset: int, count: int, record: struct.Struct, addr_size: int):
+        self._mm = mm
+        self._offset = offset
+        self._count = count
+        self._record = record
+        self._width = record.size
+        self._addr = addr_size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        offset = self._offset + index * self._width
+        return self._mm[offset:offset + self._addr]
+
+    def record(self, index: int) -> tuple:
+        return self._record.unpack_from(self._mm, self._offset + index * self._width)
+
+
+class EnrichmentDB:
+    # Таблица диапазонов адресов, отображённая в память: в кучу попадают
+    # только строки, поиск - bisect по страницам файла.
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, v4, v6 = HEADER.unpack_from(self._mm)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"неизвестный формат {magic!r} v{version}")
+            strings_at = HEADER.size + v4 * RECORD_V4.size + v6 * RECORD_V6.size
+            if strings_at > len(self._mm):
+                raise ValueError("файл обрезан")
+            self._strings = json.loads(self._mm[strings_at:])
+        except struct.error as e:
+            self.close()
+            raise ValueError(f"файл обрезан: {e}") from e
+        except ValueError:
+            self.close()
+            raise
+        self._v4 = _Ranges(self._mm, HEADER.size, v4, RECORD_V4, 4)
+        self._v6 = _Ranges(self._mm, HEADER.size + v4 * RECORD_V4.size, v6, RECORD_V6, 16)
+
+    def __len__(self) -> int:
+        return len(self._v4) + len(self._v6)
+
+    def lookup(self, ip: str) -> Optional[Enrichment]:
+        try:
+            addr = ipaddress.ip_address(ip.split("%", 1)[0])
+        except ValueError:
+            return None
+        if addr.version == 6 and addr.ipv4_mapped is not None:
+            addr = addr.ipv4_mapped
+        ranges = self._v4 if addr.version == 4 else self._v6
+        packed = addr.packed
+        index = bisect.bisect_right(ranges, packed) - 1
+        if index < 0:
+            return None
+        _, end, asn, country, org, tags = ranges.record(index)
+        if packed > end:
+            return None
+        return Enrichment(asn, country.decode("ascii").strip("\0"), self._strings[org],
+                          tuple(self._strings[tags].split(",")) if tags else ())
+
+    def close(self) -> None:
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            mm.close()
+        self._file.close()
+
+
+def _parse_range(network: str) -> tuple:
+    # CIDR или "начало-конец" -> (версия, первый адрес, последний адрес).
+    if "-" in network:
+        first, last = (ipaddress.ip_address(part.strip()) for part in network.split("-", 1))
+        if first.version != last.version or first > last:
+            raise ValueError(f"некорректный диапазон {network}")
+        return first.version, int(first), int(last)
+    net = ipaddress.ip_network(network.strip(), strict=False)
+    return net.version, int(net.network_address), int(net.broadcast_address)
+
+
+def _merge(ranges: list) -> list:
+    # Источники пересекаются (таблица AS и списки меток): разбиваем адреса на
+    # отрезки между границами диапазонов. AS и страна берутся из самого узкого
+    # покрывающего диапазона, где они заданы, метки объединяются.
+    starts, stops = defaultdict(list), defaultdict(list)
+    for index, (first, last, *_) in enumerate(ranges):
+        starts[first].append(index)
+        stops[last + 1].append(index)
+    points = sorted(set(starts) | set(stops))
+    active = set()
+    merged = []
+    for point, next_point in zip(points, points[1:]):
+        active.difference_update(stops.get(point, ()))
+        active.update(starts.get(point, ()))
+        if not active:
+            continue
+        covering = sorted((ranges[i] for i in active), key=lambda r: r[1] - r[0])
+        asn, org = next(((r[2], r[4]) for r in covering if r[2]), (0, ""))
+        country = next((r[3] for r in covering if r[3]), "")
+        tags = frozenset().union(*(r[5] for r in covering))
+        if merged and merged[-1][1] + 1 == point and merged[-1][2:] == (asn, country, org, tags):
+            merged[-1] = (merged[-1][0], next_point - 1) + merged[-1][2:]
+        else:
+            merged.append((point, next_point - 1, asn, country, org, tags))
+    return merged
+
+
+def build_db(rows: Iterable[List[str]], path) -> int:
+    # Строки CSV: сеть (CIDR или "начало-конец"), ASN, страна, название AS,
+    # метки через ";". Пустые поля допустимы: список меток без AS - тоже источник.
+    ranges = {4: [], 6: []}
+    for row in rows:
+        if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+            continue
+        row = [field.strip() for field in row] + [""] * (5 - len(row))
+        version, first, last = _parse_range(row[0])
+        asn = row[1].upper()
+        asn = int(asn[2:] if asn.startswith("AS") else asn or 0)
+        country = row[2].upper()
+        if len(country.encode("ascii")) > 2:
+            raise ValueError(f"код страны не ISO 3166: {row[2]}")
+        tags = frozenset(tag.strip().lower() for tag in row[4].split(";") if tag.strip())
+        ranges[version].append((first, last, asn, country, row[3], tags))
+
+    strings = [""]
+    index = {"": 0}
+
+    def intern(value: str) -> int:
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    merged = {version: _merge(items) for version, items in ranges.items()}
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(merged[4]), len(merged[6])))
+        for version, record, size in ((4, RECORD_V4, 4), (6, RECORD_V6, 16)):
+            for first, last, asn, country, org, tags in merged[version]:
+                f.write(record.pack(first.to_bytes(size, "big"), last.to_bytes(size, "big"), asn,
+                                    country.encode("ascii"), intern(org), intern(",".join(sorted(tags)))))
+        f.write(json.dumps(strings, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    os.replace(tmp, path)
+    return len(merged[4]) + len(merged[6])
+
+
+class EnrichmentCache:
+    # LRU перед базой: соединения идут к одним и тем же адресам, и горячие
+    # адреса не разбираются и не ищутся повторно. Промахи тоже кэшируются.
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Optional[Enrichment]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, db: EnrichmentDB, ip: str) -> Optional[Enrichment]:
+        with self._lock:
+            if ip in self._entries:
+                self._entries.move_to_end(ip)
+                LOOKUPS.inc(result="cached")
+                return self._entries[ip]
+        info = db.lookup(ip)
+        LOOKUPS.inc(result="found" if info is not None else "unknown")
+        with self._lock:
+            self._entries[ip] = info
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return info
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+cache = EnrichmentCache()
+database: Optional[EnrichmentDB] = None
+
+
+def init(config_data: dict) -> None:
+    global database, ENRICHMENT_DB
+    cache.maxsize = config_data.get("enrichment_cache_size", CACHE_SIZE)
+    cache.clear()
+    if database is not None:
+        database.close()
+        database = None
+    ENRICHMENT_DB = config_data.get("enrichment_db") or None
+    if ENRICHMENT_DB and os.path.exists(ENRICHMENT_DB):
+        database = EnrichmentDB(ENRICHMENT_DB)
+        RANGES.set(len(database))
+
+
+def enabled() -> bool:
+    return database is not None
+
+
+def lookup(ip: str) -> Optional[Enrichment]:
+    if database is None or not ip:
+        return None
+    return cache.get(database, ip)
+
+
+def describe(info: Enrichment) -> str:
+    # "AS13335 Cloudflare, US [cdn]" для текста алерта.
+    parts = [" ".join(filter(None, (f"AS{info.asn}" if info.asn else "", info.org))), info.country]
+    text = ", ".join(filter(None, parts)) or "n/a"
+    return f"{text} [{', '.join(info.tags)}]" if info.tags else text
+
+
+def to_dict(info: Enrichment) -> dict:
+    return {key: value for key, value in info._asdict().items() if value not in (0, "", ())}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the offline IP enrichment database")
+    parser.add_argument("sources", nargs="+",
+                        help="CSV files: network,asn,country,org,tags (tags separated by ';'), - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="database file to write")
+    args = parser.parse_args(argv)
+
+    def rows():
+        for source in args.sources:
+            if source == "-":
+                yield from csv.reader(sys.stdin)
+                continue
+            with open(source, newline="", encoding="utf-8") as f:
+                yield from csv.reader(f)
+
+    count = build_db(rows(), args.output)
+    print(f"{count} ranges written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
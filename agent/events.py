@@ -0,0 +1,38 @@
+import socket
+import time
+from collections import namedtuple
+from typing import Optional
+
+Event = namedtuple("Event", [
+    "timestamp", "host", "monitor", "level", "rule", "rule_ids",
+    "message", "pid", "exe", "addresses", "extra",
+])
+
+HOST = socket.gethostname()
+
+def make_event(message: str, level: str = "INFO", monitor: Optional[str] = None,
+               rule: Optional[str] = None, rule_ids=(), pid: Optional[int] = None,
+               exe: Optional[str] = None, addresses=None, timestamp: Optional[float] = None,
+               **extra) -> Event:
+    # Текст алерта рассчитан на Telegram; в событии храним его без Markdown.
+    return Event(
+        timestamp=time.time() if timestamp is None else timestamp,
+        host=HOST,
+        monitor=monitor,
+        level=level.upper(),
+        rule=rule,
+        rule_ids=tuple(rule_ids),
+        message=message.replace("`", "").strip(),
+        pid=pid,
+        exe=exe,
+        addresses=dict(addresses or {}),
+        extra=extra,
+    )
+
+def to_dict(event: Event) -> dict:
+    data = event._asdict()
+    data["rule_ids"] = list(event.rule_ids)
+    extra = data.pop("extra")
+    for key, value in extra.items():
+        data.setdefault(key, value)
+    return {key: value for key, value in data.items() if value not in (None, {}, [])}
@@ -0,0 +1,179 @@
+import argparse
+import bisect
+import hashlib
+import mmap
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from agent import metrics
+
+DIGEST_SIZE = 32
+CACHE_SIZE = 4096
+# Больше этого не хэшируем: огромные бинарники (IDE, браузеры) не стоят секунд CPU.
+MAX_BYTES = 256 * 1024 * 1024
+READ_BUFFER = 1024 * 1024
+
+BAD_HASHES_FILE: Optional[str] = None
+
+HASHED = metrics.counter("secmon_exe_hash_total", "Executable hash lookups", ["result"])
+TABLE_SIZE = metrics.gauge("secmon_bad_hashes", "Entries in the known-bad hash table")
+
+
+class HashTable:
+    # Отсортированный массив 32-байтных SHA-256 без заголовка, отображённый
+    # в память: миллионы записей не копируются в кучу, поиск - bisect по
+    # страницам, которые ядро подгружает по мере обращения.
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size % DIGEST_SIZE:
+            self._file.close()
+            raise ValueError(f"размер {size} не кратен {DIGEST_SIZE} байтам")
+        self._count = size // DIGEST_SIZE
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        offset = index * DIGEST_SIZE
+        return self._mm[offset:offset + DIGEST_SIZE]
+
+    def __contains__(self, digest: bytes) -> bool:
+        index = bisect.bisect_left(self, digest)
+        return index < self._count and self[index] == digest
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
+def build_table(digests: Iterable[str], path) -> int:
+    # Hex-строки (допускается формат sha256sum: "<hash>  <file>") -> таблица.
+    entries = set()
+    for line in digests:
+        token = line.strip().split(" ", 1)[0]
+        if not token or token.startswith("#"):
+            continue
+        digest = bytes.fromhex(token)
+        if len(digest) != DIGEST_SIZE:
+            raise ValueError(f"не SHA-256: {token}")
+        entries.add(digest)
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, "wb") as f:
+        for digest in sorted(entries):
+            f.write(digest)
+    os.replace(tmp, path)
+    return len(entries)
+
+
+class ExeHashCache:
+    # Ключ - идентичность файла (st_dev, st_ino, st_mtime_ns, st_size):
+    # тысячи запусков одного bash стоят одного хэширования, а подменённый
+    # на месте бинарник получает новый ключ.
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[tuple, Optional[bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def digest(self, path: str) -> Tuple[Optional[bytes], bool]:
+        # (sha256, был ли в кэше); None - файл недоступен или слишком большой.
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                        return self._entries[key], True
+                digest = None
+                if st.st_size <= MAX_BYTES:
+                    sha256 = hashlib.sha256()
+                    while chunk := f.read(READ_BUFFER):
+                        sha256.update(chunk)
+                    digest = sha256.digest()
+        except OSError:
+            return None, False
+        with self._lock:
+            self._entries[key] = digest
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return digest, False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ExeHashCache()
+table: Optional[HashTable] = None
+
+
+def init(config_data: dict) -> None:
+    global table, BAD_HASHES_FILE, MAX_BYTES
+    cache.maxsize = config_data.get("exe_hash_cache_size", CACHE_SIZE)
+    MAX_BYTES = config_data.get("exe_hash_max_bytes", MAX_BYTES)
+    cache.clear()
+    if table is not None:
+        table.close()
+        table = None
+    BAD_HASHES_FILE = config_data.get("bad_hashes_file") or None
+    if BAD_HASHES_FILE and os.path.exists(BAD_HASHES_FILE):
+        table = HashTable(BAD_HASHES_FILE)
+        TABLE_SIZE.set(len(table))
+
+
+def enabled() -> bool:
+    return table is not None
+
+
+def exe_digest(pid: int, exe: str) -> Optional[bytes]:
+    # /proc/<pid>/exe указывает на реально запущенный файл, даже если путь
+    # уже удалён или подменён; для завершившегося процесса читаем по пути.
+    digest, cached = cache.digest(f"/proc/{pid}/exe")
+    if digest is None and not cached and exe:
+        digest, cached = cache.digest(exe)
+    if digest is None:
+        HASHED.inc(result="error")
+    else:
+        HASHED.inc(result="hit" if cached else "miss")
+    return digest
+
+
+def lookup(pid: int, exe: str) -> Optional[str]:
+    # Hex SHA-256 исполняемого файла, если он есть в таблице известных вредоносных.
+    if table is None:
+        return None
+    digest = exe_digest(pid, exe)
+    if digest is not None and digest in table:
+        return digest.hex()
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the known-bad SHA-256 table")
+    parser.add_argument("source", help="text file with one hex SHA-256 per line (sha256sum output works), - for stdin")
+    parser.add_argument("output", help="binary table to write")
+    args = parser.parse_args(argv)
+    if args.source == "-":
+        count = build_table(sys.stdin, args.output)
+    else:
+        with open(args.source) as f:
+            count = build_table(f, args.output)
+    print(f"{count} hashes written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,62 +1,351 @@
+import glob
 import hashlib
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from agent import alerter, rule_engine
+from agent import alerter, governor, inotify, metrics, recorder, rule_engine
+from agent.hash_store import HashStore, write_json_atomic
+from agent.ratelimit import TokenBucket
 
 HASH_DB_FILE = Path("config/file_hashes.json")
+HASH_STORE_FILE = Path("config/file_hashes.db")
+store = None
+WATCH_ENTRIES = []
 WATCHED_FILES = []
+HASH_WORKERS = 4
+HASH_BYTES_PER_SEC = 0
+READ_BUFFER = 1024 * 1024
+hash_bucket = None
+hash_pool = None
+_buffers = threading.local()
+VERIFY_BYTES_PER_SEC = 0
+verify_bucket = None
+verify_cursor = 0
+SCAN_INTERVAL = 60
+WATCH_MODE = "auto"
+WATCH_DEBOUNCE = 0.2
+watcher = None
+# Поколение правил, из которого взяты WATCH_ENTRIES и пути inotify.
+watch_generation = None
+watcher_generation = None
+watcher_overflows = 0
+scan_lock = threading.Lock()
+# Файлы, хэширование которых отложено из-за нагрузки на диск.
+deferred = set()
+FILES_DEFERRED = metrics.counter("secmon_files_deferred_total", "File checks deferred under I/O pressure")
+FILES_HASHED = metrics.counter("secmon_files_hashed_total", "Files read and hashed", ["reason"])
+WATCH_OVERFLOWS = metrics.counter("secmon_file_watch_overflows_total", "inotify queue overflows (events lost)")
 
 def init(config_data: dict) -> None:
-    global WATCHED_FILES
-    WATCHED_FILES = rule_engine.get_watched_files()
+    global WATCH_ENTRIES, WATCHED_FILES, VERIFY_BYTES_PER_SEC, verify_bucket, WATCH_MODE, WATCH_DEBOUNCE
+    global HASH_WORKERS, HASH_BYTES_PER_SEC, hash_bucket, hash_pool, SCAN_INTERVAL
+    SCAN_INTERVAL = config_data.get("monitoring_interval", SCAN_INTERVAL)
+    update_watch_entries()
+    WATCHED_FILES = expand_watch_entries(WATCH_ENTRIES)
+    HASH_WORKERS = max(1, config_data.get("file_hash_workers", 4))
+    HASH_BYTES_PER_SEC = config_data.get("file_hash_bytes_per_sec", 0)
+    hash_bucket = TokenBucket(HASH_BYTES_PER_SEC) if HASH_BYTES_PER_SEC > 0 else None
+    if hash_pool is not None:
+        hash_pool.shutdown(wait=False)
+    hash_pool = None
+    WATCH_MODE = config_data.get("file_watch_mode", "auto")
+    WATCH_DEBOUNCE = config_data.get("file_watch_debounce", 0.2)
+    VERIFY_BYTES_PER_SEC = config_data.get("file_verify_bytes_per_sec", 0)
+    # Сверка идёт раз в проход, поэтому бакет вмещает токены за весь интервал:
+    # иначе реальная скорость была бы в SCAN_INTERVAL раз ниже заданной.
+    verify_bucket = (TokenBucket(VERIFY_BYTES_PER_SEC, VERIFY_BYTES_PER_SEC * SCAN_INTERVAL)
+                     if VERIFY_BYTES_PER_SEC > 0 else None)
+
+def set_interval(interval: float) -> None:
+    global SCAN_INTERVAL
+    SCAN_INTERVAL = interval
+    if verify_bucket is not None:
+        verify_bucket.capacity = VERIFY_BYTES_PER_SEC * interval
+
+def update_watch_entries() -> bool:
+    # После горячей перезагрузки правил берём новый watched_files,
+    # как update_classifier в сетевом мониторе.
+    global WATCH_ENTRIES, watch_generation
+    if watch_generation == rule_engine.GENERATION:
+        return False
+    WATCH_ENTRIES = rule_engine.get_watched_files()
+    watch_generation = rule_engine.GENERATION
+    return True
+
+def _walk(root: str):
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+def expand_watch_entries(entries) -> list:
+    # Элемент watched_files может быть файлом, каталогом (обходится целиком)
+    # или glob-шаблоном ("/etc/**/*.conf").
+    files = {}
+    for entry in entries:
+        if glob.has_magic(entry):
+            for path in glob.iglob(entry, recursive=True):
+                if os.path.isdir(path):
+                    files.update(dict.fromkeys(_walk(path)))
+                elif os.path.isfile(path):
+                    files[path] = None
+        elif os.path.isdir(entry) and not os.path.islink(entry):
+            files.update(dict.fromkeys(_walk(entry)))
+        else:
+            files[entry] = None
+    return list(files)
+
+def _update(sha256, data) -> None:
+    if hash_bucket is not None:
+        hash_bucket.throttle(len(data))
+    sha256.update(data)
+
+def _read_buffer() -> memoryview:
+    # Один буфер на поток хэширования: большие файлы читаются без аллокаций.
+    view = getattr(_buffers, "view", None)
+    if view is None or len(view) != READ_BUFFER:
+        view = _buffers.view = memoryview(bytearray(READ_BUFFER))
+    return view
 
 def calculate_hash(file_path: str) -> str | None:
     try:
-        with open(file_path, "rb") as f:
+        with open(file_path, "rb", buffering=0) as f:
             sha256 = hashlib.sha256()
-            while chunk := f.read(8192):
-                sha256.update(chunk)
+            view = _read_buffer()
+            # readinto, а не mmap: файл, усечённый во время чтения (логи,
+            # веб-каталоги), даёт короткое чтение, а не SIGBUS для всего агента.
+            while size := f.readinto(view):
+                _update(sha256, view[:size])
             return sha256.hexdigest()
     except (PermissionError, FileNotFoundError) as e:
         alerter.alert(f"Ошибка доступа к файлу {file_path}: {e}", level="ERROR")
         return None
+    except (OSError, ValueError) as e:
+        alerter.alert(f"Ошибка чтения файла {file_path}: {e}", level="ERROR")
+        return None
+
+def hash_files(paths: list) -> list:
+    # hashlib отпускает GIL на больших блоках, поэтому потоки дают реальный
+    # параллелизм. Задачи подаются окнами, чтобы не держать в памяти
+    # десятки тысяч futures.
+    global hash_pool
+    if HASH_WORKERS <= 1 or len(paths) <= 1:
+        return [calculate_hash(path) for path in paths]
+    if hash_pool is None:
+        hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="file-hash")
+    window = HASH_WORKERS * 8
+    result = []
+    for start in range(0, len(paths), window):
+        result.extend(hash_pool.map(calculate_hash, paths[start:start + window]))
+    return result
+
+def stat_key(st: os.stat_result) -> list:
+    return [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns]
 
 def load_hash_db() -> dict:
     try:
         with open(HASH_DB_FILE, "r") as f:
             return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        alerter.alert(f"Повреждён файл базы хэшей {HASH_DB_FILE}: {e}", level="ERROR")
         return {}
 
 def save_hash_db(db: dict) -> None:
-    HASH_DB_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(HASH_DB_FILE, "w") as f:
-        json.dump(db, f, indent=2)
+    write_json_atomic(HASH_DB_FILE, db)
 
-def monitor_files() -> None:
-    print(f"Checking files: {WATCHED_FILES}")
-    db = load_hash_db()
-    for file_path in WATCHED_FILES:
-        print(f"Checking file: {file_path}")
-        if not os.path.exists(file_path):
+def get_store() -> HashStore:
+    # При первом запуске база переносится из старого file_hashes.json.
+    global store
+    if store is None:
+        store = HashStore(HASH_STORE_FILE)
+        if not len(store) and HASH_DB_FILE.exists():
+            imported = store.import_json(load_hash_db())
+            store.commit()
+            alerter.alert(f"Базовые хэши перенесены из {HASH_DB_FILE} в {HASH_STORE_FILE}: {imported} файлов")
+    return store
+
+def export_hash_db() -> None:
+    save_hash_db(get_store().export_json())
+
+def _old_record(db: dict, file_path: str):
+    record = db.get(file_path)
+    # Старый формат базы: значение - просто хэш, рядом ключ "<path>_mtime".
+    if isinstance(record, dict):
+        return record.get("hash"), record.get("stat")
+    return record, None
+
+def _pending_stat(file_path: str, db: dict, verify: bool):
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    current_stat = stat_key(st)
+    if _old_record(db, file_path)[1] == current_stat and not verify:
+        return None
+    return current_stat
+
+FILE_ALERTS = {
+    "content_changed": " Изменён файл без изменения метаданных: `{}`",
+    "modified": " Изменён файл: `{}`",
+    "replaced": " Файл заменён (новый inode): `{}`",
+}
+
+def file_change(old_hash, old_stat, current_hash, current_stat):
+    if old_hash and old_hash != current_hash:
+        return "content_changed" if old_stat == current_stat else "modified"
+    if old_hash and old_stat and old_stat[:2] != current_stat[:2]:
+        return "replaced"
+    return None
+
+def _apply_hash(file_path: str, db: dict, current_stat: list, current_hash: str | None) -> bool:
+    if current_hash is None:
+        return False
+    old_hash, old_stat = _old_record(db, file_path)
+    change = file_change(old_hash, old_stat, current_hash, current_stat)
+    if change is not None:
+        recorder.record_file(file_path, change)
+        alerter.alert(FILE_ALERTS[change].format(file_path), level="WARNING",
+                      monitor="file", rule=change, path=file_path)
+    db.pop(f"{file_path}_mtime", None)
+    db[file_path] = {"hash": current_hash, "stat": current_stat}
+    return True
+
+def check_file(file_path: str, db: dict, verify: bool = False) -> bool:
+    current_stat = _pending_stat(file_path, db, verify)
+    if current_stat is None:
+        return False
+    return _apply_hash(file_path, db, current_stat, calculate_hash(file_path))
+
+def verify_sweep(db: dict, skip: set) -> None:
+    # Медленная полная сверка хэшей с ограничением байт/с: ловит правки,
+    # после которых злоумышленник вернул прежние mtime/размер.
+    global verify_cursor
+    if verify_bucket is None or not WATCHED_FILES:
+        return
+    for _ in range(len(WATCHED_FILES)):
+        if verify_bucket.available() <= 0:
+            break
+        verify_cursor %= len(WATCHED_FILES)
+        file_path = WATCHED_FILES[verify_cursor]
+        verify_cursor += 1
+        if file_path in skip:
             continue
-        current_hash = calculate_hash(file_path)
-        if current_hash is None:
+        try:
+            size = os.stat(file_path).st_size
+        except OSError:
             continue
-        current_mtime = os.path.getmtime(file_path)
-        old_hash = db.get(file_path)
-        old_mtime = db.get(f"{file_path}_mtime")
-        print(f"{file_path} old_hash: {old_hash}")
-        print(f"{file_path} new_hash: {current_hash}")
-        if old_hash and (old_hash != current_hash or old_mtime != current_mtime):
-            alerter.alert(f" Изменён файл: `{file_path}`", level="WARNING")
-        db[file_path] = current_hash
-        db[f"{file_path}_mtime"] = current_mtime
-    save_hash_db(db)
-
-def run() -> None:
-    import time
-    while True:
+        verify_bucket.consume(size)
+        FILES_HASHED.inc(reason="verify")
+        check_file(file_path, db, verify=True)
+
+def check_paths(paths, verify: bool = True) -> None:
+    # Полный проход по таймеру и события inotify идут из разных потоков.
+    with scan_lock:
+        _check_paths(paths, verify)
+
+def _check_paths(paths, verify: bool) -> None:
+    if governor.defer_io():
+        # Изменения не теряются: отложенные пути войдут в следующий проход.
+        deferred.update(paths)
+        FILES_DEFERRED.inc(len(paths))
+        return
+    if deferred:
+        paths = sorted(deferred.union(paths))
+        deferred.clear()
+    db = get_store()
+    pending = []
+    for file_path in paths:
+        current_stat = _pending_stat(file_path, db, verify=False)
+        if current_stat is not None:
+            pending.append((file_path, current_stat))
+    hashes = hash_files([file_path for file_path, _ in pending])
+    FILES_HASHED.inc(len(pending), reason="changed")
+    rehashed = set()
+    for (file_path, current_stat), current_hash in zip(pending, hashes):
+        if _apply_hash(file_path, db, current_stat, current_hash):
+            rehashed.add(file_path)
+    if verify:
+        verify_sweep(db, rehashed)
+    db.commit()
+
+def monitor_files() -> None:
+    global WATCHED_FILES
+    if update_watch_entries() or WATCH_ENTRIES:
+        WATCHED_FILES = expand_watch_entries(WATCH_ENTRIES)
+    metrics.SCAN_ITEMS.set(len(WATCHED_FILES), monitor="file")
+    with metrics.SCAN_SECONDS.time(monitor="file"):
+        check_paths(WATCHED_FILES)
+
+def create_watcher():
+    if WATCH_MODE == "poll":
+        return None
+    try:
+        return inotify.FileWatcher(WATCHED_FILES, debounce=WATCH_DEBOUNCE)
+    except (OSError, AttributeError) as e:
+        if WATCH_MODE == "inotify":
+            alerter.alert(f" inotify недоступен ({e}), файлы проверяются по таймеру.", level="WARNING")
+        return None
+
+def start_watcher() -> bool:
+    global watcher, watcher_generation, watcher_overflows
+    stop_watcher()
+    watcher = create_watcher()
+    watcher_generation = watch_generation
+    watcher_overflows = 0
+    return watcher is not None
+
+def stop_watcher() -> None:
+    global watcher
+    if watcher is not None:
+        watcher.close()
+        watcher = None
+
+def watch_changes(timeout: float) -> None:
+    # Между полными проходами реагируем на события inotify сразу.
+    global WATCHED_FILES, watcher_overflows
+    if watcher is None:
+        # Без inotify цикл не должен крутиться вхолостую: файлы проверяет
+        # проход по таймеру, здесь только ждём.
+        time.sleep(timeout)
+        return
+    update_watch_entries()
+    if watcher_generation != watch_generation:
+        # Набор путей inotify задаётся при создании: пересоздаём в этом же
+        # потоке, чтобы не закрыть дескриптор посреди wait().
+        WATCHED_FILES = expand_watch_entries(WATCH_ENTRIES)
+        if not start_watcher():
+            if WATCH_MODE != "inotify":
+                # В режиме inotify create_watcher уже сообщил об ошибке.
+                alerter.alert(" inotify отключён после перезагрузки правил, файлы проверяются по таймеру.",
+                              level="WARNING")
+            time.sleep(timeout)
+            return
+        # Новые файлы получают базовый хэш сразу, а не в следующем полном проходе.
+        check_paths(WATCHED_FILES, verify=False)
+    changed = watcher.wait(timeout)
+    if watcher.overflows > watcher_overflows:
+        # Очередь inotify переполнилась: какие-то изменения потеряны, в том
+        # числе новые файлы в деревьях. Нужен полный проход, а не только пути.
+        WATCH_OVERFLOWS.inc(watcher.overflows - watcher_overflows)
+        watcher_overflows = watcher.overflows
+        alerter.alert(" Переполнена очередь inotify, события потеряны: полная проверка файлов.", level="WARNING")
         monitor_files()
-        time.sleep(60)  
+        return
+    if changed:
+        with metrics.SCAN_SECONDS.time(monitor="file_watch"):
+            check_paths(sorted(changed), verify=False)
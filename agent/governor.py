@@ -0,0 +1,201 @@
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from agent import metrics
+
+CPU_BUDGET = 0.02  # доля одного ядра
+PERIOD = 10
+# Растягиваем интервал не больше чем вдвое за период и сжимаем на четверть:
+# быстрая реакция на перерасход, плавный возврат.
+MAX_STEP = 2.0
+SHRINK_STEP = 1.25
+# Ниже этой доли бюджета интервалы возвращаются к минимальным.
+HEADROOM = 0.5
+# Задачи дешевле этой доли CPU всех задач не растягиваются: экономии нет.
+NEGLIGIBLE = 0.01
+MAX_STRETCH = 10
+IO_PRESSURE_THRESHOLD = 20.0
+CPU_PRESSURE_THRESHOLD = 50.0
+IO_DEFER_MAX = 600
+
+USAGE = metrics.gauge("secmon_governor_cpu_ratio", "Agent CPU time per second of wall time (cores)")
+BUDGET = metrics.gauge("secmon_governor_budget_ratio", "Configured agent CPU budget (cores)")
+INTERVAL = metrics.gauge("secmon_governor_interval_seconds", "Current scan interval chosen by the governor", ["task"])
+TASK_CPU = metrics.gauge("secmon_governor_task_cpu_seconds", "CPU time of the last scan", ["task"])
+PRESSURE = metrics.gauge("secmon_governor_pressure", "Host pressure stall (PSI some avg10, %)", ["resource"])
+ADJUSTMENTS = metrics.counter("secmon_governor_adjustments_total", "Interval changes", ["task", "direction"])
+DECISIONS = metrics.counter("secmon_governor_decisions_total", "Governor periods by outcome", ["decision"])
+IO_DEFERRED = metrics.gauge("secmon_governor_io_deferred", "1 while file hashing is deferred by I/O pressure")
+
+
+def read_pressure(resource: str) -> Optional[float]:
+    # /proc/pressure/<resource>: "some avg10=1.23 avg60=... total=..." (Linux 4.20+).
+    try:
+        with open(f"/proc/pressure/{resource}") as f:
+            line = f.readline()
+    except OSError:
+        return None
+    for field in line.split()[1:]:
+        name, _, value = field.partition("=")
+        if name == "avg10":
+            return float(value)
+    return None
+
+
+class Governor:
+    # Бюджет CPU агента: раз в период собственное время CPU процесса (все
+    # потоки, включая хэширование и доставку алертов) сравнивается с бюджетом.
+    # Перерасход растягивает интервалы задач планировщика, запас - сжимает
+    # обратно, всегда в пределах [min, max] каждой задачи. Стоимость прохода
+    # каждой задачи (thread_time) видна в метриках и отсекает дешёвые задачи.
+
+    def __init__(self, scheduler, budget: float = CPU_BUDGET,
+                 io_threshold: float = IO_PRESSURE_THRESHOLD, cpu_threshold: float = CPU_PRESSURE_THRESHOLD,
+                 io_defer_max: float = IO_DEFER_MAX, cpu_clock: Callable[[], float] = time.process_time,
+                 clock: Callable[[], float] = time.monotonic,
+                 pressure: Callable[[str], Optional[float]] = read_pressure):
+        self.scheduler = scheduler
+        self.budget = budget
+        self.io_threshold = io_threshold
+        self.cpu_threshold = cpu_threshold
+        self.io_defer_max = io_defer_max
+        self.cpu_clock = cpu_clock
+        self.clock = clock
+        self.pressure = pressure
+        self.bounds: Dict[str, Tuple[float, float]] = {}
+        self.hooks: Dict[str, Callable[[float], None]] = {}
+        self.usage: Optional[float] = None
+        self.io_pressure: Optional[float] = None
+        self.cpu_pressure: Optional[float] = None
+        self.decision = "hold"
+        self.io_busy_since: Optional[float] = None
+        self._last: Optional[Tuple[float, float]] = None
+        self.invalid = []
+        BUDGET.set(budget)
+
+    def govern(self, name: str, min_interval: Optional[float] = None, max_interval: Optional[float] = None,
+               on_change: Optional[Callable[[float], None]] = None) -> None:
+        base = self.scheduler.tasks[name].interval
+        low = min_interval if min_interval is not None else base
+        high = max_interval if max_interval is not None else max(base, low) * MAX_STRETCH
+        if low <= 0 or low > high:
+            raise ValueError(f"{name}: нужно 0 < min <= max, получено {low}..{high}")
+        self.bounds[name] = (low, high)
+        if on_change is not None:
+            self.hooks[name] = on_change
+        self._set(name, min(max(base, low), high), "init")
+
+    def _set(self, name: str, interval: float, direction: str) -> None:
+        task = self.scheduler.tasks[name]
+        if interval != task.interval:
+            self.scheduler.set_interval(name, interval)
+            if name in self.hooks:
+                self.hooks[name](interval)
+            if direction != "init":
+                ADJUSTMENTS.inc(task=name, direction=direction)
+        INTERVAL.set(interval, task=name)
+
+    def _decide(self) -> float:
+        if self.usage > self.budget:
+            self.decision = "over_budget"
+            return min(self.usage / self.budget, MAX_STEP)
+        if self.cpu_pressure is not None and self.cpu_pressure >= self.cpu_threshold:
+            # Хост перегружен: даже в пределах бюджета не ускоряемся, а уступаем.
+            self.decision = "host_busy"
+            return SHRINK_STEP
+        if self.usage < self.budget * HEADROOM:
+            self.decision = "headroom"
+            return 1 / SHRINK_STEP
+        self.decision = "hold"
+        return 1.0
+
+    def tick(self) -> None:
+        now, cpu = self.clock(), self.cpu_clock()
+        self.io_pressure = self.pressure("io")
+        self.cpu_pressure = self.pressure("cpu")
+        for resource, value in (("io", self.io_pressure), ("cpu", self.cpu_pressure)):
+            if value is not None:
+                PRESSURE.set(value, resource=resource)
+        if self.io_pressure is not None and self.io_threshold and self.io_pressure >= self.io_threshold:
+            if self.io_busy_since is None:
+                self.io_busy_since = now
+        else:
+            self.io_busy_since = None
+        IO_DEFERRED.set(1 if self.defer_io(now) else 0)
+
+        last, self._last = self._last, (now, cpu)
+        if last is None or now <= last[0]:
+            return
+        usage = (cpu - last[1]) / (now - last[0])
+        # Сглаживание: редкий долгий проход (файлы раз в минуту) не дёргает интервалы.
+        self.usage = usage if self.usage is None else (self.usage + usage) / 2
+        USAGE.set(self.usage)
+        tasks = self.scheduler.tasks
+        for name in self.bounds:
+            TASK_CPU.set(tasks[name].last_cpu, task=name)
+        if self.budget <= 0 or not self.bounds:
+            return
+        factor = self._decide()
+        DECISIONS.inc(decision=self.decision)
+        if factor == 1.0:
+            return
+        rates = {name: tasks[name].last_cpu / tasks[name].interval for name in self.bounds}
+        total = sum(rates.values())
+        for name, (low, high) in self.bounds.items():
+            if factor > 1 and total > 0 and rates[name] < total * NEGLIGIBLE:
+                continue
+            interval = min(max(tasks[name].interval * factor, low), high)
+            self._set(name, interval, "stretch" if factor > 1 else "shrink")
+
+    def defer_io(self, now: Optional[float] = None) -> bool:
+        # Хэширование откладывается, пока диск под давлением, но не дольше
+        # io_defer_max: иначе нагрузкой на диск можно скрыть подмену файла.
+        if self.io_busy_since is None:
+            return False
+        now = self.clock() if now is None else now
+        return now - self.io_busy_since < self.io_defer_max
+
+    def stats(self) -> dict:
+        tasks = self.scheduler.tasks
+        return {
+            "usage": self.usage,
+            "budget": self.budget,
+            "decision": self.decision,
+            "io_pressure": self.io_pressure,
+            "cpu_pressure": self.cpu_pressure,
+            "io_deferred": self.defer_io(),
+            "intervals": {name: tasks[name].interval for name in self.bounds},
+        }
+
+
+current: Optional[Governor] = None
+
+
+def init(config_data: dict, scheduler,
+         tasks: Dict[str, Optional[Callable[[float], None]]]) -> Governor:
+    # tasks: задачи планировщика, интервалы которых можно менять, и функция,
+    # которую надо уведомить о новом интервале (или None).
+    global current
+    budget = config_data.get("cpu_budget", CPU_BUDGET)
+    gov = Governor(
+        scheduler,
+        budget=budget,
+        io_threshold=config_data.get("io_pressure_threshold", IO_PRESSURE_THRESHOLD),
+        cpu_threshold=config_data.get("cpu_pressure_threshold", CPU_PRESSURE_THRESHOLD),
+        io_defer_max=config_data.get("io_defer_max", IO_DEFER_MAX),
+    )
+    bounds = config_data.get("scan_interval_bounds", {})
+    for name, on_change in tasks.items():
+        if budget > 0 and name in scheduler.tasks:
+            try:
+                low, high = bounds.get(name, (None, None))
+                gov.govern(name, low, high, on_change)
+            except (TypeError, ValueError) as e:
+                gov.invalid.append((name, str(e)))
+    scheduler.add("Governor", gov.tick, config_data.get("governor_interval", PERIOD))
+    current = gov
+    return gov
+
+
+def defer_io() -> bool:
+    return current is not None and current.defer_io()
@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    dev INTEGER,
+    ino INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    ctime_ns INTEGER,
+    updated REAL NOT NULL
+)
+"""
+
+
+class HashStore:
+    # Базовые хэши в SQLite (WAL). В памяти держится копия всех записей,
+    # commit() пишет одной транзакцией только изменённые с прошлого раза.
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._records: Dict[str, dict] = {}
+        self._dirty = set()
+        self._deleted = set()
+        for path_, hash_, dev, ino, size, mtime_ns, ctime_ns in self._conn.execute(
+                "SELECT path, hash, dev, ino, size, mtime_ns, ctime_ns FROM files"):
+            stat = [dev, ino, size, mtime_ns, ctime_ns] if dev is not None else None
+            self._records[path_] = {"hash": hash_, "stat": stat}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._records
+
+    def __getitem__(self, path: str) -> dict:
+        return self._records[path]
+
+    def __setitem__(self, path: str, record: dict) -> None:
+        with self._lock:
+            self._records[path] = record
+            self._dirty.add(path)
+            self._deleted.discard(path)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._records))
+
+    def get(self, path: str, default=None):
+        return self._records.get(path, default)
+
+    def pop(self, path: str, default=None):
+        with self._lock:
+            if path not in self._records:
+                return default
+            self._dirty.discard(path)
+            self._deleted.add(path)
+            return self._records.pop(path)
+
+    def items(self):
+        return list(self._records.items())
+
+    @property
+    def dirty(self) -> int:
+        return len(self._dirty) + len(self._deleted)
+
+    def commit(self) -> int:
+        with self._lock:
+            if not self._dirty and not self._deleted:
+                return 0
+            now = time.time()
+            rows = []
+            for path in self._dirty:
+                record = self._records[path]
+                stat = record.get("stat") or [None] * 5
+                rows.append((path, record["hash"], *stat, now))
+            deleted = [(path,) for path in self._deleted]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO files (path, hash, dev, ino, size, mtime_ns, ctime_ns, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET hash=excluded.hash, dev=excluded.dev, "
+                    "ino=excluded.ino, size=excluded.size, mtime_ns=excluded.mtime_ns, "
+                    "ctime_ns=excluded.ctime_ns, updated=excluded.updated", rows)
+                self._conn.executemany("DELETE FROM files WHERE path = ?", deleted)
+            written = len(rows) + len(deleted)
+            self._dirty.clear()
+            self._deleted.clear()
+            return written
+
+    def import_json(self, data: dict) -> int:
+        imported = 0
+        for path, value in data.items():
+            if path.endswith("_mtime") and path[:-len("_mtime")] in data:
+                continue
+            if isinstance(value, dict):
+                record = {"hash": value["hash"], "stat": value.get("stat")}
+            else:
+                record = {"hash": value, "stat": None}
+            self[path] = record
+            imported += 1
+        return imported
+
+    def export_json(self) -> dict:
+        return {path: dict(record) for path, record in self._records.items()}
+
+    def close(self) -> None:
+        self.commit()
+        self._conn.close()
+
+
+def write_json_atomic(path, data: dict) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,137 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+DIR_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+            | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HDR = struct.Struct("iIII")
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify не поддерживается")
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def parse_events(data: bytes) -> List[Tuple[int, int, int, str]]:
+    events = []
+    offset = 0
+    while offset + EVENT_HDR.size <= len(data):
+        wd, mask, cookie, length = EVENT_HDR.unpack_from(data, offset)
+        offset += EVENT_HDR.size
+        name = data[offset:offset + length].split(b"\0", 1)[0].decode(errors="surrogateescape")
+        offset += length
+        events.append((wd, mask, cookie, name))
+    return events
+
+
+class FileWatcher:
+    # Следим за родительскими каталогами, а не за самими файлами: так ловятся
+    # и правки на месте, и атомарная замена через rename (vim, sed -i, ansible).
+
+    def __init__(self, paths: Iterable[str], debounce: float = 0.2):
+        self.debounce = debounce
+        self.overflows = 0
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watched: Dict[str, Set[str]] = {}
+        self._wd_dirs: Dict[int, str] = {}
+        self._dir_wds: Dict[str, int] = {}
+        for path in paths:
+            directory, name = os.path.split(os.path.abspath(path))
+            self._watched.setdefault(directory, set()).add(name)
+        self._add_missing_watches()
+
+    @property
+    def paths(self) -> Set[str]:
+        return {os.path.join(d, n) for d, names in self._watched.items() for n in names}
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def _add_missing_watches(self) -> None:
+        for directory in self._watched:
+            if directory in self._dir_wds:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), DIR_MASK)
+            if wd >= 0:
+                self._wd_dirs[wd] = directory
+                self._dir_wds[directory] = wd
+
+    def _read(self) -> Set[str]:
+        changed: Set[str] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return changed
+            if not data:
+                return changed
+            for wd, mask, _, name in parse_events(data):
+                if mask & IN_Q_OVERFLOW:
+                    self.overflows += 1
+                    changed |= self.paths
+                    continue
+                directory = self._wd_dirs.get(wd)
+                if directory is None:
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    self._wd_dirs.pop(wd, None)
+                    self._dir_wds.pop(directory, None)
+                    changed |= {os.path.join(directory, n) for n in self._watched[directory]}
+                    continue
+                if name in self._watched[directory]:
+                    changed.add(os.path.join(directory, name))
+
+    def wait(self, timeout: float) -> Set[str]:
+        # Пачка событий собирается, пока в потоке не наступит пауза debounce.
+        self._add_missing_watches()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = self._read()
+        deadline = time.monotonic() + self.debounce * 10
+        while time.monotonic() < deadline:
+            ready, _, _ = select.select([self._fd], [], [], self.debounce)
+            if not ready:
+                break
+            changed |= self._read()
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
@@ -0,0 +1,100 @@
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PUBLIC = "public"
+ALLOW = "allow"
+DENY = "deny"
+
+BUILTIN_RANGES = (
+    ("0.0.0.0/8", "unspecified"),
+    ("10.0.0.0/8", "private"),
+    ("100.64.0.0/10", "cgnat"),
+    ("127.0.0.0/8", "loopback"),
+    ("169.254.0.0/16", "link-local"),
+    ("172.16.0.0/12", "private"),
+    ("192.0.0.0/24", "reserved"),
+    ("192.0.2.0/24", "documentation"),
+    ("192.168.0.0/16", "private"),
+    ("198.18.0.0/15", "benchmark"),
+    ("198.51.100.0/24", "documentation"),
+    ("203.0.113.0/24", "documentation"),
+    ("224.0.0.0/4", "multicast"),
+    ("240.0.0.0/4", "reserved"),
+    ("::/128", "unspecified"),
+    ("::1/128", "loopback"),
+    ("100::/64", "reserved"),
+    ("2001:db8::/32", "documentation"),
+    ("fc00::/7", "private"),
+    ("fe80::/10", "link-local"),
+    ("ff00::/8", "multicast"),
+)
+
+# Метки пользовательских списков при равной длине префикса: deny сильнее allow.
+_PRIORITY = {DENY: 2, ALLOW: 1}
+
+
+class _PrefixTable:
+    # Поиск самого длинного совпадающего префикса: по одному словарю на
+    # каждую встречающуюся длину префикса. Стоимость поиска зависит только
+    # от числа различных длин (не больше 33/129), но не от числа сетей.
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self._tables: Dict[int, Dict[int, str]] = {}
+        self._lengths: List[int] = []
+
+    def add(self, network: int, prefixlen: int, label: str) -> None:
+        table = self._tables.setdefault(prefixlen, {})
+        key = network >> (self.bits - prefixlen)
+        current = table.get(key)
+        if current is None or _PRIORITY.get(label, 0) > _PRIORITY.get(current, 0):
+            table[key] = label
+        self._lengths = sorted(self._tables, reverse=True)
+
+    def lookup(self, value: int) -> Optional[str]:
+        for prefixlen in self._lengths:
+            label = self._tables[prefixlen].get(value >> (self.bits - prefixlen))
+            if label is not None:
+                return label
+        return None
+
+
+class AddressClassifier:
+    def __init__(self, allow: Iterable[str] = (), deny: Iterable[str] = ()):
+        self.invalid: List[Tuple[str, str]] = []
+        self._user = {4: _PrefixTable(32), 6: _PrefixTable(128)}
+        self._builtin = {4: _PrefixTable(32), 6: _PrefixTable(128)}
+        for cidr, label in BUILTIN_RANGES:
+            self._add(self._builtin, cidr, label)
+        for cidr in allow:
+            self._add(self._user, cidr, ALLOW)
+        for cidr in deny:
+            self._add(self._user, cidr, DENY)
+
+    def _add(self, tables: dict, cidr: str, label: str) -> None:
+        try:
+            net = ipaddress.ip_network(cidr, strict=False)
+        except ValueError as e:
+            self.invalid.append((cidr, str(e)))
+            return
+        tables[net.version].add(int(net.network_address), net.prefixlen, label)
+
+    def classify(self, ip: str) -> Optional[str]:
+        if not ip:
+            return None
+        try:
+            addr = ipaddress.ip_address(ip.split("%", 1)[0])
+        except ValueError:
+            return None
+        if addr.version == 6 and addr.ipv4_mapped is not None:
+            addr = addr.ipv4_mapped
+        value = int(addr)
+        return (self._user[addr.version].lookup(value)
+                or self._builtin[addr.version].lookup(value)
+                or PUBLIC)
+
+    def classify_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        return {ip: self.classify(ip) for ip in set(ips)}
+
+    def is_public(self, ip: str) -> bool:
+        return self.classify(ip) in (PUBLIC, DENY)
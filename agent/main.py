@@ -1,36 +1,98 @@
 import threading
-import time
 import signal
 import sys
 import json
-from agent import file_monitor, process_monitor, network_monitor, alerter
+from agent import file_monitor, process_monitor, network_monitor, alerter, rule_engine, proc_cache, metrics, recorder, snapshot, governor
+from agent.scheduler import Scheduler
 
 shutdown_flag = threading.Event()
+SCHEDULER_RUNS = metrics.gauge("secmon_scheduler_runs", "Scheduler run outcomes per task", ["task", "result"])
 
 def load_settings():
     try:
         with open("config/settings.json") as f:
             return json.load(f)
     except Exception as e:
-        alerter.alert(f"Не удалось загрузить настройки: {e}")
+        alerter.alert(f"Не удалось загрузить настройки: {e}", level="ERROR")
         return {}
 
 def handle_exit(sig, frame):
     alerter.alert("Агент SecMon_Lite завершает работу...")
     shutdown_flag.set()
 
-def start_monitor(func, name):
-    def wrapper():
-        alerter.alert(f"Запуск модуля: {name}")
-        while not shutdown_flag.is_set():
-            try:
-                func()
-            except Exception as e:
-                alerter.alert(f"Ошибка в {name}: {e}")
-            time.sleep(1)
-    thread = threading.Thread(target=wrapper, daemon=True)
-    thread.start()
-    return thread
+def report_overrun(name, duration, interval):
+    alerter.alert(f" {name}: проход занял {duration:.1f}с при интервале {interval}с, следующий запуск пропущен.",
+                  level="WARNING", monitor="scheduler", rule="overrun", key=name)
+
+def report_error(name, error):
+    alerter.alert(f"Ошибка в {name}: {error}", level="ERROR", monitor="scheduler", rule="error", key=name)
+
+def parse_listen(value):
+    host, _, port = str(value).rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def build_scheduler(settings):
+    sched = Scheduler(
+        workers=settings.get("scheduler_workers", 3),
+        on_overrun=report_overrun,
+        on_error=report_error,
+    )
+    jitter = settings.get("scheduler_jitter", 0.1)
+    profile = settings.get("profile_scans", [])
+    profile_dir = settings.get("profile_dir", "profiles")
+
+    def task(name, func):
+        # Профилирование включается только для перечисленных задач (или всех при true).
+        if profile is True or name in (profile or []):
+            return metrics.profiled(name, func, profile_dir)
+        return func
+
+    if snapshot.collector is not None:
+        # Один проход по процессам и сокетам за тик; мониторы берут готовый снимок.
+        sched.add("Snapshot", task("Snapshot", snapshot.refresh), snapshot.INTERVAL)
+    sched.add("File Monitor", task("File Monitor", file_monitor.monitor_files), file_monitor.SCAN_INTERVAL, jitter)
+    if file_monitor.start_watcher():
+        sched.add_loop("File Watcher", task("File Watcher", file_monitor.watch_changes))
+    # Netlink сам доставляет события: опрашиваем его очередь без пауз.
+    if process_monitor.is_event_driven():
+        sched.add_loop("Process Monitor", task("Process Monitor", process_monitor.monitor_processes))
+    else:
+        sched.add("Process Monitor", task("Process Monitor", process_monitor.monitor_processes),
+                  process_monitor.SCAN_INTERVAL, jitter)
+    sched.add("Network Monitor", task("Network Monitor", network_monitor.monitor_network),
+              network_monitor.SCAN_INTERVAL, jitter)
+
+    # Интервалы сканирующих задач подстраиваются под бюджет CPU агента.
+    gov = governor.init(settings, sched, {
+        "Snapshot": snapshot.set_interval,
+        "File Monitor": file_monitor.set_interval,
+        "Process Monitor": None,
+        "Network Monitor": None,
+    })
+    for name, error in gov.invalid:
+        alerter.alert(f"Некорректные границы интервала {name} в scan_interval_bounds: {error}", level="ERROR")
+
+    textfile = settings.get("metrics_textfile")
+    if textfile:
+        sched.add("Metrics", lambda: metrics.write_textfile(textfile), settings.get("metrics_interval", 15))
+
+    def collect():
+        for name, stats in sched.stats().items():
+            for result in ("runs", "skipped", "overruns", "errors"):
+                SCHEDULER_RUNS.set(stats[result], task=name, result=result)
+    metrics.on_collect(collect)
+    return sched
+
+def start_metrics_server(settings):
+    listen = settings.get("metrics_listen")
+    if not listen:
+        return None
+    try:
+        host, port = parse_listen(listen)
+        return metrics.start_http_server(port, host)
+    except (OSError, ValueError) as e:
+        alerter.alert(f" Не удалось открыть порт метрик {listen}: {e}", level="WARNING")
+        return None
 
 def main():
     signal.signal(signal.SIGINT, handle_exit)
@@ -38,19 +100,32 @@ def main():
 
     settings = load_settings()
     alerter.init(settings)
+    alerter.start_dispatcher()
+    rule_engine.load_rules(settings.get("rules_file", "rules/rules.json"))
+    proc_cache.init(settings)
+    file_monitor.init(settings)
+    network_monitor.init(settings)
+    snapshot.init(settings, reader=network_monitor.proc_net_reader)
+    process_monitor.init(settings)
+    recorder.init(settings)
 
-    threads = [
-        start_monitor(file_monitor.run, "File Monitor"),
-        start_monitor(process_monitor.run, "Process Monitor"),
-        start_monitor(network_monitor.run, "Network Monitor"),
-    ]
+    sched = build_scheduler(settings)
+    sched.start()
+    metrics_server = start_metrics_server(settings)
 
     alerter.alert(" SecMon_Lite агент запущен и отслеживает систему.")
-    while not shutdown_flag.is_set():
-        time.sleep(1)
+    while not shutdown_flag.wait(1):
+        rule_engine.reload_if_changed()
+        alerter.flush_aggregated()
+        recorder.flush()
 
-    for t in threads:
-        t.join(timeout=3)
+    sched.stop(timeout=5)
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    file_monitor.stop_watcher()
+    recorder.close()
+    alerter.flush_aggregated()
+    alerter.stop_dispatcher()
 
 if __name__ == "__main__":
     main()
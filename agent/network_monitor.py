@@ -3,50 +3,128 @@ import time
 import traceback
 import os
 import platform
-from typing import Set, Tuple
-from agent import alerter
+from typing import Optional, Tuple
+from agent import alerter, beacon, enrichment, metrics, proc_cache, recorder, rule_engine, snapshot
+from agent.conn_table import ConnectionTable
+from agent.ip_classifier import AddressClassifier, DENY, PUBLIC
+from agent.proc_net import ProcNetReader
 
 SUSPICIOUS_PORTS = {4444, 1337, 31337, 5555, 9001}
-known_conns: Set[Tuple] = set()
+# Статистика маяков ведётся только для адресов за пределами хоста.
+BEACON_CLASSES = {PUBLIC, DENY, "private", "cgnat"}
+BEACON_TITLES = {
+    "beacon": "Периодические соединения (маяк)",
+    "fanout": "Соединения со множеством адресов",
+}
 CACHE_TTL = 3600
+known_conns = ConnectionTable(CACHE_TTL)
 SCAN_INTERVAL = 5
 permission_warning_sent = False
+BACKEND = "psutil"
+proc_net_reader = None
+CLASSIFIER = AddressClassifier()
+classifier_generation = None
+NEW_CONNECTIONS = metrics.counter("secmon_new_connections_total", "Connections seen for the first time", ["class"])
 
-def is_public_ip(ip: str) -> bool:
-    if not ip or ip in ('0.0.0.0', '::'):
-        return False
-    private_blocks = (
-        '10.', '172.16.', '172.17.', '172.18.', '172.19.', '172.20.', '172.21.',
-        '172.22.', '172.23.', '172.24.', '172.25.', '172.26.', '172.27.',
-        '172.28.', '172.29.', '172.30.', '172.31.', '192.168.', '127.'
+def update_classifier() -> None:
+    global CLASSIFIER, classifier_generation
+    if classifier_generation == rule_engine.GENERATION:
+        return
+    CLASSIFIER = AddressClassifier(
+        rule_engine.RULES.get("network_allow_cidrs", []),
+        rule_engine.RULES.get("network_deny_cidrs", []),
     )
-    return not any(ip.startswith(block) for block in private_blocks)
+    classifier_generation = rule_engine.GENERATION
+    for cidr, error in CLASSIFIER.invalid:
+        alerter.alert(f"Некорректная сеть {cidr} в правилах: {error}", level="ERROR")
+
+def init(config_data: dict) -> None:
+    global BACKEND, proc_net_reader, SCAN_INTERVAL
+    SCAN_INTERVAL = config_data.get("network_interval", SCAN_INTERVAL)
+    update_classifier()
+    beacon.init(config_data)
+    try:
+        enrichment.init(config_data)
+    except (OSError, ValueError) as e:
+        alerter.alert(f"Ошибка загрузки базы обогащения {config_data.get('enrichment_db')}: {e}", level="ERROR")
+    backend = config_data.get("network_backend", "auto")
+    if backend == "auto":
+        backend = "procfs" if platform.system() == "Linux" and ProcNetReader.available() else "psutil"
+    if backend == "procfs" and not ProcNetReader.available():
+        alerter.alert(" /proc/net недоступен, сетевой монитор использует psutil.", level="WARNING")
+        backend = "psutil"
+    BACKEND = backend
+    proc_net_reader = ProcNetReader() if backend == "procfs" else None
+
+def get_connections(snap=None) -> list:
+    if snap is not None:
+        return snap.connections
+    if proc_net_reader is not None:
+        return proc_net_reader.connections()
+    return psutil.net_connections(kind='inet')
+
+def is_public_ip(ip: str) -> bool:
+    return CLASSIFIER.is_public(ip)
 
 def clean_cache() -> None:
-    global known_conns
-    current_time = time.time()
-    known_conns = {(pid, lip, lport, rip, rport, timestamp)
-                   for pid, lip, lport, rip, rport, timestamp in known_conns
-                   if current_time - timestamp < CACHE_TTL}
+    known_conns.expire(time.time())
 
-def get_process_info(pid: int) -> Tuple[str, str]:
+def get_process_info(pid: Optional[int], snap=None) -> Tuple[str, str]:
+    # Без root чужие сокеты (и сокеты других namespace) приходят без PID.
+    if pid is None:
+        return 'n/a', 'n/a'
     try:
-        proc = psutil.Process(pid)
-        cmdline = ' '.join(proc.cmdline()) if proc.cmdline() else 'n/a'
-        exe = proc.exe() or 'n/a'
-        return cmdline, exe
+        info = snap.process(pid) if snap is not None else None
+        if info is None or not proc_cache.is_current(pid, info):
+            # В снимке мог остаться процесс до exec (bash вместо nc).
+            info = proc_cache.get(pid)
+        return info.cmdline or 'n/a', info.exe or 'n/a'
     except psutil.NoSuchProcess:
+        proc_cache.invalidate(pid)
         return 'процесс завершён', 'n/a'
     except psutil.AccessDenied:
         return 'доступ запрещён', 'n/a'
     except Exception as e:
         return f'ошибка: {str(e)}', 'ошибка'
 
+def connection_alerts(remote_class, remote_ip, remote_port, local_port) -> list:
+    # Правила для одного нового соединения: [(rule, текст)]. Используется и при
+    # воспроизведении записи (agent.replay).
+    alerts = []
+    if remote_class == DENY:
+        alerts.append(("deny_cidr", f" Соединение с запрещённой сетью: {remote_ip}:{remote_port or 'n/a'}"))
+    elif remote_class == PUBLIC and rule_engine.RULES.get("network_public_alerts", True):
+        alerts.append(("public_ip", f" Внешнее соединение: {remote_ip}:{remote_port or 'n/a'}"))
+    if (remote_port and remote_port in SUSPICIOUS_PORTS) or (local_port in SUSPICIOUS_PORTS):
+        alerts.append(("suspicious_port", f" Подозрительный порт: {remote_port or local_port}"))
+    return alerts
+
+def enrichment_alerts(info, remote_ip, remote_port, exe) -> list:
+    rule_ids = rule_engine.RULESET.match_enrichment(info, exe)
+    if not rule_ids:
+        return []
+    return [("enrichment", f" Соединение с отмеченным адресом: {remote_ip}:{remote_port or 'n/a'}", tuple(rule_ids))]
+
+def alert_key(rule: str, remote_ip, remote_port, local_port, exe):
+    # Сканирование порождает сотни соединений с одного адреса,
+    # поэтому повторы группируются по удалённому IP.
+    if rule == "suspicious_port":
+        return (exe, remote_port or local_port)
+    if rule == "beacon":
+        return (exe, remote_ip, remote_port)
+    if rule == "fanout":
+        return exe
+    return remote_ip
+
 def check_permissions() -> bool:
     return not (platform.system() == 'Darwin' and os.geteuid() != 0)
 
 def monitor_network() -> None:
-    global known_conns, permission_warning_sent
+    with metrics.SCAN_SECONDS.time(monitor="network"):
+        _monitor_network()
+
+def _monitor_network() -> None:
+    global permission_warning_sent
 
     if not check_permissions() and not permission_warning_sent:
         alerter.alert(" На macOS требуется запуск с правами root (sudo) для доступа к сетевым соединениям.", level="WARNING")
@@ -55,7 +133,10 @@ def monitor_network() -> None:
 
     try:
         clean_cache()
-        conns = psutil.net_connections(kind='inet')
+        update_classifier()
+        # Общий снимок тика: сокеты и процессы уже прочитаны одним проходом.
+        snap = snapshot.get() if snapshot.collector is not None else None
+        conns = get_connections(snap)
     except psutil.AccessDenied:
         if not permission_warning_sent:
             alerter.alert(" Нет прав доступа для получения сетевых соединений. Запустите с sudo.", level="ERROR")
@@ -65,33 +146,54 @@ def monitor_network() -> None:
         alerter.alert(f" Ошибка при получении сетевых соединений:\n`{traceback.format_exc()}`", level="ERROR")
         return
 
+    metrics.SCAN_ITEMS.set(len(conns), monitor="network")
     current_time = time.time()
+    new_conns = []
     for conn in conns:
-        try:
-            if not conn.laddr:
-                continue
+        if not conn.laddr:
+            continue
+        remote_ip = conn.raddr.ip if conn.raddr else None
+        remote_port = conn.raddr.port if conn.raddr else None
+        conn_id = (conn.pid, conn.laddr.ip, conn.laddr.port, remote_ip, remote_port)
+        if known_conns.touch(conn_id, current_time):
+            new_conns.append(conn)
+            recorder.record_connection(conn)
+
+    classes = CLASSIFIER.classify_many(conn.raddr.ip for conn in new_conns if conn.raddr)
+    track = beacon.enabled()
 
+    for conn in new_conns:
+        try:
             remote_ip = conn.raddr.ip if conn.raddr else None
             remote_port = conn.raddr.port if conn.raddr else None
-            conn_id = (conn.pid, conn.laddr.ip, conn.laddr.port, remote_ip, remote_port, current_time)
-
-            if any(cid[:5] == conn_id[:5] for cid in known_conns):
-                continue
-            known_conns.add(conn_id)
-
-            alerts = []
-            if remote_ip and is_public_ip(remote_ip):
-                alerts.append(f" Внешнее соединение: {remote_ip}:{remote_port or 'n/a'}")
-            if (remote_port and remote_port in SUSPICIOUS_PORTS) or (conn.laddr.port in SUSPICIOUS_PORTS):
-                alerts.append(f" Подозрительный порт: {remote_port or conn.laddr.port}")
-
-            if alerts:
-                cmdline, exe = get_process_info(conn.pid)
-                for alert in alerts:
-                    alerter.alert(
-                        f"{alert}\n`PID:` {conn.pid}\n`CMD:` {cmdline}\n`EXE:` {exe}\n`Local:` {conn.laddr.ip}:{conn.laddr.port}",
-                        level="WARNING"
-                    )
+
+            remote_class = classes.get(remote_ip)
+            NEW_CONNECTIONS.inc(**{"class": remote_class or "none"})
+            alerts = [(rule, alert, ()) for rule, alert in
+                      connection_alerts(remote_class, remote_ip, remote_port, conn.laddr.port)]
+            tracked = track and remote_class in BEACON_CLASSES
+            info = enrichment.lookup(remote_ip) if remote_ip else None
+            matched = info is not None and rule_engine.RULESET.enrichment_rules
+
+            if alerts or tracked or matched:
+                cmdline, exe = get_process_info(conn.pid, snap)
+            if matched:
+                alerts.extend(enrichment_alerts(info, remote_ip, remote_port, exe))
+            if tracked:
+                for finding in beacon.observe(exe, remote_ip, remote_port, current_time):
+                    alerts.append((finding.rule, f" {BEACON_TITLES[finding.rule]}: {remote_ip}:{remote_port}, "
+                                                 f"{finding.reason}", (finding.rule_id,)))
+            details = f"\n`ASN:` {enrichment.describe(info)}" if info is not None else ""
+            for rule, alert, rule_ids in alerts:
+                key = alert_key(rule, remote_ip, remote_port, conn.laddr.port, exe)
+                alerter.alert(
+                    f"{alert}{details}\n`PID:` {conn.pid}\n`CMD:` {cmdline}\n`EXE:` {exe}\n`Local:` {conn.laddr.ip}:{conn.laddr.port}",
+                    level="WARNING", monitor="network", rule=rule, key=key, rule_ids=rule_ids,
+                    pid=conn.pid, exe=exe, cmdline=cmdline,
+                    enrichment=enrichment.to_dict(info) if info is not None else None,
+                    addresses={"local": f"{conn.laddr.ip}:{conn.laddr.port}",
+                               "remote": f"{remote_ip}:{remote_port}" if remote_ip else None}
+                )
         except psutil.AccessDenied:
             if not permission_warning_sent:
                 alerter.alert(f" Ошибка доступа при обработке соединения (PID: {conn.pid}): Запустите с sudo.", level="ERROR")
@@ -100,8 +202,3 @@ def monitor_network() -> None:
         except Exception as e:
             alerter.alert(f"Ошибка при обработке соединения (PID: {conn.pid}):\n`{traceback.format_exc()}`", level="ERROR")
             continue
-
-def run(scan_interval: int = SCAN_INTERVAL) -> None:
-    while True:
-        monitor_network()
-        time.sleep(scan_interval)
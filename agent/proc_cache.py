@@ -0,0 +1,117 @@
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Iterable, Union
+
+import psutil
+
+ProcInfo = namedtuple("ProcInfo", ["pid", "ppid", "create_time", "name", "exe", "cmdline", "parent_name"])
+
+DEFAULT_SIZE = 4096
+
+
+def is_current(proc: Union[int, psutil.Process], info: ProcInfo) -> bool:
+    # Сведения, снятые до exec, устарели: сверяем exe (один readlink).
+    try:
+        if isinstance(proc, int):
+            proc = psutil.Process(proc)
+        return proc.exe() == info.exe
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        # Процесс уже завершился: последние сведения о нём и так верны.
+        return True
+
+
+class ProcessCache:
+    # Ключ (pid, create_time) защищает от переиспользования PID: новый
+    # процесс с тем же номером получает другой ключ и читается заново.
+    # exec ключ не меняет, поэтому при попадании сверяется readlink exe:
+    # без событий netlink только так видно, что bash стал nc.
+
+    def __init__(self, maxsize: int = DEFAULT_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, ProcInfo]" = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, proc: Union[int, psutil.Process]) -> ProcInfo:
+        if isinstance(proc, int):
+            proc = psutil.Process(proc)
+        key = (proc.pid, proc.create_time())
+        with self._lock:
+            info = self._entries.get(key)
+        if info is not None and is_current(proc, info):
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            return info
+        info = self._read(proc, key[1])
+        with self._lock:
+            self.misses += 1
+            old_key = self._keys.get(proc.pid)
+            if old_key is not None and old_key != key:
+                self._entries.pop(old_key, None)
+            self._entries[key] = info
+            self._keys[proc.pid] = key
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                if self._keys.get(evicted[0]) == evicted:
+                    del self._keys[evicted[0]]
+        return info
+
+    @staticmethod
+    def _read(proc: psutil.Process, create_time: float) -> ProcInfo:
+        with proc.oneshot():
+            ppid = proc.ppid()
+            name = proc.name()
+            exe = proc.exe()
+            cmdline = " ".join(proc.cmdline())
+        try:
+            parent = proc.parent()
+            parent_name = parent.name() if parent else "unknown"
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            parent_name = "unknown"
+        return ProcInfo(proc.pid, ppid, create_time, name, exe, cmdline, parent_name)
+
+    def invalidate(self, pid: int) -> None:
+        with self._lock:
+            key = self._keys.pop(pid, None)
+            if key is not None:
+                self._entries.pop(key, None)
+
+    def prune(self, live_pids: Iterable[int]) -> int:
+        live = set(live_pids)
+        with self._lock:
+            gone = [pid for pid in self._keys if pid not in live]
+            for pid in gone:
+                self._entries.pop(self._keys.pop(pid), None)
+        return len(gone)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+
+cache = ProcessCache()
+
+
+def init(config_data: dict) -> None:
+    cache.maxsize = config_data.get("process_cache_size", DEFAULT_SIZE)
+    cache.clear()
+
+
+def get(proc: Union[int, psutil.Process]) -> ProcInfo:
+    return cache.get(proc)
+
+
+def invalidate(pid: int) -> None:
+    cache.invalidate(pid)
+
+
+def prune(live_pids: Iterable[int]) -> int:
+    return cache.prune(live_pids)
@@ -0,0 +1,207 @@
+import errno
+import os
+import platform
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from typing import List, Optional, Set
+
+import psutil
+
+from agent import metrics, proc_cache
+
+ProcEvent = namedtuple("ProcEvent", ["kind", "pid", "ppid", "timestamp", "info"])
+
+FORK = "fork"
+EXEC = "exec"
+EXIT = "exit"
+
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+NLMSG_DONE = 3
+PROC_CN_MCAST_LISTEN = 1
+PROC_CN_MCAST_IGNORE = 2
+
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+
+NLMSG_HDR = struct.Struct("=IHHII")
+CN_MSG_HDR = struct.Struct("=IIIIHH")
+PROC_EVENT_HDR = struct.Struct("=IIQ")
+FORK_DATA = struct.Struct("=IIII")
+EXEC_DATA = struct.Struct("=II")
+
+QUEUE_SIZE = 65536
+
+LOST = metrics.counter("secmon_process_events_lost_total", "Netlink process events lost (ENOBUFS or full queue)")
+RESYNCS = metrics.counter("secmon_process_events_resyncs_total", "/proc rescans after lost netlink events")
+
+
+def parse_message(data: bytes) -> List[ProcEvent]:
+    events = []
+    offset = 0
+    while offset + NLMSG_HDR.size <= len(data):
+        msg_len = NLMSG_HDR.unpack_from(data, offset)[0]
+        if msg_len < NLMSG_HDR.size:
+            break
+        payload = offset + NLMSG_HDR.size + CN_MSG_HDR.size
+        if payload + PROC_EVENT_HDR.size <= offset + msg_len:
+            what, _, timestamp_ns = PROC_EVENT_HDR.unpack_from(data, payload)
+            body = payload + PROC_EVENT_HDR.size
+            timestamp = timestamp_ns / 1e9
+            if what == PROC_EVENT_FORK:
+                _, parent_tgid, child_pid, child_tgid = FORK_DATA.unpack_from(data, body)
+                if child_pid == child_tgid:
+                    events.append(ProcEvent(FORK, child_tgid, parent_tgid, timestamp, None))
+            elif what == PROC_EVENT_EXEC:
+                pid, tgid = EXEC_DATA.unpack_from(data, body)
+                if pid == tgid:
+                    events.append(ProcEvent(EXEC, tgid, None, timestamp, None))
+            elif what == PROC_EVENT_EXIT:
+                pid, tgid = EXEC_DATA.unpack_from(data, body)
+                if pid == tgid:
+                    events.append(ProcEvent(EXIT, tgid, None, timestamp, None))
+        offset += (msg_len + 3) & ~3
+    return events
+
+
+def _drain(events: "queue.Queue", timeout: float) -> List[ProcEvent]:
+    try:
+        batch = [events.get(timeout=timeout) if timeout > 0 else events.get_nowait()]
+    except queue.Empty:
+        return []
+    while True:
+        try:
+            batch.append(events.get_nowait())
+        except queue.Empty:
+            return batch
+
+
+class PollingSource:
+    name = "poll"
+
+    def __init__(self, known: Optional[Set[int]] = None):
+        self.known = known
+
+    def poll(self, timeout: float = 0.0) -> List[ProcEvent]:
+        if timeout > 0 and self.known is not None:
+            time.sleep(timeout)
+        current = set(psutil.pids())
+        if self.known is None:
+            self.known = current
+            return []
+        now = time.time()
+        events = [ProcEvent(EXEC, pid, None, now, None) for pid in current - self.known]
+        events.extend(ProcEvent(EXIT, pid, None, now, None) for pid in self.known - current)
+        self.known = current
+        return events
+
+    def close(self) -> None:
+        pass
+
+
+class NetlinkSource:
+    # Подписка на proc connector ядра (нужен CAP_NET_ADMIN). Чтение идёт в
+    # отдельном потоке: при exec сведения о процессе снимаются сразу, пока
+    # короткоживущий процесс ещё существует. После потери событий poll()
+    # сверяет известные PID с /proc, как PollingSource; если поток чтения
+    # упал, ошибка остаётся в failed, и монитор переходит на опрос.
+
+    name = "netlink"
+
+    def __init__(self):
+        self.lost = 0
+        self.failed: Optional[OSError] = None
+        self.known: Set[int] = set(psutil.pids())
+        self._resync = threading.Event()
+        self._events: "queue.Queue[ProcEvent]" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            self._sock.bind((0, CN_IDX_PROC))
+            self._sock.send(self._control(PROC_CN_MCAST_LISTEN))
+        except OSError:
+            self._sock.close()
+            raise
+        self._sock.settimeout(1.0)
+        self._thread = threading.Thread(target=self._reader, name="proc-events", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _control(op: int) -> bytes:
+        op_data = struct.pack("=I", op)
+        cn_msg = CN_MSG_HDR.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(op_data), 0) + op_data
+        return NLMSG_HDR.pack(NLMSG_HDR.size + len(cn_msg), NLMSG_DONE, 0, 0, os.getpid()) + cn_msg
+
+    def _reader(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data = self._sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    self._lose()
+                    continue
+                if not self._stop.is_set():
+                    self.failed = e
+                return
+            for event in parse_message(data):
+                if event.kind == EXEC:
+                    # exec не меняет create_time - старая запись в кэше устарела.
+                    proc_cache.invalidate(event.pid)
+                    try:
+                        event = event._replace(info=proc_cache.get(event.pid))
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
+                        pass
+                elif event.kind == EXIT:
+                    proc_cache.invalidate(event.pid)
+                try:
+                    self._events.put_nowait(event)
+                except queue.Full:
+                    self._lose()
+
+    def _lose(self) -> None:
+        self.lost += 1
+        LOST.inc()
+        self._resync.set()
+
+    def poll(self, timeout: float = 0.0) -> List[ProcEvent]:
+        events = _drain(self._events, timeout)
+        for event in events:
+            if event.kind == EXIT:
+                self.known.discard(event.pid)
+            else:
+                self.known.add(event.pid)
+        if self._resync.is_set():
+            self._resync.clear()
+            RESYNCS.inc()
+            current = set(psutil.pids())
+            now = time.time()
+            events.extend(ProcEvent(EXEC, pid, None, now, None) for pid in current - self.known)
+            events.extend(ProcEvent(EXIT, pid, None, now, None) for pid in self.known - current)
+            self.known = current
+        return events
+
+    def close(self) -> None:
+        self._stop.set()
+        try:
+            self._sock.send(self._control(PROC_CN_MCAST_IGNORE))
+        except OSError:
+            pass
+        self._sock.close()
+
+
+def create_source(mode: str = "auto"):
+    if mode in ("auto", "netlink") and platform.system() == "Linux":
+        try:
+            return NetlinkSource()
+        except OSError:
+            if mode == "netlink":
+                raise
+    return PollingSource()
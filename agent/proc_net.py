@@ -0,0 +1,205 @@
+import os
+import socket
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Set, Tuple
+
+Addr = namedtuple("Addr", ["ip", "port"])
+Conn = namedtuple("Conn", ["fd", "family", "type", "laddr", "raddr", "status", "pid"])
+
+NET_FILES = (
+    ("tcp", socket.AF_INET, socket.SOCK_STREAM),
+    ("tcp6", socket.AF_INET6, socket.SOCK_STREAM),
+    ("udp", socket.AF_INET, socket.SOCK_DGRAM),
+    ("udp6", socket.AF_INET6, socket.SOCK_DGRAM),
+)
+
+TCP_STATES = {
+    "01": "ESTABLISHED",
+    "02": "SYN_SENT",
+    "03": "SYN_RECV",
+    "04": "FIN_WAIT1",
+    "05": "FIN_WAIT2",
+    "06": "TIME_WAIT",
+    "07": "CLOSE",
+    "08": "CLOSE_WAIT",
+    "09": "LAST_ACK",
+    "0A": "LISTEN",
+    "0B": "CLOSING",
+}
+
+# Полный перечит fd всех процессов - не чаще этого (с).
+FULL_RESCAN_INTERVAL = 60
+
+
+def decode_address(value: str, family: int) -> Addr:
+    ip_hex, port_hex = value.split(":")
+    port = int(port_hex, 16)
+    raw = bytes.fromhex(ip_hex)
+    # Ядро печатает адрес как массив 32-битных слов в порядке хоста (little-endian).
+    raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    ip = socket.inet_ntop(family, raw)
+    return Addr(ip, port)
+
+
+def parse_net_file(path: str, family: int, sock_type: int) -> List[Tuple[int, Conn]]:
+    result = []
+    try:
+        with open(path, "r") as f:
+            next(f, None)
+            for line in f:
+                fields = line.split()
+                if len(fields) < 10:
+                    continue
+                laddr = decode_address(fields[1], family)
+                raddr = decode_address(fields[2], family)
+                if raddr.port == 0:
+                    raddr = ()
+                if sock_type == socket.SOCK_STREAM:
+                    status = TCP_STATES.get(fields[3], "NONE")
+                else:
+                    status = "NONE"
+                inode = int(fields[9])
+                result.append((inode, Conn(-1, family, sock_type, laddr, raddr, status, None)))
+    except (FileNotFoundError, PermissionError):
+        pass
+    return result
+
+
+class ProcNetReader:
+    # Карта inode -> PID поддерживается инкрементально: fd полностью
+    # перечитываются только у новых (или переиспользованных) PID, а у
+    # остальных при появлении сокетов, которых нет в карте, читаются только
+    # новые номера fd и fd закрытых сокетов (номер мог достаться новому).
+    # Полный перечит нужен лишь для fd, которые были файлами и стали
+    # сокетами, и ограничен FULL_RESCAN_INTERVAL.
+
+    def __init__(self, root: str = "/proc", clock=time.monotonic):
+        self.root = root
+        self.clock = clock
+        self._pids: Dict[int, Tuple[int, Dict[str, int]]] = {}
+        self._inode_pid: Dict[int, int] = {}
+        self._orphans: Set[int] = set()
+        self._pending: Set[int] = set()
+        self._last_full = None
+
+    @staticmethod
+    def available(root: str = "/proc") -> bool:
+        return os.access(os.path.join(root, "net", "tcp"), os.R_OK)
+
+    def connections(self, pids: Optional[Dict[int, int]] = None) -> List[Conn]:
+        # pids - готовый результат scan_pids(), если /proc уже обошли в этом тике.
+        sockets = []
+        for name, family, sock_type in NET_FILES:
+            sockets.extend(parse_net_file(os.path.join(self.root, "net", name), family, sock_type))
+        needed = {inode for inode, _ in sockets if inode}
+        self._refresh(needed, self.scan_pids() if pids is None else pids)
+        return [conn._replace(pid=self._inode_pid.get(inode)) for inode, conn in sockets]
+
+    def scan_pids(self) -> Dict[int, int]:
+        # PID -> starttime процесса: смена значения означает новый процесс с тем же PID.
+        result = {}
+        for pid in self._list_pids():
+            ident = self._identity(pid)
+            if ident is not None:
+                result[pid] = ident
+        return result
+
+    def _list_pids(self) -> Set[int]:
+        try:
+            return {int(name) for name in os.listdir(self.root) if name.isdigit()}
+        except OSError:
+            return set()
+
+    def _identity(self, pid: int) -> Optional[int]:
+        # Поле 22 /proc/<pid>/stat (starttime, такты от загрузки) постоянно
+        # всю жизнь процесса. ctime каталога /proc/<pid> для этого не годится:
+        # inode procfs пересоздаётся после вытеснения из кэша.
+        try:
+            with open(os.path.join(self.root, str(pid), "stat"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # comm может содержать пробелы и скобки: поля считаем после последней ")".
+        fields = data.rpartition(b")")[2].split()
+        try:
+            return int(fields[19])
+        except (IndexError, ValueError):
+            return None
+
+    def _read_fds(self, pid: int, known: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        fd_dir = os.path.join(self.root, str(pid), "fd")
+        try:
+            names = os.listdir(fd_dir)
+        except OSError:
+            return {}
+        fds = {}
+        for name in names:
+            if known is not None and name in known:
+                fds[name] = known[name]
+                continue
+            try:
+                target = os.readlink(os.path.join(fd_dir, name))
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                fds[name] = int(target[8:-1])
+            else:
+                fds[name] = 0
+        return fds
+
+    def _store(self, pid: int, ident: int, fds: Dict[str, int]) -> None:
+        self._drop(pid)
+        self._pids[pid] = (ident, fds)
+        for inode in fds.values():
+            if inode:
+                self._inode_pid[inode] = pid
+
+    def _drop(self, pid: int) -> None:
+        entry = self._pids.pop(pid, None)
+        if entry is None:
+            return
+        for inode in entry[1].values():
+            if inode and self._inode_pid.get(inode) == pid:
+                del self._inode_pid[inode]
+
+    def _refresh(self, needed: Set[int], live: Dict[int, int]) -> None:
+        for pid in list(self._pids):
+            if pid not in live:
+                self._drop(pid)
+
+        fresh = set()
+        for pid, ident in live.items():
+            entry = self._pids.get(pid)
+            if entry is None or entry[0] != ident:
+                self._store(pid, ident, self._read_fds(pid))
+                fresh.add(pid)
+
+        self._orphans &= needed
+        self._pending &= needed
+        unresolved = needed - self._inode_pid.keys() - self._orphans - self._pending
+        if unresolved:
+            # Новые номера fd и fd сокетов, которых больше нет в /proc/net:
+            # у процессов без изменений readlink не вызывается.
+            for pid, (ident, fds) in list(self._pids.items()):
+                if pid not in fresh:
+                    known = {name: inode for name, inode in fds.items() if not inode or inode in needed}
+                    self._store(pid, ident, self._read_fds(pid, known))
+            self._pending |= unresolved - self._inode_pid.keys()
+        self._pending -= self._inode_pid.keys()
+
+        if not self._pending:
+            return
+        stale = [pid for pid in self._pids if pid not in fresh]
+        if stale:
+            now = self.clock()
+            if self._last_full is not None and now - self._last_full < FULL_RESCAN_INTERVAL:
+                return
+            # Бывший файловый fd мог стать сокетом - полный перечит, но не на каждом тике.
+            self._last_full = now
+            for pid in stale:
+                self._store(pid, self._pids[pid][0], self._read_fds(pid))
+        # Сокеты без владельца (чужие namespace, нет прав) больше не
+        # вызывают полного перечита.
+        self._orphans |= self._pending - self._inode_pid.keys()
+        self._pending.clear()
@@ -0,0 +1,177 @@
+import threading
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+import psutil
+
+from agent.proc_cache import ProcInfo
+
+MAX_DEPTH = 64
+
+Key = Tuple[int, float]
+
+
+def node_names(info: ProcInfo) -> FrozenSet[str]:
+    # Имя процесса (comm) и имя исполняемого файла: у /bin/sh -> dash это "sh" и "dash".
+    names = {(info.name or "").lower(), (info.exe or "").rsplit("/", 1)[-1].lower()}
+    names.discard("")
+    return frozenset(names)
+
+
+class Node:
+    __slots__ = ("key", "info", "names", "parent", "resolved", "children", "alive", "_lineage")
+
+    def __init__(self, key: Key, info: ProcInfo):
+        self.key = key
+        self.info = info
+        self.names = node_names(info)
+        self.parent = None
+        self.resolved = False
+        self.children = set()
+        self.alive = True
+        self._lineage = None
+
+
+class ProcessTree:
+    # Дерево процессов с ключом (pid, create_time): переиспользованный PID
+    # даёт новый узел, а не продолжение старого. Завершившийся процесс
+    # удаляется, как только у него не остаётся живых потомков - до тех пор
+    # он нужен для их цепочки предков. Цепочка кэшируется в узле, а
+    # отсутствующие в дереве предки читаются через fetch только при первом
+    # запросе цепочки.
+
+    def __init__(self, fetch: Optional[Callable[[int], ProcInfo]] = None):
+        self.fetch = fetch
+        self._nodes: Dict[Key, Node] = {}
+        self._by_pid: Dict[int, Node] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._by_pid
+
+    def get(self, pid: int) -> Optional[ProcInfo]:
+        node = self._by_pid.get(pid)
+        return node.info if node is not None else None
+
+    def _link(self, node: Node, fetch: bool) -> None:
+        if node.resolved:
+            return
+        info = node.info
+        if not info.ppid or info.ppid == info.pid:
+            node.resolved = True
+            return
+        parent = self._by_pid.get(info.ppid)
+        if parent is None:
+            if not fetch or self.fetch is None:
+                return
+            # Предка нет в дереве (например, fork без exec): читаем его один
+            # раз, дальше цепочка берётся из дерева.
+            try:
+                parent = self._add(self.fetch(info.ppid))
+            except (psutil.Error, OSError, ValueError):
+                parent = None
+        node.resolved = True
+        # Родитель, запущенный позже потомка, - это уже другой процесс с тем же PID.
+        if parent is None or parent is node or parent.key[1] > node.key[1]:
+            return
+        node.parent = parent
+        parent.children.add(node)
+
+    def add(self, info: ProcInfo) -> Node:
+        with self._lock:
+            return self._add(info)
+
+    def _add(self, info: ProcInfo) -> Node:
+        key = (info.pid, info.create_time)
+        node = self._nodes.get(key)
+        if node is not None:
+            # exec в том же процессе: ключ прежний, имя и командная строка новые.
+            if node.info != info:
+                node.info = info
+                if node_names(info) != node.names:
+                    node.names = node_names(info)
+                    self._invalidate(node)
+            node.alive = True
+            self._by_pid[info.pid] = node
+            return node
+        old = self._by_pid.get(info.pid)
+        if old is not None:
+            self._remove(old)
+        node = Node(key, info)
+        self._nodes[key] = node
+        self._by_pid[info.pid] = node
+        self._link(node, fetch=False)
+        return node
+
+    def sync(self, infos: Iterable[ProcInfo]) -> None:
+        # Родители запущены раньше детей: добавляем по времени старта.
+        with self._lock:
+            for info in sorted(infos, key=lambda i: i.create_time):
+                self._add(info)
+
+    def _invalidate(self, node: Node) -> None:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            current._lineage = None
+            stack.extend(current.children)
+
+    def remove(self, pid: int) -> None:
+        with self._lock:
+            node = self._by_pid.get(pid)
+            if node is not None:
+                self._remove(node)
+
+    def _remove(self, node: Node) -> None:
+        node.alive = False
+        if self._by_pid.get(node.key[0]) is node:
+            del self._by_pid[node.key[0]]
+        while node is not None and not node.alive and not node.children:
+            del self._nodes[node.key]
+            parent = node.parent
+            if parent is not None:
+                parent.children.discard(node)
+            node = parent
+
+    def prune(self, live_pids: Iterable[int]) -> int:
+        live = set(live_pids)
+        with self._lock:
+            gone = [node for pid, node in self._by_pid.items() if pid not in live]
+            for node in gone:
+                self._remove(node)
+        return len(gone)
+
+    def lineage(self, pid: int) -> Tuple[FrozenSet[str], ...]:
+        # Имена от корня к самому процессу; пусто, если процесса нет в дереве.
+        with self._lock:
+            node = self._by_pid.get(pid)
+            if node is None:
+                return ()
+            if node._lineage is None:
+                self._build(node)
+            return node._lineage
+
+    def _build(self, node: Node) -> None:
+        chain = []
+        current = node
+        while current is not None and current._lineage is None and len(chain) < MAX_DEPTH:
+            self._link(current, fetch=True)
+            chain.append(current)
+            current = current.parent
+        prefix = current._lineage if current is not None and current._lineage is not None else ()
+        for item in reversed(chain):
+            prefix = prefix + (item.names,)
+            item._lineage = prefix
+
+    def ancestry(self, pid: int) -> Tuple[ProcInfo, ...]:
+        with self._lock:
+            node = self._by_pid.get(pid)
+            if node is not None and node._lineage is None:
+                self._build(node)
+            chain = []
+            while node is not None and len(chain) < MAX_DEPTH:
+                chain.append(node.info)
+                node = node.parent
+            return tuple(reversed(chain))
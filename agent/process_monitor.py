@@ -1,64 +1,183 @@
+import hashlib
 import psutil
-import time
 import os
+from collections import OrderedDict
 
-from agent import alerter
+from agent import alerter, exe_hash, metrics, proc_cache, proc_events, recorder, rule_engine, snapshot
+from agent.proc_tree import ProcessTree
+from agent.rule_engine import Match
 
 SUSPICIOUS_PATHS = ["/tmp", "/dev/shm", "/var/tmp"]
-
-known_pids = set()
+SCAN_INTERVAL = 3
+VERDICT_CACHE_SIZE = 4096
+
+SOURCE = None
+TREE = ProcessTree(fetch=proc_cache.get)
+tree_tick = None
+verdict_cache = OrderedDict()
+verdict_generation = None
+EVENTS = metrics.counter("secmon_process_events_total", "Process events consumed", ["kind"])
+VERDICT_CACHE = metrics.counter("secmon_verdict_cache_total", "Verdict cache lookups", ["result"])
+TREE_SIZE = metrics.gauge("secmon_process_tree_nodes", "Processes tracked in the process tree")
+RULE_SECONDS = metrics.histogram("secmon_rule_evaluation_seconds", "Rule evaluation time per process",
+                                 buckets=(1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05))
+
+def init(config_data: dict) -> None:
+    global SOURCE, VERDICT_CACHE_SIZE, SCAN_INTERVAL
+    SCAN_INTERVAL = config_data.get("process_interval", SCAN_INTERVAL)
+    VERDICT_CACHE_SIZE = config_data.get("verdict_cache_size", VERDICT_CACHE_SIZE)
+    try:
+        exe_hash.init(config_data)
+    except (OSError, ValueError) as e:
+        alerter.alert(f"Ошибка загрузки таблицы хэшей {config_data.get('bad_hashes_file')}: {e}", level="ERROR")
+    if SOURCE is not None:
+        SOURCE.close()
+    mode = config_data.get("process_events", "auto")
+    try:
+        SOURCE = proc_events.create_source(mode)
+    except OSError as e:
+        alerter.alert(f" Netlink proc connector недоступен ({e}), используется опрос процессов.", level="WARNING")
+        SOURCE = proc_events.PollingSource()
+    if isinstance(SOURCE, proc_events.PollingSource) and snapshot.collector is not None:
+        # Опрос идёт по общему снимку системы, без отдельного обхода /proc.
+        SOURCE = snapshot.SnapshotSource()
 
 def is_suspicious_path(path):
     return any(path.startswith(sus_path) for sus_path in SUSPICIOUS_PATHS)
 
-def get_process_info(proc):
+def _as_dict(info):
+    return {
+        "pid": info.pid,
+        "ppid": info.ppid,
+        "exe": info.exe,
+        "cmdline": info.cmdline,
+        "parent_name": info.parent_name
+    }
+
+def _read_info(proc):
     try:
-        return {
-            "pid": proc.pid,
-            "ppid": proc.ppid(),
-            "exe": proc.exe(),
-            "cmdline": " ".join(proc.cmdline()),
-            "parent_name": proc.parent().name() if proc.parent() else "unknown"
-        }
+        return proc_cache.get(proc)
     except Exception:
         return None
 
-def monitor_processes():
-    global known_pids
-    current_pids = set(psutil.pids())
-
-    new_pids = current_pids - known_pids
-
-    for pid in new_pids:
-        try:
-            proc = psutil.Process(pid)
-            info = get_process_info(proc)
-            if not info:
+def get_process_info(proc):
+    info = _read_info(proc)
+    return _as_dict(info) if info is not None else None
+
+def evaluate(info) -> tuple:
+    global verdict_generation
+    if verdict_generation != rule_engine.GENERATION:
+        verdict_cache.clear()
+        verdict_generation = rule_engine.GENERATION
+    # Одинаковые командные строки (cron, CI) оцениваются правилами один раз.
+    lineage = info.get("lineage", ())
+    key = (info["exe"], info["parent_name"], hashlib.blake2b(info["cmdline"].encode(), digest_size=16).digest(), lineage)
+    verdict = verdict_cache.get(key)
+    if verdict is not None:
+        verdict_cache.move_to_end(key)
+        VERDICT_CACHE.inc(result="hit")
+        return verdict
+    VERDICT_CACHE.inc(result="miss")
+    with RULE_SECONDS.time():
+        verdict = rule_engine.evaluate_process(info["exe"], info["parent_name"], info["cmdline"], lineage)
+    if is_suspicious_path(info["exe"]):
+        verdict = (Match("suspicious_path", info["exe"], f"`{info['exe']}`"),) + verdict
+    verdict_cache[key] = verdict
+    while len(verdict_cache) > VERDICT_CACHE_SIZE:
+        verdict_cache.popitem(last=False)
+    return verdict
+
+ALERT_TITLES = {
+    "suspicious_path": "Запуск из подозрительного пути",
+    "suspicious_parent": "Подозрительный родитель",
+    "cmdline_keyword": "Подозрительная командная строка",
+    "regex": "Подозрительная командная строка",
+    "lineage": "Подозрительная цепочка процессов",
+    "known_bad_hash": "Известный вредоносный файл",
+}
+
+def check_exe(info) -> tuple:
+    # Не кэшируется вместе с вердиктом: под тем же путём может лежать другой файл.
+    digest = exe_hash.lookup(info["pid"], info["exe"])
+    if digest is None:
+        return ()
+    return (Match("known_bad_hash", digest, f"`{info['exe']}` SHA-256 `{digest}`"),)
+
+def check_process(info):
+    for match in check_exe(info) + evaluate(info):
+        title = ALERT_TITLES.get(match.rule, match.rule)
+        alerter.alert(f" {title}: {match.reason}\n`PID:` {info['pid']}, `PPID:` {info['ppid']}, `CMD:` {info['cmdline']}",
+                      monitor="process", rule=match.rule, key=(match.rule_id, info["exe"]),
+                      rule_ids=(match.rule_id,), pid=info["pid"], ppid=info["ppid"],
+                      exe=info["exe"], cmdline=info["cmdline"])
+
+def monitor_processes(timeout: float = 0.0):
+    global SOURCE
+    if SOURCE is None:
+        SOURCE = proc_events.PollingSource()
+
+    if timeout:
+        # Ожидание событий в poll() не входит во время прохода.
+        events = SOURCE.poll(timeout)
+        with metrics.SCAN_SECONDS.time(monitor="process"):
+            _handle_events(events)
+    else:
+        with metrics.SCAN_SECONDS.time(monitor="process"):
+            _handle_events(SOURCE.poll(0))
+    if getattr(SOURCE, "failed", None) is not None:
+        # Поток netlink остановился: очередь уже разобрана, дальше - опрос
+        # от последнего известного набора PID, чтобы не потерять новые процессы.
+        alerter.alert(f" Чтение netlink proc connector прервано ({SOURCE.failed}), используется опрос процессов.",
+                      level="WARNING")
+        known = SOURCE.known
+        SOURCE.close()
+        SOURCE = proc_events.PollingSource(known)
+
+def sync_tree() -> None:
+    # Дерево заполняется из общего снимка при первом проходе и сверяется с ним
+    # на каждом новом тике: так из него уходят процессы, чей EXIT потерялся.
+    global tree_tick
+    if snapshot.collector is None:
+        return
+    snap = snapshot.collector.latest
+    if tree_tick is None:
+        snap = snap or snapshot.get()
+        TREE.sync(snap.processes.values())
+    elif snap is None or snap.tick == tree_tick:
+        return
+    else:
+        TREE.prune(snap.pids)
+    tree_tick = snap.tick
+    TREE_SIZE.set(len(TREE))
+
+def _handle_events(events) -> None:
+    metrics.SCAN_ITEMS.set(len(events), monitor="process")
+    sync_tree()
+    for event in events:
+        EVENTS.inc(kind=event.kind)
+        if event.kind == proc_events.EXIT:
+            proc_cache.invalidate(event.pid)
+            TREE.remove(event.pid)
+            recorder.record_exit(event.pid)
+            continue
+        if event.kind != proc_events.EXEC:
+            continue
+        if event.info is not None:
+            proc = event.info
+        else:
+            proc_cache.invalidate(event.pid)
+            try:
+                proc = _read_info(psutil.Process(event.pid))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
                 continue
-
-            exe_path = info["exe"]
-            parent = info["parent_name"]
-
-            alerts = []
-
-            if is_suspicious_path(exe_path):
-                alerts.append(f" Запуск из подозрительного пути: `{exe_path}`")
-
-            if parent in ["nginx", "apache2", "sshd", "systemd", "bash", "sh", "zsh"]:
-                if "python" in info["cmdline"] or "nc" in info["cmdline"]:
-                    alerts.append(f" Подозрительный родитель `{parent}` для процесса: `{info['cmdline']}`")
-
-            for alert in alerts:
-                alerter.alert(f"{alert}\n`PID:` {info['pid']}, `PPID:` {info['ppid']}, `CMD:` {info['cmdline']}")
-
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
+        if proc is None:
             continue
-
-    known_pids.update(new_pids)
-
-def run():
-    global known_pids
-    known_pids = set(psutil.pids())  
-    while True:
-        monitor_processes()
-        time.sleep(3)
+        TREE.add(proc)
+        recorder.record_process(proc)
+        info = _as_dict(proc)
+        if rule_engine.has_lineage_rules():
+            info["lineage"] = TREE.lineage(proc.pid)
+        check_process(info)
+
+def is_event_driven() -> bool:
+    return isinstance(SOURCE, proc_events.NetlinkSource)
@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    # rate - единиц в секунду (байты, сообщения). rate <= 0 - без ограничения.
+    # consume() разрешает уходить в долг: крупный файл не блокируется навсегда,
+    # а следующие запросы ждут, пока долг не погасится.
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def available(self) -> float:
+        if self.unlimited:
+            return float("inf")
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+    def consume(self, amount: float) -> float:
+        if self.unlimited:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def try_consume(self, amount: float) -> bool:
+        if self.unlimited:
+            return True
+        with self._lock:
+            self._refill()
+            if self.tokens < amount:
+                return False
+            self.tokens -= amount
+            return True
+
+    def throttle(self, amount: float) -> None:
+        delay = self.consume(amount)
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,143 @@
+import gzip
+import json
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional
+
+from agent import metrics
+
+# Типы записей. Запись - JSON-массив [тип, время, поля...] без имён полей:
+# так строка короче, а gzip сжимает однотипные строки лучше.
+PROCESS = "p"
+EXIT = "x"
+CONNECTION = "c"
+FILE = "f"
+
+FLUSH_INTERVAL = 1.0
+
+RECORDS = metrics.counter("secmon_recorded_total", "Observations written to the recording", ["kind"])
+
+
+class Recorder:
+    # Наблюдения мониторов (новые процессы, соединения, изменения файлов)
+    # дописываются в gzip-файл. Каждый запуск добавляет новый gzip-member,
+    # поэтому файл только растёт и читается целиком обычным gzip.open.
+    # Сжатый поток сбрасывается на диск не чаще раза в FLUSH_INTERVAL.
+
+    def __init__(self, path, flush_interval: float = FLUSH_INTERVAL, clock=time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._file = gzip.open(self.path, "ab", compresslevel=6)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._pending = False
+        self.written = 0
+
+    def write(self, record: list) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self.written += 1
+            self._pending = True
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+        RECORDS.inc(kind=record[0])
+
+    def _flush(self) -> None:
+        self._file.flush(zlib.Z_SYNC_FLUSH)
+        self._last_flush = time.monotonic()
+        self._pending = False
+
+    def flush(self) -> None:
+        # Вызывается из главного цикла: без новых записей ничего не пишет.
+        with self._lock:
+            if self._file is not None and self._pending:
+                self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+READ_CHUNK = 1024 * 1024
+
+
+def read(path) -> Iterator[list]:
+    # Разбор пачками: строки блока склеиваются в один JSON-массив и
+    # декодируются одним вызовом json.loads - в разы быстрее построчного.
+    # Оборванный последний блок (агент убит во время записи) не ошибка:
+    # возвращаем всё, что успело сжаться до него.
+    tail = b""
+    with gzip.open(path, "rb") as f:
+        while True:
+            try:
+                chunk = f.read1(READ_CHUNK)
+            except (EOFError, zlib.error):
+                chunk = b""
+            if not chunk:
+                return
+            data = tail + chunk
+            end = data.rfind(b"\n")
+            if end < 0:
+                tail = data
+                continue
+            tail = data[end + 1:]
+            yield from json.loads(b"[" + data[:end].replace(b"\n", b",") + b"]")
+
+
+recorder: Optional[Recorder] = None
+
+
+def init(config_data: dict) -> None:
+    global recorder
+    close()
+    path = config_data.get("record_file")
+    if path:
+        recorder = Recorder(path, config_data.get("record_flush_interval", FLUSH_INTERVAL))
+
+
+def enabled() -> bool:
+    return recorder is not None
+
+
+def record_process(info) -> None:
+    if recorder is not None:
+        recorder.write([PROCESS, recorder.clock(), info.pid, info.ppid, info.create_time,
+                        info.name, info.exe, info.cmdline, info.parent_name])
+
+
+def record_exit(pid: int) -> None:
+    if recorder is not None:
+        recorder.write([EXIT, recorder.clock(), pid])
+
+
+def record_connection(conn) -> None:
+    if recorder is not None:
+        raddr = conn.raddr or None
+        recorder.write([CONNECTION, recorder.clock(), conn.pid, conn.laddr.ip, conn.laddr.port,
+                        raddr.ip if raddr else None, raddr.port if raddr else None])
+
+
+def record_file(path: str, change: str) -> None:
+    if recorder is not None:
+        recorder.write([FILE, recorder.clock(), path, change])
+
+
+def flush() -> None:
+    if recorder is not None:
+        recorder.flush()
+
+
+def close() -> None:
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
@@ -0,0 +1,166 @@
+import argparse
+import fnmatch
+import glob
+import json
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from agent import beacon, enrichment, network_monitor, process_monitor, recorder, rule_engine
+from agent.aggregator import AlertAggregator
+from agent.ip_classifier import AddressClassifier
+from agent.proc_cache import ProcInfo
+from agent.proc_tree import ProcessTree
+
+
+def _watched(path: str, entries) -> str:
+    for entry in entries:
+        if glob.has_magic(entry):
+            if fnmatch.fnmatchcase(path, entry):
+                return entry
+        elif path == entry or path.startswith(entry.rstrip("/") + "/"):
+            return entry
+    return ""
+
+
+class Replay:
+    # Прогон записанных наблюдений через правила без ядра, сети и таймеров:
+    # время берётся из записей, поэтому сутки проигрываются так быстро, как
+    # успевает CPU. Группировка повторов моделируется тем же AlertAggregator,
+    # что и в агенте, - видно, сколько уведомлений реально ушло бы.
+
+    def __init__(self, rules: dict, window: float = 60, max_keys: int = 10000, enrichment_db: Optional[str] = None):
+        self.rules = rules
+        rule_engine.RULES = rules
+        rule_engine.RULESET = rule_engine.Ruleset(rules)
+        rule_engine.GENERATION += 1
+        self.invalid = rule_engine.RULESET.invalid + rule_engine.RULESET.invalid_rules
+        self.classifier = AddressClassifier(rules.get("network_allow_cidrs", []),
+                                            rules.get("network_deny_cidrs", []))
+        self.invalid += self.classifier.invalid
+        self.watched = tuple(rules.get("watched_files", []))
+        self.tree = ProcessTree()
+        self.lineage = bool(rule_engine.RULESET.lineage_rules)
+        self.beacons = beacon.BeaconTracker() if beacon.enabled() else None
+        self.enrichment = enrichment.EnrichmentDB(enrichment_db) if enrichment_db else None
+        self.enrichment_cache = enrichment.EnrichmentCache()
+        self.aggregator = AlertAggregator(window, max_keys) if window > 0 else None
+        self.hits: Counter = Counter()
+        self.alerts: Counter = Counter()
+        self.records: Counter = Counter()
+        self._rows: Dict[tuple, tuple] = {}
+        self.first = None
+        self.last = None
+
+    def _hit(self, row: tuple, key, now: float) -> None:
+        self.hits[row] += 1
+        if self.aggregator is None:
+            self.alerts[row] += 1
+            return
+        fingerprint = (row[0], row[1], key)
+        self._rows[fingerprint] = row
+        passed, summaries = self.aggregator.offer(fingerprint, "", "WARNING", now)
+        if passed:
+            self.alerts[row] += 1
+        for summary in summaries:
+            self.alerts[self._rows[summary[0]]] += 1
+
+    def feed(self, records: Iterable[list]) -> None:
+        for record in records:
+            kind, now = record[0], record[1]
+            self.records[kind] += 1
+            if self.first is None:
+                self.first = now
+            self.last = now
+            if kind == recorder.PROCESS:
+                self._process(ProcInfo(*record[2:9]), now)
+            elif kind == recorder.EXIT:
+                self.tree.remove(record[2])
+            elif kind == recorder.CONNECTION:
+                self._connection(record, now)
+            elif kind == recorder.FILE:
+                entry = _watched(record[2], self.watched)
+                if entry:
+                    self._hit(("file", record[3], entry), record[2], now)
+
+    def _process(self, proc: ProcInfo, now: float) -> None:
+        self.tree.add(proc)
+        info = {"pid": proc.pid, "ppid": proc.ppid, "exe": proc.exe,
+                "cmdline": proc.cmdline, "parent_name": proc.parent_name}
+        if self.lineage:
+            info["lineage"] = self.tree.lineage(proc.pid)
+        for match in process_monitor.evaluate(info):
+            self._hit(("process", match.rule, match.rule_id), (match.rule_id, proc.exe), now)
+
+    def _connection(self, record: list, now: float) -> None:
+        pid, _, local_port, remote_ip, remote_port = record[2:7]
+        remote_class = self.classifier.classify(remote_ip) if remote_ip else None
+        alerts = [(rule, rule) for rule, _ in
+                  network_monitor.connection_alerts(remote_class, remote_ip, remote_port, local_port)]
+        tracked = self.beacons is not None and remote_class in network_monitor.BEACON_CLASSES
+        info = None
+        if self.enrichment is not None and remote_ip and rule_engine.RULESET.enrichment_rules:
+            info = self.enrichment_cache.get(self.enrichment, remote_ip)
+        if not alerts and not tracked and info is None:
+            return
+        proc = self.tree.get(pid)
+        exe = proc.exe if proc is not None else "n/a"
+        if info is not None:
+            alerts.extend(("enrichment", rule_id) for rule_id in rule_engine.RULESET.match_enrichment(info, exe))
+        if tracked:
+            ruleset = rule_engine.RULESET
+            for finding in self.beacons.observe(exe, remote_ip, remote_port, now,
+                                                ruleset.beacon_rules, ruleset.fanout_rules):
+                alerts.append((finding.rule, finding.rule_id))
+        for rule, rule_id in alerts:
+            self._hit(("network", rule, rule_id), network_monitor.alert_key(rule, remote_ip, remote_port, local_port, exe), now)
+
+    def finish(self) -> None:
+        if self.aggregator is not None:
+            for summary in self.aggregator.flush(float("inf")):
+                self.alerts[self._rows[summary[0]]] += 1
+
+    def report(self) -> List[dict]:
+        return [{"monitor": row[0], "rule": row[1], "rule_id": row[2],
+                 "hits": hits, "alerts": self.alerts[row]}
+                for row, hits in sorted(self.hits.items(), key=lambda item: (-item[1], item[0]))]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded observations against a rules file")
+    parser.add_argument("recordings", nargs="+", help="files written by the recorder (record_file)")
+    parser.add_argument("--rules", default="rules/rules.json")
+    parser.add_argument("--window", type=float, default=60, help="alert_dedup_window to model, 0 = off")
+    parser.add_argument("--enrichment-db", help="enrichment database for enrichment_rules (enrichment_db)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.rules) as f:
+        rules = json.load(f)
+    replay = Replay(rules, args.window, enrichment_db=args.enrichment_db)
+    for pattern, error in replay.invalid:
+        print(f"invalid rule {pattern}: {error}", file=sys.stderr)
+    started = time.perf_counter()
+    for path in args.recordings:
+        replay.feed(recorder.read(path))
+    replay.finish()
+    elapsed = time.perf_counter() - started
+    rows = replay.report()
+    total = sum(replay.records.values())
+
+    if args.json:
+        print(json.dumps({"records": dict(replay.records), "elapsed_s": round(elapsed, 3),
+                          "span_s": (replay.last - replay.first) if total else 0, "rules": rows}, indent=2))
+        return 0
+    span = (replay.last - replay.first) / 3600 if total else 0
+    print(f"{total} records ({span:.1f} h recorded) replayed in {elapsed:.2f}s "
+          f"({total / elapsed if elapsed > 0 else 0:.0f} records/s)")
+    print(f"{'monitor':8s} {'rule':18s} {'hits':>9s} {'alerts':>8s}  rule_id")
+    for row in rows:
+        print(f"{row['monitor']:8s} {row['rule']:18s} {row['hits']:>9d} {row['alerts']:>8d}  {row['rule_id']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,53 +1,321 @@
 import json
+import os
 import re
+from collections import namedtuple
 from pathlib import Path
+from typing import List, Optional, Tuple
 from agent import alerter
+from agent.aho_corasick import KeywordAutomaton
 
 RULES = {
     "watched_files": [],
     "suspicious_processes": [],
     "suspicious_parents": [],
     "cmdline_keywords": [],
-    "regex": []
+    "regex": [],
+    "lineage_rules": [],
+    "beacon_rules": [],
+    "fanout_rules": [],
+    "enrichment_rules": []
 }
 
+Match = namedtuple("Match", ["rule", "rule_id", "reason"])
+LineageRule = namedtuple("LineageRule", ["rule_id", "chain", "text"])
+BeaconRule = namedtuple("BeaconRule", ["rule_id", "min_connections", "max_jitter",
+                                       "min_interval", "max_interval", "exclude"])
+FanoutRule = namedtuple("FanoutRule", ["rule_id", "window", "min_destinations", "exclude"])
+EnrichmentRule = namedtuple("EnrichmentRule", ["rule_id", "asns", "countries", "tags", "exclude"])
+
+# Элемент цепочки "..." - любое число промежуточных предков (в том числе ноль).
+ANY_DEPTH = "..."
+
+# Обратные ссылки нельзя склеивать в общее выражение: номера групп сдвигаются.
+_BACKREF = re.compile(r"\\[1-9]|\(\?P=")
+
+
+def _entry(item, field: str) -> Tuple[str, str]:
+    if isinstance(item, dict):
+        value = item[field]
+        return str(item.get("id", value)), value
+    return item, item
+
+
+def _bounded(text: str, keyword: str, end: int) -> bool:
+    # Ключевое слово должно стоять отдельным словом: "nc" не совпадает с "sync".
+    start = end - len(keyword) + 1
+    if keyword[0].isalnum() and start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+        return False
+    after = end + 1
+    if keyword[-1].isalnum() and after < len(text) and (text[after].isalnum() or text[after] == "_"):
+        return False
+    return True
+
+
+def _basename(path: str) -> str:
+    return path.rsplit("/", 1)[-1].lower()
+
+
+def _compile_chain(item) -> LineageRule:
+    # ["nginx", "...", "sh|bash", "nc"]: цепочка от предка к самому процессу,
+    # "|" - альтернативы для одного звена.
+    if isinstance(item, dict):
+        steps = item["chain"]
+        rule_id = str(item.get("id", " → ".join(steps)))
+    else:
+        steps = item
+        rule_id = " → ".join(steps)
+    if not steps or steps[-1] == ANY_DEPTH:
+        raise ValueError("цепочка должна заканчиваться именем процесса")
+    chain = tuple(ANY_DEPTH if step == ANY_DEPTH else frozenset(n.strip().lower() for n in step.split("|"))
+                  for step in steps)
+    return LineageRule(rule_id, chain, " → ".join(steps))
+
+
+def _beacon_rule(item: dict) -> BeaconRule:
+    # Периодический маяк: не меньше min_connections новых соединений с одной
+    # точкой (exe, IP, порт) с интервалом min_interval..max_interval секунд и
+    # разбросом интервалов не больше max_jitter (коэффициент вариации).
+    rule = BeaconRule(str(item["id"]), int(item.get("min_connections", 8)),
+                      float(item.get("max_jitter", 0.1)), float(item.get("min_interval", 10)),
+                      float(item.get("max_interval", 3600)), frozenset(item.get("exclude_exes", [])))
+    if rule.min_connections < 3 or rule.min_interval > rule.max_interval:
+        raise ValueError("нужно min_connections >= 3 и min_interval <= max_interval")
+    return rule
+
+
+def _fanout_rule(item: dict) -> FanoutRule:
+    # Веерные соединения: один исполняемый файл за window секунд открыл
+    # соединения с min_destinations разными адресами (IP, порт).
+    rule = FanoutRule(str(item["id"]), float(item.get("window", 60)),
+                      int(item.get("min_destinations", 100)), frozenset(item.get("exclude_exes", [])))
+    if rule.window <= 0 or rule.min_destinations < 2:
+        raise ValueError("нужно window > 0 и min_destinations >= 2")
+    return rule
+
+
+def _enrichment_rule(item: dict) -> EnrichmentRule:
+    # Адрес из локальной базы обогащения: каждое заданное поле должно
+    # совпасть хотя бы с одним значением из списка.
+    asns = frozenset(int(str(asn).upper().replace("AS", "", 1)) for asn in item.get("asns", []))
+    rule = EnrichmentRule(str(item["id"]), asns, frozenset(c.upper() for c in item.get("countries", [])),
+                          frozenset(t.lower() for t in item.get("tags", [])), frozenset(item.get("exclude_exes", [])))
+    if not (rule.asns or rule.countries or rule.tags):
+        raise ValueError("нужно хотя бы одно из asns, countries, tags")
+    return rule
+
+
+def _chain_matches(chain: tuple, lineage: tuple) -> bool:
+    # Сопоставление с конца: последнее звено - сам процесс.
+    def match(ci: int, li: int) -> bool:
+        if ci < 0:
+            return True
+        step = chain[ci]
+        if step is ANY_DEPTH:
+            return any(match(ci - 1, k) for k in range(li, -2, -1))
+        if li < 0 or not step & lineage[li]:
+            return False
+        return match(ci - 1, li - 1)
+    return match(len(chain) - 1, len(lineage) - 1)
+
+
+class Ruleset:
+    # Неизменяемый скомпилированный набор правил. При перезагрузке строится
+    # новый объект и целиком подменяет старый.
+
+    __slots__ = ("watched_files", "suspicious_processes", "suspicious_parents",
+                 "keyword_ids", "keywords", "regex_ids", "regexes", "combined_regex",
+                 "uncombined", "lineage_rules", "lineage_index", "beacon_rules", "fanout_rules",
+                 "enrichment_rules", "invalid", "invalid_rules")
+
+    def __init__(self, rules: dict):
+        self.invalid: List[Tuple[str, str]] = []
+        self.invalid_rules: List[Tuple[str, str]] = []
+        self.watched_files = tuple(rules.get("watched_files", []))
+        self.suspicious_processes = frozenset(p.lower() for p in rules.get("suspicious_processes", []))
+        self.suspicious_parents = frozenset(p.lower() for p in rules.get("suspicious_parents", []))
+
+        keywords = [_entry(item, "keyword") for item in rules.get("cmdline_keywords", [])]
+        self.keyword_ids = tuple(rule_id for rule_id, _ in keywords)
+        self.keywords = KeywordAutomaton(keyword.lower() for _, keyword in keywords)
+
+        regex_ids, regexes, combinable = [], [], []
+        for item in rules.get("regex", []):
+            rule_id, pattern = _entry(item, "pattern")
+            try:
+                compiled = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                self.invalid.append((pattern, str(e)))
+                continue
+            regex_ids.append(rule_id)
+            regexes.append(compiled)
+            combinable.append(not _BACKREF.search(pattern))
+        self.regex_ids = tuple(regex_ids)
+        self.regexes = tuple(regexes)
+
+        self.combined_regex = None
+        if any(combinable):
+            joined = "|".join(f"(?:{rx.pattern})" for rx, ok in zip(regexes, combinable) if ok)
+            try:
+                self.combined_regex = re.compile(joined, re.IGNORECASE)
+            except re.error:
+                combinable = [False] * len(regexes)
+        self.uncombined = tuple(rx for rx, ok in zip(regexes, combinable) if not ok)
+
+        self.lineage_rules = self._compile(rules, "lineage_rules", _compile_chain)
+        index = {}
+        for rule in self.lineage_rules:
+            # Индекс по имени самого процесса: цепочки проверяются только у подходящих.
+            for name in rule.chain[-1]:
+                index.setdefault(name, []).append(rule)
+        self.lineage_index = {name: tuple(rules) for name, rules in index.items()}
+        self.beacon_rules = self._compile(rules, "beacon_rules", _beacon_rule)
+        self.fanout_rules = self._compile(rules, "fanout_rules", _fanout_rule)
+        self.enrichment_rules = self._compile(rules, "enrichment_rules", _enrichment_rule)
+
+    def _compile(self, rules: dict, section: str, compile_rule) -> tuple:
+        compiled = []
+        for item in rules.get(section, []):
+            try:
+                compiled.append(compile_rule(item))
+            except (KeyError, TypeError, ValueError) as e:
+                self.invalid_rules.append((json.dumps(item, ensure_ascii=False), str(e)))
+        return tuple(compiled)
+
+    def match_keywords(self, cmdline: str, first_only: bool = False) -> List[str]:
+        text = cmdline.lower()
+        keywords = self.keywords.keywords
+        found = set()
+        for end, index in self.keywords.matches(text):
+            if index not in found and _bounded(text, keywords[index], end):
+                found.add(index)
+                if first_only:
+                    break
+        return [self.keyword_ids[i] for i in sorted(found)]
+
+    def has_regex_match(self, cmdline: str) -> bool:
+        if self.combined_regex is not None and self.combined_regex.search(cmdline):
+            return True
+        return any(rx.search(cmdline) for rx in self.uncombined)
+
+    def match_regex(self, cmdline: str) -> List[str]:
+        if not self.has_regex_match(cmdline):
+            return []
+        return [rule_id for rule_id, rx in zip(self.regex_ids, self.regexes) if rx.search(cmdline)]
+
+    def match_lineage(self, lineage: tuple) -> List[LineageRule]:
+        if not lineage or not self.lineage_index:
+            return []
+        candidates = []
+        for name in lineage[-1]:
+            for rule in self.lineage_index.get(name, ()):
+                if rule not in candidates:
+                    candidates.append(rule)
+        return [rule for rule in candidates if _chain_matches(rule.chain, lineage)]
+
+    def match_enrichment(self, info, exe: str) -> List[str]:
+        matched = []
+        for rule in self.enrichment_rules:
+            if exe in rule.exclude:
+                continue
+            if rule.asns and info.asn not in rule.asns:
+                continue
+            if rule.countries and info.country not in rule.countries:
+                continue
+            if rule.tags and rule.tags.isdisjoint(info.tags):
+                continue
+            matched.append(rule.rule_id)
+        return matched
+
+    def evaluate_process(self, exe: str, parent_name: str, cmdline: str, lineage: tuple = ()) -> Tuple[Match, ...]:
+        matches = []
+        argv0 = cmdline.split(" ", 1)[0] if cmdline else ""
+        names = {_basename(exe or ""), _basename(argv0)} - {""}
+        parent = parent_name.lower()
+        if parent in self.suspicious_parents:
+            for name in sorted(names & self.suspicious_processes):
+                matches.append(Match("suspicious_parent", name, f"`{name}` запущен из `{parent_name}`"))
+        for rule_id in self.match_keywords(cmdline):
+            matches.append(Match("cmdline_keyword", rule_id, f"ключевое слово `{rule_id}`"))
+        for rule_id in self.match_regex(cmdline):
+            matches.append(Match("regex", rule_id, f"регулярное выражение `{rule_id}`"))
+        for rule in self.match_lineage(lineage):
+            matches.append(Match("lineage", rule.rule_id, f"цепочка `{rule.text}`"))
+        return tuple(matches)
+
+
+RULESET = Ruleset(RULES)
+RULES_FILE: Optional[str] = None
+RULES_MTIME: Optional[int] = None
+GENERATION = 0
+
+
+def _file_mtime(rules_file: str) -> Optional[int]:
+    try:
+        return os.stat(rules_file).st_mtime_ns
+    except OSError:
+        return None
+
+
 def load_rules(rules_file: str) -> dict:
-    global RULES
+    global RULES, RULESET, RULES_FILE, RULES_MTIME, GENERATION
+    mtime = _file_mtime(rules_file)
     try:
         with open(rules_file, "r") as f:
-            RULES = json.load(f)
+            rules = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError) as e:
         alerter.alert(f"Ошибка загрузки правил: {e}", level="ERROR")
-        RULES = {
+        rules = {
             "watched_files": [],
             "suspicious_processes": [],
             "suspicious_parents": [],
             "cmdline_keywords": [],
             "regex": []
         }
+    ruleset = Ruleset(rules)
+    for pattern, error in ruleset.invalid:
+        alerter.alert(f"Некорректное регулярное выражение {pattern}: {error}", level="ERROR")
+    for rule, error in ruleset.invalid_rules:
+        alerter.alert(f"Некорректное правило {rule}: {error}", level="ERROR")
+    RULES, RULESET = rules, ruleset
+    RULES_FILE, RULES_MTIME = str(Path(rules_file)), mtime
+    GENERATION += 1
     return RULES
 
+
+def reload_if_changed() -> bool:
+    if RULES_FILE is None:
+        return False
+    mtime = _file_mtime(RULES_FILE)
+    if mtime is None or mtime == RULES_MTIME:
+        return False
+    load_rules(RULES_FILE)
+    alerter.alert(f"Правила перезагружены из {RULES_FILE}")
+    return True
+
+
 def get_watched_files() -> list:
-    return RULES.get("watched_files", [])
+    return list(RULESET.watched_files)
 
 def is_suspicious_process(process_name: str) -> bool:
-    return process_name.lower() in [p.lower() for p in RULES.get("suspicious_processes", [])]
+    return process_name.lower() in RULESET.suspicious_processes
 
 def is_suspicious_parent(parent_name: str) -> bool:
-    return parent_name.lower() in [p.lower() for p in RULES.get("suspicious_parents", [])]
+    return parent_name.lower() in RULESET.suspicious_parents
 
 def check_cmdline_keywords(cmdline: str) -> bool:
-    cmdline = cmdline.lower()
-    for keyword in RULES.get("cmdline_keywords", []):
-        if keyword.lower() in cmdline:
-            return True
-    return False
+    return bool(RULESET.match_keywords(cmdline, first_only=True))
 
 def check_regex(cmdline: str) -> bool:
-    for pattern in RULES.get("regex", []):
-        try:
-            if re.search(pattern, cmdline, re.IGNORECASE):
-                return True
-        except re.error as e:
-            alerter.alert(f"Некорректное регулярное выражение {pattern}: {e}", level="ERROR")
-    return False
+    return RULESET.has_regex_match(cmdline)
+
+def match_cmdline_keywords(cmdline: str) -> List[str]:
+    return RULESET.match_keywords(cmdline)
+
+def match_regex(cmdline: str) -> List[str]:
+    return RULESET.match_regex(cmdline)
+
+def evaluate_process(exe: str, parent_name: str, cmdline: str, lineage: tuple = ()) -> Tuple[Match, ...]:
+    return RULESET.evaluate_process(exe, parent_name, cmdline, lineage)
+
+def has_lineage_rules() -> bool:
+    return bool(RULESET.lineage_rules)
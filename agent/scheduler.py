@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+class Task:
+    __slots__ = ("name", "func", "interval", "jitter", "next_run", "running",
+                 "runs", "skipped", "overruns", "errors", "last_duration", "max_duration",
+                 "last_cpu", "cpu_time")
+
+    def __init__(self, name: str, func: Callable[[], None], interval: float, jitter: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = 0.0
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.last_cpu = 0.0
+        self.cpu_time = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "overruns": self.overruns,
+            "errors": self.errors,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "last_cpu": self.last_cpu,
+            "cpu_time": self.cpu_time,
+        }
+
+
+class Scheduler:
+    # Один поток держит кучу (время запуска, задача) и отдаёт созревшие
+    # задачи небольшому пулу. Задача, предыдущий проход которой ещё идёт,
+    # пропускается; проход дольше интервала считается перерасходом.
+    # Источники событий (inotify, netlink) крутятся в своих потоках через
+    # add_loop() и проверяют флаг остановки после каждого ожидания.
+
+    def __init__(self, workers: int = 3,
+                 on_overrun: Optional[Callable[[str, float, float], None]] = None,
+                 on_error: Optional[Callable[[str, Exception], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.workers = workers
+        self.on_overrun = on_overrun
+        self.on_error = on_error
+        self.clock = clock
+        self.tasks: Dict[str, Task] = {}
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loops: List[threading.Thread] = []
+        self._loop_funcs: List[tuple] = []
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _delay(self, task: Task) -> float:
+        if not task.jitter:
+            return task.interval
+        spread = task.interval * task.jitter
+        return max(0.0, task.interval + random.uniform(-spread, spread))
+
+    def add(self, name: str, func: Callable[[], None], interval: float,
+            jitter: float = 0.0, initial_delay: Optional[float] = None) -> Task:
+        task = Task(name, func, interval, jitter)
+        if initial_delay is None:
+            initial_delay = random.uniform(0, interval * jitter) if jitter else 0.0
+        task.next_run = self.clock() + initial_delay
+        with self._cond:
+            self.tasks[name] = task
+            heapq.heappush(self._heap, (task.next_run, next(self._seq), task))
+            self._cond.notify()
+        return task
+
+    def set_interval(self, name: str, interval: float) -> None:
+        # Новый интервал действует сразу: если следующий запуск по новому
+        # интервалу раньше запланированного, он переносится.
+        with self._cond:
+            task = self.tasks[name]
+            previous, task.interval = task.interval, interval
+            next_run = max(self.clock(), task.next_run - previous + interval)
+            if next_run < task.next_run:
+                task.next_run = next_run
+                heapq.heappush(self._heap, (next_run, next(self._seq), task))
+                self._cond.notify()
+
+    def add_loop(self, name: str, func: Callable[[float], None], timeout: float = 1.0) -> None:
+        # func(timeout) должна блокироваться не дольше timeout.
+        self._loop_funcs.append((name, func, timeout))
+        if self.running:
+            self._start_loop(name, func, timeout)
+
+    def _start_loop(self, name: str, func: Callable[[float], None], timeout: float) -> None:
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    func(timeout)
+                except Exception as e:
+                    self._report_error(name, e)
+                    self._stop.wait(timeout)
+        thread = threading.Thread(target=loop, name=f"loop-{name}", daemon=True)
+        thread.start()
+        self._loops.append(thread)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan")
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        for name, func, timeout in self._loop_funcs:
+            self._start_loop(name, func, timeout)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        deadline = time.monotonic() + timeout
+        threads = ([self._thread] if self._thread is not None else []) + self._loops
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if self._pool is not None:
+            # Уже идущие проходы не прерываются, новые не запускаются.
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+        self._pool = None
+        self._loops = []
+
+    def stats(self) -> dict:
+        return {name: task.stats() for name, task in self.tasks.items()}
+
+    def _report_error(self, name: str, error: Exception) -> None:
+        if self.on_error is not None:
+            self.on_error(name, error)
+
+    def _run(self) -> None:
+        pool = self._pool
+        while not self._stop.is_set():
+            with self._cond:
+                now = self.clock()
+                if not self._heap or self._heap[0][0] > now:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+                scheduled, _, task = heapq.heappop(self._heap)
+                if scheduled != task.next_run:
+                    # Запись осталась от перенесённого запуска.
+                    continue
+                # Считаем от запланированного времени, чтобы интервал не плыл;
+                # пропущенные из-за долгого прохода запуски не копятся.
+                task.next_run = max(scheduled + self._delay(task), now)
+                heapq.heappush(self._heap, (task.next_run, next(self._seq), task))
+                if task.running:
+                    task.skipped += 1
+                    continue
+                task.running = True
+            try:
+                pool.submit(self._execute, task)
+            except RuntimeError:
+                task.running = False
+                return
+
+    def _execute(self, task: Task) -> None:
+        started = self.clock()
+        # CPU только этого потока: сколько стоил сам проход, без соседних задач.
+        cpu_started = time.thread_time()
+        try:
+            task.func()
+        except Exception as e:
+            task.errors += 1
+            self._report_error(task.name, e)
+        finally:
+            duration = self.clock() - started
+            task.last_cpu = time.thread_time() - cpu_started
+            task.cpu_time += task.last_cpu
+            task.runs += 1
+            task.last_duration = duration
+            task.max_duration = max(task.max_duration, duration)
+            task.running = False
+        if duration > task.interval:
+            task.overruns += 1
+            if self.on_overrun is not None:
+                self.on_overrun(task.name, duration, task.interval)
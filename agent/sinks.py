@@ -0,0 +1,307 @@
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import requests
+
+from agent import collector
+from agent.dispatcher import Dispatcher, RetryAfter
+from agent.events import Event, to_dict
+from agent.spool import Spool
+
+SYSLOG_FACILITY = 4  # auth
+SYSLOG_SEVERITY = {"CRITICAL": 2, "ERROR": 3, "WARNING": 4, "INFO": 6, "DEBUG": 7}
+
+
+def encode(event: Event) -> str:
+    return json.dumps(to_dict(event), ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class Sink:
+    # Каждый приёмник работает со своей очередью и потоком доставки:
+    # медленный webhook не задерживает запись в файл и наоборот.
+    # Наследники реализуют write(batch).
+
+    def __init__(self, name: str, queue_size: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 1.0, rate: float = 0.0, max_retries: int = 3,
+                 on_error=None):
+        self.name = name
+        self.dispatcher = Dispatcher(
+            self.write,
+            name=f"sink-{name}",
+            maxsize=queue_size,
+            batch_size=batch_size,
+            batch_interval=flush_interval,
+            rate=rate,
+            max_retries=max_retries,
+            on_error=on_error,
+        )
+
+    def put(self, event: Event) -> bool:
+        return self.dispatcher.put(event)
+
+    def write(self, batch: List[Event]) -> None:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        self.dispatcher.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.dispatcher.stop(timeout)
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return self.dispatcher.stats()
+
+
+class JsonLinesSink(Sink):
+    # Буфер сбрасывается, когда набралось batch_size событий или прошло
+    # flush_interval секунд; каждая пачка - один write() в файл.
+
+    def __init__(self, path, fsync: bool = False, **kwargs):
+        self.path = Path(path)
+        self.fsync = fsync
+        self._file = None
+        super().__init__(kwargs.pop("name", "jsonl"), **kwargs)
+
+    def write(self, batch: List[Event]) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(encode(event) + "\n" for event in batch))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SyslogSink(Sink):
+    # RFC 3164 поверх локального сокета (/dev/log), тело - JSON события.
+
+    def __init__(self, address: str = "/dev/log", facility: int = SYSLOG_FACILITY,
+                 tag: str = "secmon", **kwargs):
+        self.address = address
+        self.facility = facility
+        self.tag = tag
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        super().__init__(kwargs.pop("name", "syslog"), **kwargs)
+
+    def format(self, event: Event) -> bytes:
+        priority = self.facility * 8 + SYSLOG_SEVERITY.get(event.level, 6)
+        return f"<{priority}>{self.tag}[{os.getpid()}]: {encode(event)}".encode("utf-8")
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def write(self, batch: List[Event]) -> None:
+        with self._lock:
+            if self._sock is None:
+                self._sock = self._connect()
+            try:
+                for event in batch:
+                    self._sock.send(self.format(event))
+            except OSError:
+                # syslogd мог перезапуститься: переподключимся при повторе.
+                self._sock.close()
+                self._sock = None
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+
+class WebhookSink(Sink):
+    # POST пачки событий JSON-массивом; 429 учитывает Retry-After.
+
+    def __init__(self, url: str, headers: Optional[dict] = None, timeout: float = 5.0, **kwargs):
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.session = requests.Session()
+        super().__init__(kwargs.pop("name", "webhook"), **kwargs)
+
+    def write(self, batch: List[Event]) -> None:
+        body = "[" + ",".join(encode(event) for event in batch) + "]"
+        headers = {"Content-Type": "application/json", **self.headers}
+        response = self.session.post(self.url, data=body.encode("utf-8"), headers=headers, timeout=self.timeout)
+        if response.status_code == 429:
+            try:
+                delay = float(response.headers.get("Retry-After", 1))
+            except ValueError:
+                delay = 1
+            raise RetryAfter(delay, f"webhook rate limit: {response.status_code}")
+        if response.status_code >= 300:
+            raise RuntimeError(f"webhook error {response.status_code}: {response.text[:200]}")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class CollectorSink(Sink):
+    # Пачки событий на центральный коллектор (agent.collector) по одному
+    # постоянному соединению: zlib-кадр с номером, ожидание подтверждения.
+    # Если коллектор недоступен или не ответил за timeout, пачка уходит в
+    # ограниченный дисковый буфер, который досылается по порядку, как
+    # только связь восстановится. Доставка "хотя бы один раз": пачка,
+    # подтверждение которой потерялось, будет отправлена повторно. После
+    # неудачи новые пачки до retry_interval пишутся сразу в буфер, не ожидая
+    # таймаута соединения на каждой.
+
+    def __init__(self, address: str, spool_dir: str = "spool", spool_max_bytes: int = 64 * 1024 * 1024,
+                 timeout: float = 5.0, retry_interval: float = 5.0, compresslevel: int = 6,
+                 clock: Callable[[], float] = time.monotonic, **kwargs):
+        self.address = address
+        self.clock = clock
+        self._retry_at = 0.0
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.compresslevel = compresslevel
+        self.spool = Spool(spool_dir, spool_max_bytes)
+        self.spooled = 0
+        self.errors = 0
+        self._sock: Optional[socket.socket] = None
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._retry_thread: Optional[threading.Thread] = None
+        kwargs.setdefault("batch_size", 500)
+        kwargs.setdefault("max_retries", 0)
+        super().__init__(kwargs.pop("name", "collector"), **kwargs)
+
+    def _connect(self) -> socket.socket:
+        family, addr = collector.parse_address(self.address)
+        if family == socket.AF_UNIX:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(addr)
+            except OSError:
+                sock.close()
+                raise
+        else:
+            sock = socket.create_connection(addr, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _recv_ack(self, sock: socket.socket) -> tuple:
+        data = b""
+        while len(data) < collector.ACK.size:
+            chunk = sock.recv(collector.ACK.size - len(data))
+            if not chunk:
+                raise ConnectionError("коллектор закрыл соединение")
+            data += chunk
+        return collector.ACK.unpack(data)
+
+    def _send(self, payload: bytes) -> None:
+        if self._sock is None:
+            self._sock = self._connect()
+        self._seq += 1
+        try:
+            self._sock.sendall(collector.pack_frame(self._seq, payload))
+            seq, _ = self._recv_ack(self._sock)
+            if seq != self._seq:
+                raise ConnectionError(f"подтверждение пачки {seq} вместо {self._seq}")
+        except OSError:
+            self._disconnect()
+            raise
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _drain_spool(self) -> bool:
+        # Сначала старые пачки: порядок событий сохраняется.
+        while True:
+            entry = self.spool.peek()
+            if entry is None:
+                return True
+            name, payload = entry
+            try:
+                self._send(payload)
+            except OSError:
+                self._failed()
+                return False
+            self.spool.pop(name)
+
+    def _failed(self) -> None:
+        self.errors += 1
+        self._retry_at = self.clock() + self.retry_interval
+
+    def write(self, batch: List[Event]) -> None:
+        data = "".join(encode(event) + "\n" for event in batch).encode("utf-8")
+        payload = zlib.compress(data, self.compresslevel)
+        with self._lock:
+            if self.clock() >= self._retry_at and self._drain_spool():
+                try:
+                    self._send(payload)
+                    return
+                except OSError:
+                    self._failed()
+            self.spool.push(payload)
+            self.spooled += len(batch)
+
+    def _retry_loop(self) -> None:
+        while not self._stop.wait(self.retry_interval):
+            if len(self.spool):
+                with self._lock:
+                    self._drain_spool()
+
+    def start(self) -> None:
+        super().start()
+        if self._retry_thread is None:
+            self._stop.clear()
+            self._retry_thread = threading.Thread(target=self._retry_loop, name=f"sink-{self.name}-retry", daemon=True)
+            self._retry_thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._retry_thread is not None:
+            self._retry_thread.join(self.timeout)
+            self._retry_thread = None
+        with self._lock:
+            self._disconnect()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(spooled=self.spooled, spool_depth=len(self.spool), spool_bytes=self.spool.bytes,
+                     spool_dropped=self.spool.dropped, errors=self.errors)
+        return stats
+
+
+SINK_TYPES = {
+    "jsonl": JsonLinesSink,
+    "syslog": SyslogSink,
+    "webhook": WebhookSink,
+    "collector": CollectorSink,
+}
+
+
+def create_sink(options: dict, on_error=None) -> Sink:
+    options = dict(options)
+    kind = options.pop("type", None)
+    if kind not in SINK_TYPES:
+        raise ValueError(f"Unknown sink type: {kind}")
+    return SINK_TYPES[kind](on_error=on_error, **options)
@@ -0,0 +1,168 @@
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+from agent import proc_cache
+from agent.proc_cache import ProcInfo
+from agent.proc_events import EXEC, EXIT, ProcEvent
+from agent.proc_net import ProcNetReader
+
+INTERVAL = 3.0
+# Снимок моложе MAX_AGE переиспользуется, старше - мониторы собирают новый сами.
+MAX_AGE = INTERVAL * 1.5
+
+
+class Snapshot:
+    # Неизменяемый срез системы за один тик: процессы (ProcInfo) и их сокеты.
+    # Все мониторы, получившие один снимок, видят одно и то же состояние.
+
+    __slots__ = ("tick", "timestamp", "processes", "connections", "pids")
+
+    def __init__(self, tick: int, timestamp: float, processes: Dict[int, ProcInfo], connections: Tuple,
+                 pids: Optional[frozenset] = None):
+        self.tick = tick
+        self.timestamp = timestamp
+        self.processes = MappingProxyType(processes)
+        self.connections = connections
+        # Все живые PID, включая процессы, которые не удалось прочитать.
+        self.pids = frozenset(processes) if pids is None else pids
+
+    def __len__(self) -> int:
+        return len(self.processes)
+
+    def process(self, pid: int) -> Optional[ProcInfo]:
+        return self.processes.get(pid)
+
+
+class SnapshotCollector:
+    # Один проход за тик: список PID и их идентичность (starttime из /proc/<pid>/stat)
+    # считываются один раз и используются и для процессов, и для поиска
+    # владельцев сокетов. Полностью читаются только новые процессы.
+
+    def __init__(self, reader: Optional[ProcNetReader] = None, sockets: bool = True,
+                 clock=time.monotonic):
+        self.reader = reader
+        self.sockets = sockets
+        self.clock = clock
+        self.tick = 0
+        self.latest: Optional[Snapshot] = None
+        self._procs: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _scan(self) -> Dict[int, Optional[int]]:
+        if self.reader is not None:
+            return self.reader.scan_pids()
+        return dict.fromkeys(psutil.pids())
+
+    def _info(self, pid: int, ident: Optional[int]) -> Optional[ProcInfo]:
+        entry = self._procs.get(pid)
+        if entry is not None and ident is not None and entry[0] == ident:
+            return entry[1]
+        try:
+            info = proc_cache.get(pid)
+        except psutil.NoSuchProcess:
+            return None
+        except psutil.AccessDenied:
+            # Чужие процессы без root: не пытаемся читать их на каждом тике.
+            info = None
+        self._procs[pid] = (ident, info)
+        return info
+
+    def collect(self) -> Snapshot:
+        with self._lock:
+            return self._collect()
+
+    def _collect(self) -> Snapshot:
+        pids = self._scan()
+        for pid in list(self._procs):
+            if pid not in pids:
+                del self._procs[pid]
+        processes = {}
+        for pid, ident in pids.items():
+            info = self._info(pid, ident)
+            if info is not None:
+                processes[pid] = info
+        connections: tuple = ()
+        if self.sockets:
+            if self.reader is not None:
+                connections = tuple(self.reader.connections(pids))
+            else:
+                connections = tuple(psutil.net_connections(kind="inet"))
+        self.tick += 1
+        self.latest = Snapshot(self.tick, self.clock(), processes, connections, frozenset(pids))
+        return self.latest
+
+    def get(self, max_age: float = MAX_AGE) -> Snapshot:
+        # Свежий снимок переиспользуется; одновременные вызовы ждут один проход.
+        with self._lock:
+            latest = self.latest
+            if latest is not None and self.clock() - latest.timestamp < max_age:
+                return latest
+            return self._collect()
+
+
+class SnapshotSource:
+    # Источник событий о процессах для режима опроса: разница между
+    # последовательными снимками, без отдельного обхода /proc.
+    name = "snapshot"
+
+    def __init__(self):
+        self.known: Optional[Dict[int, float]] = None
+        self.last_tick = 0
+
+    def poll(self, timeout: float = 0.0) -> List[ProcEvent]:
+        if timeout > 0 and self.known is not None:
+            time.sleep(timeout)
+        snap = get()
+        if snap.tick == self.last_tick:
+            return []
+        self.last_tick = snap.tick
+        current = {pid: info.create_time for pid, info in snap.processes.items()}
+        if self.known is None:
+            self.known = current
+            return []
+        now = time.time()
+        events = []
+        for pid, create_time in self.known.items():
+            if current.get(pid) != create_time:
+                events.append(ProcEvent(EXIT, pid, None, now, None))
+        for pid, create_time in current.items():
+            if self.known.get(pid) != create_time:
+                info = snap.processes[pid]
+                events.append(ProcEvent(EXEC, pid, info.ppid, now, info))
+        self.known = current
+        return events
+
+    def close(self) -> None:
+        pass
+
+
+collector: Optional[SnapshotCollector] = None
+
+
+def init(config_data: dict, reader: Optional[ProcNetReader] = None) -> None:
+    global collector
+    set_interval(config_data.get("snapshot_interval", INTERVAL))
+    collector = SnapshotCollector(reader)
+
+
+def set_interval(interval: float) -> None:
+    global INTERVAL, MAX_AGE
+    INTERVAL = interval
+    MAX_AGE = interval * 1.5
+
+
+def get(max_age: Optional[float] = None) -> Snapshot:
+    global collector
+    if collector is None:
+        collector = SnapshotCollector()
+    return collector.get(MAX_AGE if max_age is None else max_age)
+
+
+def refresh() -> Snapshot:
+    if collector is None:
+        return get(0)
+    return collector.collect()
@@ -0,0 +1,70 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+SUFFIX = ".frame"
+
+
+class Spool:
+    # Ограниченный дисковый буфер готовых к отправке пачек: одна пачка - один
+    # файл с монотонным номером, записанный через временный файл и rename.
+    # Переживает перезапуск агента. При превышении max_bytes удаляются самые
+    # старые пачки - свежие события важнее.
+
+    def __init__(self, path, max_bytes: int = 64 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._entries = []
+        self.bytes = 0
+        for entry in sorted(self.path.glob(f"*{SUFFIX}")):
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            self._entries.append((entry.name, size))
+            self.bytes += size
+        self._next = int(self._entries[-1][0][:-len(SUFFIX)]) + 1 if self._entries else 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def push(self, payload: bytes) -> None:
+        with self._lock:
+            name = f"{self._next:020d}{SUFFIX}"
+            self._next += 1
+            tmp = self.path / f".{name}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, self.path / name)
+            self._entries.append((name, len(payload)))
+            self.bytes += len(payload)
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                self._unlink(0)
+                self.dropped += 1
+
+    def peek(self) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            while self._entries:
+                name = self._entries[0][0]
+                try:
+                    return name, (self.path / name).read_bytes()
+                except FileNotFoundError:
+                    self._unlink(0)
+            return None
+
+    def pop(self, name: str) -> None:
+        with self._lock:
+            if self._entries and self._entries[0][0] == name:
+                self._unlink(0)
+
+    def _unlink(self, index: int) -> None:
+        name, size = self._entries.pop(index)
+        self.bytes -= size
+        try:
+            (self.path / name).unlink()
+        except FileNotFoundError:
+            pass
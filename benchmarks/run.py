@@ -0,0 +1,294 @@
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from pathlib import Path
+
+from agent import alerter, file_monitor, network_monitor, process_monitor, rule_engine
+from agent.proc_net import ProcNetReader
+from benchmarks import synthetic
+
+Case = namedtuple("Case", ["items", "run", "reset"])
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+# Полный размер нагрузки; --scale уменьшает все объёмы пропорционально.
+SOCKETS = 50000
+PROCESSES = 20000
+FILES = 10000
+KEYWORDS = 5000
+REGEXES = 5000
+# Склеенное выражение из 5000 альтернатив стоит ~5 мс на командную строку,
+# поэтому проходы по процессам меряются на 500 выражениях; компиляция - на всех.
+MATCH_REGEXES = 500
+
+
+def _noop():
+    pass
+
+
+def _install_rules(rules: dict) -> None:
+    rule_engine.RULES = rules
+    rule_engine.RULESET = rule_engine.Ruleset(rules)
+    rule_engine.GENERATION += 1
+
+
+def _rules(scale: float, regexes: int = REGEXES) -> dict:
+    return synthetic.make_rules(int(KEYWORDS * scale), int(regexes * scale))
+
+
+class ListSource:
+    # Источник событий, который при каждом poll() отдаёт один и тот же набор.
+    def __init__(self, events):
+        self.events = events
+
+    def poll(self, timeout=0.0):
+        return self.events
+
+    def close(self):
+        pass
+
+
+def bench_rules_compile(workdir: Path, scale: float) -> Case:
+    rules = _rules(scale)
+    return Case(len(rules["cmdline_keywords"]) + len(rules["regex"]),
+                lambda: rule_engine.Ruleset(rules), _noop)
+
+
+def bench_rules_match(workdir: Path, scale: float) -> Case:
+    rules = _rules(scale, MATCH_REGEXES)
+    ruleset = rule_engine.Ruleset(rules)
+    keywords = [item["keyword"] for item in rules["cmdline_keywords"]]
+    processes = synthetic.make_processes(int(PROCESSES * scale), keywords=keywords)
+
+    def run():
+        for info in processes:
+            ruleset.evaluate_process(info.exe, info.parent_name, info.cmdline)
+    return Case(len(processes), run, _noop)
+
+
+def bench_process_scan(workdir: Path, scale: float) -> Case:
+    rules = _rules(scale, MATCH_REGEXES)
+    _install_rules(rules)
+    keywords = [item["keyword"] for item in rules["cmdline_keywords"]]
+    processes = synthetic.make_processes(int(PROCESSES * scale), keywords=keywords)
+    process_monitor.SOURCE = ListSource(synthetic.make_exec_events(processes))
+
+    def reset():
+        process_monitor.verdict_cache.clear()
+    return Case(len(processes), lambda: process_monitor.monitor_processes(0), reset)
+
+
+def _network_setup(workdir: Path, scale: float) -> int:
+    sockets = int(SOCKETS * scale)
+    root = synthetic.make_proc_net(workdir / "proc", sockets=sockets,
+                                   processes=max(1, int(2000 * scale)))
+    network_monitor.proc_net_reader = ProcNetReader(root)
+    network_monitor.BACKEND = "procfs"
+    _install_rules({"network_allow_cidrs": [], "network_deny_cidrs": ["185.0.0.0/8"]})
+    network_monitor.update_classifier()
+    return sockets
+
+
+def bench_proc_net_read(workdir: Path, scale: float) -> Case:
+    sockets = _network_setup(workdir, scale)
+    reader = network_monitor.proc_net_reader
+    reader.connections()
+    return Case(sockets, reader.connections, _noop)
+
+
+def bench_network_scan_cold(workdir: Path, scale: float) -> Case:
+    sockets = _network_setup(workdir, scale)
+
+    def reset():
+        # Все соединения новые: классификация и алерты для каждого.
+        network_monitor.known_conns.clear()
+        network_monitor.proc_net_reader = ProcNetReader(network_monitor.proc_net_reader.root)
+    return Case(sockets, network_monitor.monitor_network, reset)
+
+
+def bench_network_scan_warm(workdir: Path, scale: float) -> Case:
+    sockets = _network_setup(workdir, scale)
+    network_monitor.known_conns.clear()
+    network_monitor.monitor_network()
+    return Case(sockets, network_monitor.monitor_network, _noop)
+
+
+def _file_setup(workdir: Path, scale: float) -> int:
+    count = int(FILES * scale)
+    root = synthetic.make_files(workdir / "files", count=count)
+    file_monitor.init({"file_hash_workers": 4, "file_verify_bytes_per_sec": 0, "file_watch_mode": "poll"})
+    file_monitor.HASH_DB_FILE = workdir / "missing.json"
+    file_monitor.HASH_STORE_FILE = workdir / "hashes.db"
+    file_monitor.store = None
+    file_monitor.WATCH_ENTRIES = [root]
+    file_monitor.WATCHED_FILES = file_monitor.expand_watch_entries([root])
+    return count
+
+
+def bench_file_scan_cold(workdir: Path, scale: float) -> Case:
+    count = _file_setup(workdir, scale)
+
+    def reset():
+        if file_monitor.store is not None:
+            file_monitor.store.close()
+            file_monitor.store = None
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{file_monitor.HASH_STORE_FILE}{suffix}").unlink(missing_ok=True)
+    return Case(count, file_monitor.monitor_files, reset)
+
+
+def bench_file_scan_warm(workdir: Path, scale: float) -> Case:
+    count = _file_setup(workdir, scale)
+    file_monitor.monitor_files()
+    return Case(count, file_monitor.monitor_files, _noop)
+
+
+BENCHMARKS = {
+    "rules_compile": bench_rules_compile,
+    "rules_match": bench_rules_match,
+    "process_scan": bench_process_scan,
+    "proc_net_read": bench_proc_net_read,
+    "network_scan_cold": bench_network_scan_cold,
+    "network_scan_warm": bench_network_scan_warm,
+    "file_scan_cold": bench_file_scan_cold,
+    "file_scan_warm": bench_file_scan_warm,
+}
+
+
+def calibrate(rounds: int = 5) -> float:
+    # Эталонная чисто питоновская нагрузка: позволяет сравнивать задержки,
+    # снятые на машинах разной скорости (baseline и CI-раннер).
+    def work():
+        data = {}
+        for i in range(200000):
+            data[str(i)] = i * 3
+        return sorted(data.values(), reverse=True)[:10]
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        work()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def measure(case: Case, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        case.reset()
+        gc.collect()
+        started = time.perf_counter()
+        case.run()
+        timings.append(time.perf_counter() - started)
+    # Пиковую память меряем отдельным проходом: tracemalloc сильно замедляет код.
+    case.reset()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        case.run()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    latency = statistics.median(timings)
+    return {
+        "items": case.items,
+        "latency_s": round(latency, 6),
+        "min_s": round(min(timings), 6),
+        "throughput": round(case.items / latency, 1) if latency > 0 else None,
+        "peak_bytes": peak,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, memory_threshold: float) -> list:
+    # Задержка нормируется на калибровку, память сравнивается как есть.
+    # Сравниваем лучший прогон (min_s): медиана на общих CI-машинах шумит
+    # сильнее порога (rules_compile: медиана 5.2 с при минимуме 3.4 с).
+    speed = results["calibration"] / baseline["calibration"]
+    regressions = []
+    for name, current in results["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or base["items"] != current["items"]:
+            continue
+        expected = base["min_s"] * speed
+        if current["min_s"] > expected * (1 + threshold):
+            regressions.append(f"{name}: latency {current['min_s']:.4f}s > {expected:.4f}s "
+                               f"(+{(current['min_s'] / expected - 1) * 100:.0f}%)")
+        if current["peak_bytes"] > base["peak_bytes"] * (1 + memory_threshold) and current["peak_bytes"] > 1 << 20:
+            regressions.append(f"{name}: peak memory {current['peak_bytes']} > {base['peak_bytes']} "
+                               f"(+{(current['peak_bytes'] / max(base['peak_bytes'], 1) - 1) * 100:.0f}%)")
+    return regressions
+
+
+def run(names, scale: float = 1.0, repeat: int = 3, log=print) -> dict:
+    alerter.init({"alert_methods": [], "alert_dedup_window": 60})
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory(prefix=f"secmon-bench-{name}-") as tmp:
+            alerter.setup_logging(str(Path(tmp) / "bench.log"))
+            case = BENCHMARKS[name](Path(tmp), scale)
+            results[name] = measure(case, repeat)
+            if file_monitor.store is not None:
+                file_monitor.store.close()
+                file_monitor.store = None
+        r = results[name]
+        log(f"{name:20s} {r['items']:>7d} items  {r['latency_s'] * 1000:10.2f} ms  "
+            f"{r['throughput'] or 0:>12.0f} items/s  peak {r['peak_bytes'] / 1048576:8.2f} MiB")
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "calibration": calibrate(),
+        "results": results,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SecMon synthetic benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="workload size multiplier")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.3, help="allowed latency regression (0.3 = +30%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.2, help="allowed peak memory growth")
+    parser.add_argument("--update-baseline", action="store_true", help="write results to --baseline")
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = run(args.names or list(BENCHMARKS), args.scale, args.repeat)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}, skipping comparison")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("scale") != args.scale:
+        print(f"baseline scale {baseline.get('scale')} differs from --scale {args.scale}, skipping comparison")
+        return 0
+    python = ".".join(platform.python_version_tuple()[:2])
+    if not str(baseline.get("python", "")).startswith(python + "."):
+        # Другая версия интерпретатора меняет скорость сильнее любого порога.
+        print(f"baseline recorded on Python {baseline.get('python')}, running {platform.python_version()}, "
+              f"skipping comparison")
+        return 0
+    regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
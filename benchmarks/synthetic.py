@@ -0,0 +1,134 @@
+import os
+import random
+import socket
+import struct
+from pathlib import Path
+from typing import List
+
+from agent.proc_cache import ProcInfo
+from agent.proc_events import EXEC, ProcEvent
+
+# PID выше pid_max: синтетические процессы никогда не совпадут с настоящими.
+PID_BASE = 5_000_000
+
+NET_HEADER = ("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when "
+              "retrnsmt   uid  timeout inode\n")
+
+WORDS = ["worker", "queue", "sync", "backup", "report", "index", "cache", "deploy",
+         "metrics", "export", "import", "daemon", "agent", "shard", "replica", "batch"]
+BINARIES = ["/usr/bin/python3", "/usr/bin/node", "/usr/sbin/nginx", "/usr/bin/java",
+            "/usr/bin/bash", "/usr/lib/postgresql/15/bin/postgres", "/usr/bin/rsync",
+            "/usr/local/bin/app", "/opt/service/bin/service", "/usr/bin/perl"]
+PARENTS = ["systemd", "bash", "sshd", "cron", "nginx", "containerd-shim", "supervisord"]
+
+
+def _hex_v4(ip: str, port: int) -> str:
+    # Формат /proc/net/tcp: адрес в порядке байт хоста (little-endian).
+    packed = socket.inet_aton(ip)
+    return f"{struct.unpack('<I', packed)[0]:08X}:{port:04X}"
+
+
+def _hex_v6(ip: str, port: int) -> str:
+    packed = socket.inet_pton(socket.AF_INET6, ip)
+    words = struct.unpack("<4I", packed)
+    return "".join(f"{word:08X}" for word in words) + f":{port:04X}"
+
+
+def _remote_v4(rng: random.Random, public_ratio: float) -> str:
+    if rng.random() < public_ratio:
+        return f"{rng.choice((8, 34, 52, 93, 104, 151, 185))}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+    return f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+
+def make_proc_net(root, sockets: int = 50000, processes: int = 2000,
+                  public_ratio: float = 0.05, seed: int = 1) -> str:
+    # Дерево в формате /proc: net/{tcp,tcp6,udp,udp6} и fd-симлинки
+    # "socket:[inode]" у процессов. 80% IPv4 TCP, 10% IPv6 TCP, 10% UDP.
+    rng = random.Random(seed)
+    root = Path(root)
+    net = root / "net"
+    net.mkdir(parents=True, exist_ok=True)
+    lines = {"tcp": [], "tcp6": [], "udp": [], "udp6": []}
+    owners = {}
+    for i in range(sockets):
+        inode = 100000 + i
+        pid = PID_BASE + rng.randrange(processes)
+        owners.setdefault(pid, []).append(inode)
+        lport = rng.randrange(1024, 65535)
+        kind = rng.random()
+        if kind < 0.8:
+            table = "tcp"
+            local = _hex_v4(f"10.0.{rng.randrange(256)}.{rng.randrange(1, 255)}", lport)
+            remote = _hex_v4(_remote_v4(rng, public_ratio), rng.choice((443, 80, 5432, 6379, 8080)))
+            state = "01"
+        elif kind < 0.9:
+            table = "tcp6"
+            local = _hex_v6("fd00::10", lport)
+            remote = _hex_v6(f"2001:db8::{rng.randrange(1, 65535):x}", 443)
+            state = "01"
+        else:
+            table = "udp"
+            local = _hex_v4("0.0.0.0", lport)
+            remote = _hex_v4("0.0.0.0", 0)
+            state = "07"
+        n = len(lines[table])
+        lines[table].append(
+            f"{n:4d}: {local} {remote} {state} 00000000:00000000 00:00000000 00000000  1000        0 {inode} 1 0 100 0 0 10 0\n")
+    for table, rows in lines.items():
+        (net / table).write_text(NET_HEADER + "".join(rows))
+    for pid, inodes in owners.items():
+        fd_dir = root / str(pid) / "fd"
+        fd_dir.mkdir(parents=True, exist_ok=True)
+        # Поле 22 stat - starttime, по нему ProcNetReader отличает процессы.
+        (root / str(pid) / "stat").write_text(f"{pid} (worker) S 1 " + "0 " * 17 + f"{pid} 0 0\n")
+        os.symlink("/dev/null", fd_dir / "0")
+        for fd, inode in enumerate(inodes, start=3):
+            os.symlink(f"socket:[{inode}]", fd_dir / str(fd))
+    return str(root)
+
+
+def make_processes(count: int = 20000, suspicious_ratio: float = 0.01,
+                   keywords: List[str] = (), seed: int = 2) -> List[ProcInfo]:
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        exe = rng.choice(BINARIES)
+        args = " ".join(f"--{rng.choice(WORDS)}={rng.randrange(100000)}" for _ in range(rng.randrange(1, 6)))
+        cmdline = f"{exe.rsplit('/', 1)[-1]} {args} job-{i}"
+        if keywords and rng.random() < suspicious_ratio:
+            cmdline += f" {rng.choice(keywords)}"
+        result.append(ProcInfo(PID_BASE + i, PID_BASE, 1_700_000_000.0 + i,
+                               exe.rsplit("/", 1)[-1], exe, cmdline, rng.choice(PARENTS)))
+    return result
+
+
+def make_exec_events(processes: List[ProcInfo]) -> List[ProcEvent]:
+    return [ProcEvent(EXEC, info.pid, info.ppid, 0.0, info) for info in processes]
+
+
+def make_rules(keywords: int = 5000, regexes: int = 5000, seed: int = 3) -> dict:
+    rng = random.Random(seed)
+    return {
+        "watched_files": [],
+        "suspicious_processes": ["nc", "ncat", "socat", "nmap", "python", "perl", "bash"],
+        "suspicious_parents": ["nginx", "apache2", "php-fpm", "sshd"],
+        "cmdline_keywords": [
+            {"id": f"kw-{i}", "keyword": f"{rng.choice(WORDS)}{i}-{rng.choice(WORDS)}"}
+            for i in range(keywords)
+        ],
+        "regex": [
+            {"id": f"rx-{i}", "pattern": rf"{rng.choice(WORDS)}{i}\.(?:evil|c2)\.example/[a-z]+\d{{2,4}}"}
+            for i in range(regexes)
+        ],
+    }
+
+
+def make_files(root, count: int = 10000, size: int = 4096, per_dir: int = 100, seed: int = 4) -> str:
+    rng = random.Random(seed)
+    root = Path(root)
+    for i in range(count):
+        directory = root / f"d{i // per_dir:04d}"
+        if i % per_dir == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{i:05d}.conf").write_bytes(rng.randbytes(size))
+    return str(root)
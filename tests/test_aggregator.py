@@ -0,0 +1,38 @@
+from agent.aggregator import AlertAggregator
+
+def test_repeats_suppressed_within_window():
+    agg = AlertAggregator(window=60, clock=lambda: 0)
+    assert agg.offer(("network", "public_ip", "1.2.3.4"), "first", "WARNING", now=0) == (True, [])
+    for i in range(1, 348):
+        assert agg.offer(("network", "public_ip", "1.2.3.4"), "again", "WARNING", now=i * 0.1) == (False, [])
+    assert agg.offer(("network", "public_ip", "5.6.7.8"), "other", "WARNING", now=1)[0]
+    assert agg.suppressed_total == 347
+
+def test_flush_emits_summary_after_window():
+    agg = AlertAggregator(window=60)
+    key = ("process", "regex", ("nc", "/usr/bin/nc"))
+    agg.offer(key, "first", "WARNING", now=0)
+    agg.offer(key, "again", "WARNING", now=10)
+    agg.offer(("process", "regex", "quiet"), "once", "INFO", now=5)
+    assert agg.flush(now=30) == []
+    summaries = agg.flush(now=61)
+    assert summaries == [(key, 1, 61, "first", "WARNING")]
+    assert len(agg) == 1
+
+def test_new_window_after_expiry_reports_previous():
+    agg = AlertAggregator(window=10)
+    agg.offer("k", "first", "INFO", now=0)
+    agg.offer("k", "again", "INFO", now=1)
+    passed, summaries = agg.offer("k", "later", "INFO", now=12)
+    assert passed
+    assert summaries == [("k", 1, 12, "first", "INFO")]
+
+def test_memory_is_bounded():
+    agg = AlertAggregator(window=60, max_keys=100)
+    agg.offer("hot", "hot", "INFO", now=0)
+    agg.offer("hot", "hot", "INFO", now=0)
+    summaries = []
+    for i in range(1000):
+        summaries.extend(agg.offer(f"ip-{i}", "scan", "INFO", now=1)[1])
+    assert len(agg) == 100
+    assert summaries == [("hot", 1, 1, "hot", "INFO")]
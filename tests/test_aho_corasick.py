@@ -0,0 +1,24 @@
+import random
+import pytest
+from agent.aho_corasick import KeywordAutomaton
+
+def test_find_all_overlapping():
+    automaton = KeywordAutomaton(["he", "she", "his", "hers"])
+    assert automaton.find_all("ushers") == {0, 1, 3}
+    assert automaton.search("ushers") is True
+    assert automaton.search("xyz") is False
+
+def test_empty_keywords():
+    automaton = KeywordAutomaton(["", "nc -e"])
+    assert automaton.find_all("") == set()
+    assert automaton.find_all("nc -e /bin/sh") == {1}
+    assert KeywordAutomaton([]).search("anything") is False
+
+def test_matches_naive_search():
+    rng = random.Random(7)
+    keywords = ["".join(rng.choice("abc ") for _ in range(rng.randint(1, 5))) for _ in range(200)]
+    automaton = KeywordAutomaton(keywords)
+    for _ in range(200):
+        text = "".join(rng.choice("abcd ") for _ in range(rng.randint(0, 40)))
+        expected = {i for i, kw in enumerate(keywords) if kw in text}
+        assert automaton.find_all(text) == expected
@@ -1,4 +1,8 @@
+import json
+import threading
+import time
 import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
 from agent import alerter
 
@@ -26,7 +30,7 @@ def test_init_with_dotenv():
     assert alerter.TG_TOKEN == "env_token"
     assert alerter.TG_CHAT_ID == "env_chat_id"
 
-@patch("requests.post")
+@patch("requests.Session.post")
 def test_send_telegram_alert_success(mock_post):
     mock_post.return_value.status_code = 200
     alerter.init({"telegram_token": "test_token", "telegram_chat_id": "test_chat_id", "alert_methods": ["telegram"]})
@@ -37,7 +41,7 @@ def test_send_telegram_alert_success(mock_post):
         timeout=5
     )
 
-@patch("requests.post")
+@patch("requests.Session.post")
 @patch("agent.alerter.logger")
 def test_send_telegram_alert_failure(mock_logger, mock_post):
     mock_post.return_value.status_code = 400
@@ -52,7 +56,7 @@ def test_alert_log_only(mock_logger):
     alerter.alert("Test message", level="INFO")
     mock_logger.log.assert_called_once()
 
-@patch("requests.post")
+@patch("requests.Session.post")
 @patch("agent.alerter.logger")
 def test_alert_telegram_and_log(mock_logger, mock_post):
     mock_post.return_value.status_code = 200
@@ -65,3 +69,142 @@ def test_alert_telegram_and_log(mock_logger, mock_post):
     alerter.alert("Test message", level="WARNING")
     mock_post.assert_called_once()
     mock_logger.log.assert_called_once()
+
+class TelegramStub(BaseHTTPRequestHandler):
+    requests_seen = []
+    fail_first = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if TelegramStub.fail_first:
+            TelegramStub.fail_first -= 1
+            self.send_response(429)
+            payload = {"ok": False, "parameters": {"retry_after": 0.05}}
+        else:
+            TelegramStub.requests_seen.append((self.path, body))
+            self.send_response(200)
+            payload = {"ok": True}
+        data = json.dumps(payload).encode()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def telegram_stub():
+    TelegramStub.requests_seen = []
+    TelegramStub.fail_first = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    alerter.stop_dispatcher()
+    server.shutdown()
+    server.server_close()
+
+def test_split_messages_respects_limit():
+    messages = ["a" * 3000, "b" * 1000, "c" * 100, "d" * 5000]
+    chunks = alerter.split_messages(messages)
+    assert [len(c) for c in chunks] == [2, 1, 1]
+    assert all(len("\n\n".join(c)) <= alerter.TG_MAX_MESSAGE for c in chunks)
+
+@patch("agent.alerter.logger")
+def test_dispatcher_batches_alerts(mock_logger, telegram_stub):
+    alerter.init({
+        "telegram_token": "test_token",
+        "telegram_chat_id": "42",
+        "alert_methods": ["telegram"],
+        "telegram_api_url": telegram_stub,
+        "telegram_batch_interval": 0.05,
+        "telegram_rate": 0,
+    })
+    alerter.start_dispatcher()
+    for i in range(30):
+        alerter.alert(f"alert {i}")
+    alerter.stop_dispatcher()
+    texts = [body["text"] for _, body in TelegramStub.requests_seen]
+    assert 1 <= len(texts) < 30
+    assert "\n\n".join(texts).split("\n\n") == [f"alert {i}" for i in range(30)]
+    assert TelegramStub.requests_seen[0][0] == "/bottest_token/sendMessage"
+    assert alerter.dispatcher_stats()["sent"] == 30
+
+@patch("agent.alerter.logger")
+def test_dispatcher_retries_after_rate_limit(mock_logger, telegram_stub):
+    TelegramStub.fail_first = 2
+    alerter.init({
+        "telegram_token": "t",
+        "telegram_chat_id": "42",
+        "alert_methods": ["telegram"],
+        "telegram_api_url": telegram_stub,
+        "telegram_batch_interval": 0.05,
+        "telegram_rate": 0,
+    })
+    alerter.start_dispatcher()
+    alerter.alert("port scan")
+    deadline = time.time() + 5
+    while not TelegramStub.requests_seen and time.time() < deadline:
+        time.sleep(0.01)
+    stats = alerter.dispatcher_stats()
+    assert [body["text"] for _, body in TelegramStub.requests_seen] == ["port scan"]
+    assert stats["retries"] == 2 and stats["failed"] == 0
+
+@patch("agent.alerter.logger")
+def test_alert_does_not_block_when_telegram_is_down(mock_logger):
+    alerter.init({
+        "telegram_token": "t",
+        "telegram_chat_id": "42",
+        "alert_methods": ["telegram"],
+        "telegram_queue_size": 5,
+        "telegram_batch_interval": 60,
+    })
+    with patch("requests.Session.post", side_effect=lambda *a, **k: time.sleep(0.5)):
+        alerter.start_dispatcher()
+        started = time.time()
+        for i in range(200):
+            alerter.alert(f"alert {i}")
+        assert time.time() - started < 0.5
+        stats = alerter.dispatcher_stats()
+        assert stats["depth"] == 5
+        assert stats["dropped"] == 195
+        alerter.dispatcher.stop(timeout=0)
+        alerter.dispatcher = None
+
+@patch("agent.alerter.logger")
+def test_alert_storm_is_aggregated(mock_logger):
+    alerter.init({"alert_methods": ["log"], "alert_dedup_window": 60})
+    for i in range(348):
+        alerter.alert(f" Внешнее соединение: 1.2.3.4:{i}\n`PID:` 1", level="WARNING",
+                      monitor="network", rule="public_ip", key="1.2.3.4")
+    alerter.alert("без отпечатка")
+    alerter.alert("без отпечатка")
+    assert mock_logger.log.call_count == 3
+    alerter.flush_aggregated()
+    assert mock_logger.log.call_count == 3
+    alerter.aggregator.flush = lambda: [(("network", "public_ip", "1.2.3.4"), 347, 60.0,
+                                         " Внешнее соединение: 1.2.3.4:0\n`PID:` 1", "WARNING")]
+    alerter.flush_aggregated()
+    mock_logger.log.assert_called_with(30, " Повтор ×347 за 60с:  Внешнее соединение: 1.2.3.4:0")
+
+@patch("agent.alerter.logger")
+def test_alert_dedup_can_be_disabled(mock_logger):
+    alerter.init({"alert_methods": ["log"], "alert_dedup_window": 0})
+    for _ in range(3):
+        alerter.alert("x", monitor="process", rule="regex", key="nc")
+    assert mock_logger.log.call_count == 3
+
+@patch("agent.alerter.logger")
+def test_alert_emits_structured_event(mock_logger, tmp_path):
+    path = tmp_path / "events.jsonl"
+    alerter.init({"alert_methods": ["log"], "event_sinks": [{"type": "jsonl", "path": str(path)}]})
+    alerter.start_dispatcher()
+    alerter.alert(" Подозрительный порт: 4444\n`PID:` 9", level="WARNING", monitor="network",
+                  rule="suspicious_port", key=("/usr/bin/nc", 4444), pid=9, exe="/usr/bin/nc",
+                  addresses={"local": "0.0.0.0:4444"})
+    alerter.stop_dispatcher()
+    event = json.loads(path.read_text())
+    assert event["monitor"] == "network" and event["rule"] == "suspicious_port"
+    assert event["pid"] == 9 and event["addresses"] == {"local": "0.0.0.0:4444"}
+    alerter.init({"alert_methods": ["log"]})
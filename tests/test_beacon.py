@@ -0,0 +1,108 @@
+import random
+
+from agent import beacon, rule_engine
+from agent.beacon import BeaconTracker, CountMinSketch, Fanout, HeavyHitters
+from agent.rule_engine import BeaconRule, FanoutRule
+
+BEACON = BeaconRule("periodic", 5, 0.1, 10, 3600, frozenset())
+FANOUT = FanoutRule("scan", 60, 100, frozenset())
+
+
+def test_count_min_never_underestimates():
+    sketch = CountMinSketch(width=64, depth=4)
+    counts = {}
+    rng = random.Random(1)
+    for _ in range(5000):
+        key = ("/bin/x", f"10.0.0.{rng.randrange(500)}", 443)
+        counts[key] = counts.get(key, 0) + 1
+        sketch.add(key)
+    for key, count in counts.items():
+        assert sketch.estimate(key) >= count
+
+
+def test_heavy_hitters_evicts_smallest():
+    top = HeavyHitters(capacity=2)
+    assert top.offer("a", 5, 0, 100) is not None
+    assert top.offer("b", 1, 0, 100) is not None
+    # Новая точка не обогнала минимум - в таблицу не попадает.
+    assert top.offer("c", 1, 0, 100) is None
+    assert top.offer("c", 2, 1, 100) is not None
+    assert set(top.entries) == {"a", "c"}
+
+
+def test_heavy_hitters_equal_counts_with_unorderable_keys():
+    top = HeavyHitters(capacity=1)
+    top.offer(("/bin/x", "1.1.1.1", 443), 1, 0, 100)
+    top.offer(("/bin/x", "1.1.1.1", None), 1, 0, 100)
+    top.offer(("/bin/x", "1.1.1.1", 443), 1, 0, 100)
+    assert len(top) == 1
+
+
+def test_periodic_connections_detected_once():
+    tracker = BeaconTracker()
+    findings = []
+    for i in range(20):
+        findings += tracker.observe("/tmp/implant", "203.0.113.5", 443, 1000 + i * 60 + (i % 2),
+                                    beacon_rules=(BEACON,))
+    assert len(findings) == 1
+    assert findings[0].rule == "beacon" and findings[0].rule_id == "periodic"
+    assert findings[0].exe == "/tmp/implant"
+
+
+def test_jittered_connections_ignored():
+    tracker = BeaconTracker()
+    rng = random.Random(7)
+    now = 1000.0
+    for _ in range(50):
+        now += rng.uniform(5, 300)
+        assert tracker.observe("/usr/bin/firefox", "203.0.113.5", 443, now, beacon_rules=(BEACON,)) == []
+
+
+def test_beacon_excluded_exe_and_interval_bounds():
+    excluded = BEACON._replace(exclude=frozenset({"/usr/bin/node_exporter"}))
+    tracker = BeaconTracker()
+    for i in range(20):
+        assert tracker.observe("/usr/bin/node_exporter", "10.0.0.1", 9100, i * 15, beacon_rules=(excluded,)) == []
+        # Интервал 2 с меньше min_interval.
+        assert tracker.observe("/bin/fast", "10.0.0.1", 80, i * 2, beacon_rules=(BEACON,)) == []
+
+
+def test_fanout_detected_once_per_window():
+    tracker = BeaconTracker()
+    findings = []
+    for i in range(300):
+        findings += tracker.observe("/usr/bin/nmap", f"10.0.{i // 250}.{i % 250}", 22, 100 + i * 0.1,
+                                    fanout_rules=(FANOUT,))
+    assert [f.rule for f in findings] == ["fanout"]
+    for i in range(300):
+        assert tracker.observe("/usr/bin/curl", "203.0.113.5", 443, 100 + i * 0.1, fanout_rules=(FANOUT,)) == []
+
+
+def test_fanout_estimate_close_to_distinct_count():
+    state = Fanout(0, 4096)
+    for i in range(1000):
+        state.add(("10.0.0.1", i))
+        state.add(("10.0.0.1", i))
+    assert 900 < state.estimate() < 1100
+
+
+def test_memory_bounded():
+    tracker = BeaconTracker(width=256, top_k=64, fanout_max_exes=8)
+    for i in range(20000):
+        tracker.observe(f"/bin/p{i % 50}", f"198.51.{i % 200}.{i % 251}", 443, i,
+                        beacon_rules=(BEACON,), fanout_rules=(FANOUT,))
+    assert len(tracker.top) <= 64
+    assert len(tracker.top._heap) <= 4 * 64 + 1
+    assert len(tracker.fanout) <= 8
+
+
+def test_observe_uses_ruleset(monkeypatch):
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.Ruleset({"beacon_rules": [{"id": "b"}]}))
+    monkeypatch.setattr("agent.beacon.tracker", BeaconTracker())
+    assert beacon.enabled()
+    findings = []
+    for i in range(10):
+        findings += beacon.observe("/tmp/x", "203.0.113.5", 443, i * 30)
+    assert [f.rule_id for f in findings] == ["b"]
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.Ruleset({}))
+    assert not beacon.enabled()
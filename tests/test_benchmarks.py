@@ -0,0 +1,63 @@
+import json
+import pytest
+from benchmarks import run, synthetic
+from agent import alerter, file_monitor, network_monitor, process_monitor, rule_engine
+from agent.proc_net import ProcNetReader
+
+@pytest.fixture
+def isolated(monkeypatch):
+    # Бенчмарки подменяют глобальное состояние модулей; возвращаем его после теста.
+    state = {
+        rule_engine: ["RULES", "RULESET", "GENERATION"],
+        network_monitor: ["proc_net_reader", "BACKEND", "CLASSIFIER", "classifier_generation", "known_conns"],
+        process_monitor: ["SOURCE", "verdict_cache"],
+        file_monitor: ["HASH_DB_FILE", "HASH_STORE_FILE", "store", "WATCH_ENTRIES", "WATCHED_FILES",
+                       "HASH_WORKERS", "hash_pool", "verify_bucket", "WATCH_MODE"],
+        alerter: ["ALERT_METHODS", "aggregator", "handler", "dispatcher", "sinks"],
+    }
+    for module, names in state.items():
+        for name in names:
+            monkeypatch.setattr(module, name, getattr(module, name))
+
+def test_synthetic_proc_tree_is_readable(tmp_path):
+    root = synthetic.make_proc_net(tmp_path / "proc", sockets=300, processes=20)
+    conns = ProcNetReader(root).connections()
+    assert len(conns) == 300
+    assert all(conn.pid >= synthetic.PID_BASE for conn in conns)
+
+def test_synthetic_rules_compile():
+    rules = synthetic.make_rules(keywords=50, regexes=50)
+    ruleset = run.rule_engine.Ruleset(rules)
+    assert not ruleset.invalid
+    processes = synthetic.make_processes(200, suspicious_ratio=1.0,
+                                         keywords=[k["keyword"] for k in rules["cmdline_keywords"]])
+    assert all(ruleset.match_keywords(p.cmdline) for p in processes)
+
+def test_smoke_run_and_compare(tmp_path, isolated):
+    baseline = tmp_path / "baseline.json"
+    assert run.main(["--scale", "0.005", "--repeat", "1", "--baseline", str(baseline), "--update-baseline"]) == 0
+    data = json.loads(baseline.read_text())
+    assert set(data["results"]) == set(run.BENCHMARKS)
+    assert run.main(["--scale", "0.005", "--repeat", "1", "--baseline", str(baseline),
+                     "rules_compile", "file_scan_warm", "--threshold", "100"]) == 0
+
+def test_compare_flags_regressions():
+    baseline = {"calibration": 1.0, "results": {"scan": {"items": 10, "latency_s": 1.0, "min_s": 1.0, "peak_bytes": 10 << 20}}}
+    slower = {"calibration": 1.0, "results": {"scan": {"items": 10, "latency_s": 1.5, "min_s": 1.5, "peak_bytes": 10 << 20}}}
+    slower_machine = {"calibration": 2.0, "results": {"scan": {"items": 10, "latency_s": 1.5, "min_s": 1.5, "peak_bytes": 10 << 20}}}
+    fatter = {"calibration": 1.0, "results": {"scan": {"items": 10, "latency_s": 1.0, "min_s": 1.0, "peak_bytes": 20 << 20}}}
+    assert len(run.compare(slower, baseline, 0.3, 0.2)) == 1
+    assert run.compare(slower_machine, baseline, 0.3, 0.2) == []
+    assert "peak memory" in run.compare(fatter, baseline, 0.3, 0.2)[0]
+    noisy = {"calibration": 1.0, "results": {"scan": {"items": 10, "latency_s": 1.5, "min_s": 1.1,
+                                                      "peak_bytes": 10 << 20}}}
+    assert run.compare(noisy, baseline, 0.3, 0.2) == []
+
+def test_main_skips_other_python(tmp_path, isolated, monkeypatch, capsys):
+    baseline = tmp_path / "baseline.json"
+    assert run.main(["--scale", "0.005", "--repeat", "1", "--baseline", str(baseline), "--update-baseline",
+                     "rules_compile"]) == 0
+    monkeypatch.setattr(run, "compare", lambda *args: ["scan: slower"])
+    monkeypatch.setattr(run.platform, "python_version_tuple", lambda: ("2", "7", "18"))
+    assert run.main(["--scale", "0.005", "--repeat", "1", "--baseline", str(baseline), "rules_compile"]) == 0
+    assert "skipping comparison" in capsys.readouterr().out
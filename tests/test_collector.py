@@ -0,0 +1,160 @@
+import asyncio
+import io
+import json
+import socket
+import threading
+import time
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+from agent import collector
+from agent.collector import Collector, decode_payload, pack_frame, parse_address
+from agent.events import make_event
+from agent.sinks import CollectorSink, create_sink
+from agent.spool import Spool
+
+class Server:
+    # Коллектор в отдельном потоке со своим event loop.
+    def __init__(self, address):
+        self.output = io.BytesIO()
+        self.collector = Collector(self.output)
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.collector.start(address))
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    def lines(self):
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.collector.close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+def test_parse_address():
+    assert parse_address("unix:/run/secmon.sock") == (socket.AF_UNIX, "/run/secmon.sock")
+    assert parse_address("10.0.0.1:9000") == (socket.AF_INET, ("10.0.0.1", 9000))
+    assert parse_address("collector") == (socket.AF_INET, ("collector", collector.DEFAULT_PORT))
+    assert parse_address(":9000") == (socket.AF_INET, ("", 9000))
+    assert parse_address("[::1]:9000") == (socket.AF_INET, ("::1", 9000))
+
+def test_decode_payload_limits(monkeypatch):
+    assert decode_payload(zlib.compress(b'{"a":1}\n')) == b'{"a":1}\n'
+    with pytest.raises(collector.ProtocolError):
+        decode_payload(zlib.compress(b'{"a":1}'))
+    with pytest.raises(collector.ProtocolError):
+        decode_payload(b"not zlib at all")
+    monkeypatch.setattr("agent.collector.MAX_BATCH_BYTES", 1000)
+    with pytest.raises(collector.ProtocolError):
+        decode_payload(zlib.compress(b"\n" * 100000))
+
+def test_corrupt_frame_closes_connection(tmp_path):
+    server = Server(f"unix:{tmp_path / 'c.sock'}")
+    errors = collector.ERRORS.value()
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(tmp_path / "c.sock"))
+        sock.sendall(pack_frame(1, b"garbage"))
+        sock.settimeout(5)
+        assert sock.recv(16) == b""
+        sock.close()
+        wait_for(lambda: collector.ERRORS.value() == errors + 1)
+    finally:
+        server.close()
+
+def test_sink_backs_off_after_failed_connect(tmp_path):
+    now = [0.0]
+    sink = CollectorSink("127.0.0.1:1", spool_dir=str(tmp_path / "spool"), retry_interval=5, clock=lambda: now[0])
+    with patch.object(sink, "_connect", side_effect=ConnectionRefusedError) as mock_connect:
+        for i in range(10):
+            sink.write([make_event(f"event {i}", pid=i)])
+        assert mock_connect.call_count == 1
+        assert len(sink.spool) == 10 and sink.errors == 1
+        now[0] = 5.0
+        sink.write([make_event("event 10", pid=10)])
+        assert mock_connect.call_count == 2
+    assert len(sink.spool) == 11
+
+@pytest.mark.parametrize("transport", ["tcp", "unix"])
+def test_sink_streams_to_collector(tmp_path, transport):
+    if transport == "unix":
+        address = f"unix:{tmp_path / 'collector.sock'}"
+        server = Server(address)
+    else:
+        server = Server("127.0.0.1:0")
+        address = f"127.0.0.1:{server.port}"
+    sink = CollectorSink(address, spool_dir=str(tmp_path / "spool"), batch_size=100, flush_interval=0.05)
+    sink.start()
+    try:
+        for i in range(1000):
+            sink.put(make_event(f"event {i}", monitor="process", pid=i))
+        wait_for(lambda: server.collector.events == 1000)
+    finally:
+        sink.stop()
+        server.close()
+    assert [line["pid"] for line in server.lines()] == list(range(1000))
+    assert server.collector.frames == 10
+    assert sink.stats()["spooled"] == 0
+
+def test_sink_spools_while_collector_down(tmp_path):
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    sink = CollectorSink(f"127.0.0.1:{port}", spool_dir=str(tmp_path / "spool"),
+                         timeout=1, retry_interval=0.05)
+    for i in range(3):
+        sink.write([make_event(f"event {i}", pid=i)])
+    assert len(sink.spool) == 3 and sink.spooled == 3
+    server = Server(f"127.0.0.1:{port}")
+    sink.start()
+    try:
+        wait_for(lambda: server.collector.events == 3)
+        sink.write([make_event("live", pid=3)])
+    finally:
+        sink.stop()
+        server.close()
+    assert [line["pid"] for line in server.lines()] == [0, 1, 2, 3]
+    assert len(sink.spool) == 0
+
+def test_spool_is_bounded_and_persistent(tmp_path):
+    spool = Spool(tmp_path, max_bytes=250)
+    for i in range(5):
+        spool.push(bytes([i]) * 100)
+    assert len(spool) == 2 and spool.dropped == 3
+    reopened = Spool(tmp_path, max_bytes=250)
+    name, payload = reopened.peek()
+    assert payload == b"\x03" * 100
+    reopened.pop(name)
+    reopened.push(b"new")
+    assert [reopened.peek()[1]] == [b"\x04" * 100]
+    assert reopened.bytes == 103
+
+def test_oversized_frame_closes_connection():
+    server = Server("127.0.0.1:0")
+    server.collector.max_frame = 10
+    try:
+        sock = socket.create_connection(("127.0.0.1", server.port), timeout=5)
+        sock.sendall(pack_frame(1, zlib.compress(b'{"a":1}\n' * 100)))
+        assert sock.recv(100) == b""
+        sock.close()
+    finally:
+        server.close()
+    assert server.collector.events == 0
+
+def test_create_collector_sink(tmp_path):
+    sink = create_sink({"type": "collector", "address": "127.0.0.1:1", "spool_dir": str(tmp_path)})
+    assert isinstance(sink, CollectorSink)
@@ -0,0 +1,46 @@
+import pytest
+from agent.conn_table import ConnectionTable
+
+KEY = (123, "10.0.0.2", 40000, "8.8.8.8", 443)
+
+def test_touch_new_and_known():
+    table = ConnectionTable(ttl=60)
+    assert table.touch(KEY, now=100) is True
+    assert table.touch(KEY, now=110) is False
+    assert KEY in table
+    assert table.get(KEY) == (100, 110)
+
+def test_expire_removes_stale_entries():
+    table = ConnectionTable(ttl=60, bucket_width=10)
+    table.touch(KEY, now=0)
+    table.touch(("other",), now=50)
+    assert table.expire(now=61) == 1
+    assert KEY not in table
+    assert ("other",) in table
+    assert table.expire(now=200) == 1
+    assert len(table) == 0
+
+def test_expire_counts_from_first_seen():
+    # Соединение, открытое дольше ttl, истекает и снова считается новым.
+    table = ConnectionTable(ttl=60, bucket_width=10)
+    table.touch(KEY, now=0)
+    table.touch(KEY, now=55)
+    assert table.expire(now=55) == 0
+    assert table.get(KEY) == (0, 55)
+    assert table.expire(now=61) == 1
+    assert table.touch(KEY, now=62) is True
+
+def test_expire_touches_only_due_buckets():
+    table = ConnectionTable(ttl=1000, bucket_width=10)
+    for i in range(1000):
+        table.touch(("conn", i), now=i)
+    assert table.expire(now=1005) == 6
+    assert len(table) == 994
+
+def test_discard_and_retouch():
+    table = ConnectionTable(ttl=60, bucket_width=10)
+    table.touch(KEY, now=0)
+    table.discard(KEY)
+    assert table.touch(KEY, now=30) is True
+    assert table.expire(now=61) == 0
+    assert table.expire(now=91) == 1
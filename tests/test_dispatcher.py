@@ -0,0 +1,45 @@
+import threading
+import pytest
+from agent.dispatcher import Dispatcher, DROP_NEWEST
+
+def test_drop_newest_policy():
+    dispatcher = Dispatcher(lambda batch: None, maxsize=3, overflow=DROP_NEWEST)
+    results = [dispatcher.put(i) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert list(dispatcher._queue) == [0, 1, 2]
+    assert dispatcher.stats()["dropped"] == 2
+
+def test_drop_oldest_policy():
+    dispatcher = Dispatcher(lambda batch: None, maxsize=3)
+    for i in range(5):
+        dispatcher.put(i)
+    assert list(dispatcher._queue) == [2, 3, 4]
+    assert dispatcher.stats()["max_depth"] == 3
+
+def test_batches_and_split():
+    batches = []
+    dispatcher = Dispatcher(batches.append, batch_size=10, batch_interval=0.01,
+                            split=lambda items: [items[i:i + 4] for i in range(0, len(items), 4)])
+    for i in range(10):
+        dispatcher.put(i)
+    dispatcher.start()
+    dispatcher.stop()
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert dispatcher.stats()["sent"] == 10
+
+def test_failure_after_retries_is_reported():
+    errors = []
+    attempts = []
+
+    def send(batch):
+        attempts.append(batch)
+        raise ConnectionError("down")
+
+    dispatcher = Dispatcher(send, batch_interval=0.01, max_retries=2, backoff=0.01, on_error=errors.append)
+    dispatcher.put("alert")
+    dispatcher.start()
+    dispatcher.stop()
+    assert len(attempts) == 3
+    stats = dispatcher.stats()
+    assert stats["failed"] == 1 and stats["retries"] == 2
+    assert "down" in errors[0]
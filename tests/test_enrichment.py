@@ -0,0 +1,112 @@
+import csv
+import pytest
+from unittest.mock import Mock, patch
+from agent import enrichment, network_monitor, rule_engine
+from agent.conn_table import ConnectionTable
+from agent.enrichment import Enrichment, EnrichmentCache, EnrichmentDB, build_db
+
+ROWS = [
+    ["# network", "asn", "country", "org", "tags"],
+    ["1.1.1.0/24", "AS13335", "US", "Cloudflare, Inc.", ""],
+    ["185.220.100.0/22", "208294", "de", "Tor Relays", ""],
+    ["185.220.101.5-185.220.101.9", "", "", "", "tor; exit"],
+    ["2a0b:f4c0::/32", "208294", "DE", "Tor Relays", "tor"],
+    ["10.0.0.0/8", "", "", "", "internal"],
+    ["10.1.0.0/16", "64512", "", "Lab", ""],
+]
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "enrich.db"
+    build_db(ROWS, path)
+    database = EnrichmentDB(path)
+    yield database
+    database.close()
+
+def test_lookup(db):
+    assert db.lookup("1.1.1.1") == Enrichment(13335, "US", "Cloudflare, Inc.", ())
+    assert db.lookup("1.1.2.1") is None
+    assert db.lookup("0.0.0.1") is None
+    assert db.lookup("255.255.255.255") is None
+    assert db.lookup("2a0b:f4c0::1").tags == ("tor",)
+    assert db.lookup("::ffff:1.1.1.1").asn == 13335
+    assert db.lookup("not-an-ip") is None
+
+def test_overlapping_sources_merged(db):
+    # Метки из отдельного списка накладываются на диапазон AS, не разрывая его данные.
+    assert db.lookup("185.220.101.7") == Enrichment(208294, "DE", "Tor Relays", ("exit", "tor"))
+    assert db.lookup("185.220.101.10") == Enrichment(208294, "DE", "Tor Relays", ())
+    assert db.lookup("185.220.101.4").tags == ()
+    # Более узкий диапазон задаёт AS, метки широкого сохраняются.
+    assert db.lookup("10.1.2.3") == Enrichment(64512, "", "Lab", ("internal",))
+    assert db.lookup("10.2.0.1") == Enrichment(0, "", "", ("internal",))
+    # 185.220.100/22 разбит списком меток на три отрезка; 10/8 - на три.
+    assert len(db) == 1 + 3 + 3 + 1
+
+def test_builder_cli_and_bad_input(tmp_path):
+    source = tmp_path / "asn.csv"
+    with open(source, "w", newline="") as f:
+        csv.writer(f).writerows(ROWS)
+    assert enrichment.main([str(source), "-o", str(tmp_path / "out.db")]) == 0
+    with pytest.raises(ValueError):
+        build_db([["1.1.1.0/24", "1", "USA"]], tmp_path / "bad.db")
+    with pytest.raises(ValueError):
+        build_db([["1.1.1.9-1.1.1.1"]], tmp_path / "bad.db")
+    (tmp_path / "broken.db").write_bytes(b"SMEN")
+    with pytest.raises(ValueError):
+        EnrichmentDB(tmp_path / "broken.db")
+
+def test_cache(db):
+    cache = EnrichmentCache(maxsize=2)
+    with patch.object(db, "lookup", wraps=db.lookup) as lookup:
+        for ip in ["1.1.1.1", "1.1.1.1", "8.8.8.8", "8.8.8.8", "1.1.1.2"]:
+            cache.get(db, ip)
+        assert lookup.call_count == 3
+    assert len(cache) == 2
+
+def test_init_and_describe(tmp_path, monkeypatch):
+    path = tmp_path / "enrich.db"
+    build_db(ROWS, path)
+    monkeypatch.setattr("agent.enrichment.database", None)
+    enrichment.init({"enrichment_db": str(path)})
+    assert enrichment.enabled()
+    info = enrichment.lookup("185.220.101.5")
+    assert enrichment.describe(info) == "AS208294 Tor Relays, DE [exit, tor]"
+    assert enrichment.to_dict(enrichment.lookup("10.2.0.1")) == {"tags": ("internal",)}
+    enrichment.init({})
+    assert not enrichment.enabled() and enrichment.lookup("1.1.1.1") is None
+
+def test_rules_match_enrichment():
+    ruleset = rule_engine.Ruleset({"enrichment_rules": [
+        {"id": "tor", "tags": ["TOR"], "exclude_exes": ["/usr/bin/tor"]},
+        {"id": "cf-us", "asns": ["AS13335"], "countries": ["us"]},
+        {"id": "empty"},
+    ]})
+    assert len(ruleset.enrichment_rules) == 2 and len(ruleset.invalid_rules) == 1
+    tor = Enrichment(208294, "DE", "Tor Relays", ("exit", "tor"))
+    assert ruleset.match_enrichment(tor, "/tmp/x") == ["tor"]
+    assert ruleset.match_enrichment(tor, "/usr/bin/tor") == []
+    assert ruleset.match_enrichment(Enrichment(13335, "US", "", ()), "/bin/curl") == ["cf-us"]
+    assert ruleset.match_enrichment(Enrichment(13335, "DE", "", ()), "/bin/curl") == []
+
+def test_network_monitor_alerts_on_tagged_address(tmp_path, monkeypatch):
+    path = tmp_path / "enrich.db"
+    build_db(ROWS, path)
+    monkeypatch.setattr("agent.enrichment.database", EnrichmentDB(path))
+    monkeypatch.setattr("agent.enrichment.cache", EnrichmentCache())
+    monkeypatch.setattr("agent.rule_engine.RULES", {"network_public_alerts": False})
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.Ruleset(
+        {"enrichment_rules": [{"id": "tor", "tags": ["tor"]}]}))
+    monkeypatch.setattr("agent.network_monitor.known_conns", ConnectionTable(network_monitor.CACHE_TTL))
+    monkeypatch.setattr("agent.network_monitor.get_process_info", lambda pid, snap=None: ("cmd", "/bin/test"))
+    conns = [Mock(laddr=Mock(ip="10.0.0.2", port=40000), raddr=Mock(ip="185.220.101.6", port=443), pid=7),
+             Mock(laddr=Mock(ip="10.0.0.2", port=40001), raddr=Mock(ip="1.1.1.1", port=443), pid=7)]
+    with patch("agent.network_monitor.get_connections", return_value=conns), \
+            patch("agent.network_monitor.alerter.alert") as mock_alert:
+        network_monitor.monitor_network()
+    mock_alert.assert_called_once()
+    assert mock_alert.call_args.kwargs["rule"] == "enrichment"
+    assert mock_alert.call_args.kwargs["rule_ids"] == ("tor",)
+    assert mock_alert.call_args.kwargs["enrichment"]["asn"] == 208294
+    assert "AS208294 Tor Relays" in mock_alert.call_args[0][0]
+    enrichment.database.close()
@@ -0,0 +1,16 @@
+from agent.events import HOST, make_event, to_dict
+
+def test_make_event_strips_markdown():
+    event = make_event(" Внешнее соединение: 8.8.8.8:53\n`PID:` 42", level="warning",
+                       monitor="network", rule="public_ip", pid=42, exe="/usr/bin/curl",
+                       addresses={"remote": "8.8.8.8:53"}, timestamp=1.5)
+    assert event.message == "Внешнее соединение: 8.8.8.8:53\nPID: 42"
+    assert event.level == "WARNING"
+    assert event.host == HOST
+
+def test_to_dict_flattens_extra_and_drops_empty():
+    event = make_event("x", monitor="process", rule_ids=("rev-shell",), pid=7, ppid=1, timestamp=2.0)
+    data = to_dict(event)
+    assert data["rule_ids"] == ["rev-shell"]
+    assert data["ppid"] == 1
+    assert "exe" not in data and "addresses" not in data
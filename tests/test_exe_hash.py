@@ -0,0 +1,64 @@
+import hashlib
+import os
+import pytest
+from unittest.mock import patch
+from agent import exe_hash
+from agent.exe_hash import ExeHashCache, HashTable, build_table
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+def test_table_lookup(tmp_path):
+    bad = [sha(str(i).encode()) for i in range(1000)]
+    path = tmp_path / "bad.bin"
+    assert build_table([f"{h}  /tmp/x\n" for h in bad] + ["# comment\n", "\n", bad[0]], path) == 1000
+    assert path.stat().st_size == 1000 * 32
+    table = HashTable(path)
+    assert len(table) == 1000
+    assert all(bytes.fromhex(h) in table for h in bad[::50])
+    assert bytes.fromhex(sha(b"clean")) not in table
+    assert b"\xff" * 32 not in table and b"\x00" * 32 not in table
+    table.close()
+
+def test_table_rejects_bad_input(tmp_path):
+    with pytest.raises(ValueError):
+        build_table(["abcd"], tmp_path / "bad.bin")
+    (tmp_path / "broken.bin").write_bytes(b"x" * 33)
+    with pytest.raises(ValueError):
+        HashTable(tmp_path / "broken.bin")
+    (tmp_path / "empty.bin").write_bytes(b"")
+    assert b"\x00" * 32 not in HashTable(tmp_path / "empty.bin")
+
+def test_cache_keyed_by_file_identity(tmp_path):
+    path = tmp_path / "bash"
+    path.write_bytes(b"v1")
+    cache = ExeHashCache()
+    with patch("agent.exe_hash.hashlib.sha256", wraps=hashlib.sha256) as mock_sha:
+        for _ in range(1000):
+            digest, _ = cache.digest(str(path))
+        assert mock_sha.call_count == 1
+    assert digest.hex() == sha(b"v1")
+    path.write_bytes(b"v2 longer")
+    assert cache.digest(str(path)) == (bytes.fromhex(sha(b"v2 longer")), False)
+    assert cache.digest(str(tmp_path / "missing")) == (None, False)
+
+def test_lookup_uses_proc_exe(tmp_path, monkeypatch):
+    bad_file = tmp_path / "malware"
+    bad_file.write_bytes(b"evil")
+    build_table([sha(b"evil")], tmp_path / "bad.bin")
+    monkeypatch.setattr("agent.exe_hash.table", None)
+    exe_hash.init({"bad_hashes_file": str(tmp_path / "bad.bin")})
+    try:
+        assert exe_hash.lookup(os.getpid(), "/nonexistent") is None
+        # Процесс уже завершился: файл читается по пути.
+        assert exe_hash.lookup(2 ** 30, str(bad_file)) == sha(b"evil")
+    finally:
+        exe_hash.init({})
+    assert exe_hash.lookup(2 ** 30, str(bad_file)) is None
+
+def test_cli_builds_table(tmp_path, capsys):
+    source = tmp_path / "hashes.txt"
+    source.write_text(sha(b"a") + "\n" + sha(b"b") + "\n")
+    assert exe_hash.main([str(source), str(tmp_path / "out.bin")]) == 0
+    assert "2 hashes" in capsys.readouterr().out
+    assert bytes.fromhex(sha(b"b")) in HashTable(tmp_path / "out.bin")
@@ -1,7 +1,11 @@
 import pytest
 from unittest.mock import patch, mock_open
+import hashlib
 import json
-from agent import file_monitor
+import os
+from agent.hash_store import HashStore
+from agent.ratelimit import TokenBucket
+from agent import file_monitor, rule_engine
 
 def test_hash_calculation(tmp_path):
     file = tmp_path / "test.txt"
@@ -45,25 +49,311 @@ def test_save_hash_db(tmp_path):
         with hash_db_path.open("r") as f:
             assert json.load(f) == db
 
-@patch("agent.file_monitor.load_hash_db")
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr("agent.file_monitor.HASH_DB_FILE", tmp_path / "file_hashes.json")
+    monkeypatch.setattr("agent.file_monitor.HASH_STORE_FILE", tmp_path / "file_hashes.db")
+    monkeypatch.setattr("agent.file_monitor.store", None)
+    monkeypatch.setattr("agent.file_monitor.WATCH_ENTRIES", [])
+    monkeypatch.setattr("agent.file_monitor.verify_bucket", None)
+    monkeypatch.setattr("agent.file_monitor.watch_generation", rule_engine.GENERATION)
+    yield
+    if file_monitor.store is not None:
+        file_monitor.store.close()
+
 @patch("agent.file_monitor.alerter.alert")
-def test_monitor_files_no_changes(mock_alert, mock_load_hash_db, tmp_path):
+def test_monitor_files_no_changes(mock_alert, tmp_path, store):
     file = tmp_path / "test.txt"
     file.write_text("hello")
     with patch("agent.file_monitor.WATCHED_FILES", [str(file)]):
-        mock_load_hash_db.return_value = {
+        file_monitor.get_store().import_json({
             str(file): file_monitor.calculate_hash(str(file)),
             f"{str(file)}_mtime": file.stat().st_mtime
-        }
+        })
         file_monitor.monitor_files()
         mock_alert.assert_not_called()
 
-@patch("agent.file_monitor.load_hash_db")
 @patch("agent.file_monitor.alerter.alert")
-def test_monitor_files_changed(mock_alert, mock_load_hash_db, tmp_path):
+def test_monitor_files_changed(mock_alert, tmp_path, store):
     file = tmp_path / "test.txt"
     file.write_text("hello")
     with patch("agent.file_monitor.WATCHED_FILES", [str(file)]):
-        mock_load_hash_db.return_value = {str(file): "old_hash"}
+        file_monitor.get_store().import_json({str(file): "old_hash"})
         file_monitor.monitor_files()
-        mock_alert.assert_called_once_with(f" Изменён файл: `{str(file)}`", level="WARNING")
+        mock_alert.assert_called_once_with(f" Изменён файл: `{str(file)}`", level="WARNING",
+                                           monitor="file", rule="modified", path=str(file))
+
+@patch("agent.file_monitor.alerter.alert")
+def test_store_migrates_json_baseline(mock_alert, tmp_path, store):
+    file = tmp_path / "test.txt"
+    file.write_text("hello")
+    file_monitor.save_hash_db({str(file): "old_hash", f"{str(file)}_mtime": 1.0})
+    assert file_monitor.get_store().get(str(file)) == {"hash": "old_hash", "stat": None}
+    assert "_mtime" not in "".join(file_monitor.get_store())
+    mock_alert.assert_called_once()
+
+def test_store_writes_only_dirty_records(tmp_path, store):
+    files = []
+    for i in range(5):
+        file = tmp_path / f"f{i}"
+        file.write_text(str(i))
+        files.append(str(file))
+    db = file_monitor.get_store()
+    written = []
+    real_commit = db.commit
+    db.commit = lambda: written.append(real_commit()) or written[-1]
+    file_monitor.check_paths(files, verify=False)
+    file_monitor.check_paths(files, verify=False)
+    (tmp_path / "f2").write_text("changed")
+    file_monitor.check_paths(files, verify=False)
+    assert written == [5, 0, 1]
+
+def test_hash_store_persists_records(tmp_path):
+    db = HashStore(tmp_path / "hashes.db")
+    db["/etc/passwd"] = {"hash": "abc", "stat": [1, 2, 3, 4, 5]}
+    db["/etc/hosts"] = {"hash": "def", "stat": None}
+    assert db.commit() == 2
+    db.pop("/etc/hosts")
+    db.close()
+    reopened = HashStore(tmp_path / "hashes.db")
+    assert reopened.export_json() == {"/etc/passwd": {"hash": "abc", "stat": [1, 2, 3, 4, 5]}}
+    reopened.close()
+
+def test_monitor_files_skips_unchanged_stat(tmp_path):
+    file = tmp_path / "test.txt"
+    file.write_text("hello")
+    db = {}
+    assert file_monitor.check_file(str(file), db) is True
+    with patch("agent.file_monitor.calculate_hash") as mock_hash:
+        assert file_monitor.check_file(str(file), db) is False
+        mock_hash.assert_not_called()
+
+@patch("agent.file_monitor.alerter.alert")
+def test_check_file_detects_rename_replacement(mock_alert, tmp_path):
+    file = tmp_path / "test.txt"
+    file.write_text("hello")
+    db = {}
+    file_monitor.check_file(str(file), db)
+    replacement = tmp_path / "test.txt.new"
+    replacement.write_text("hello")
+    st = file.stat()
+    os.utime(replacement, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.rename(replacement, file)
+    file_monitor.check_file(str(file), db)
+    mock_alert.assert_called_once_with(f" Файл заменён (новый inode): `{str(file)}`", level="WARNING",
+                                       monitor="file", rule="replaced", path=str(file))
+
+@patch("agent.file_monitor.alerter.alert")
+def test_verify_sweep_catches_hidden_edit(mock_alert, tmp_path, monkeypatch):
+    file = tmp_path / "test.txt"
+    file.write_text("hello")
+    db = {}
+    file_monitor.check_file(str(file), db)
+    db[str(file)]["hash"] = "0" * 64
+    assert file_monitor.check_file(str(file), db) is False
+    monkeypatch.setattr("agent.file_monitor.WATCHED_FILES", [str(file)])
+    monkeypatch.setattr("agent.file_monitor.verify_bucket", TokenBucket(1024))
+    file_monitor.verify_sweep(db, set())
+    mock_alert.assert_called_once_with(f" Изменён файл без изменения метаданных: `{str(file)}`", level="WARNING",
+                                       monitor="file", rule="content_changed", path=str(file))
+
+def test_verify_sweep_respects_rate_limit(tmp_path, monkeypatch):
+    files = []
+    for i in range(5):
+        file = tmp_path / f"f{i}"
+        file.write_bytes(b"x" * 1000)
+        files.append(str(file))
+    db = {}
+    monkeypatch.setattr("agent.file_monitor.WATCHED_FILES", files)
+    monkeypatch.setattr("agent.file_monitor.verify_cursor", 0)
+    monkeypatch.setattr("agent.file_monitor.verify_bucket", TokenBucket(1500, clock=lambda: 0.0))
+    with patch("agent.file_monitor.check_file") as mock_check:
+        file_monitor.verify_sweep(db, set())
+        assert mock_check.call_count == 2
+        file_monitor.verify_sweep(db, set())
+        assert mock_check.call_count == 2
+
+def test_verify_sweep_rate_per_pass(tmp_path, monkeypatch):
+    # За проход раз в 60 с сверяется 60 с * 1000 байт/с, а не одна секунда.
+    files = []
+    for i in range(200):
+        file = tmp_path / f"f{i}"
+        file.write_bytes(b"x" * 1000)
+        files.append(str(file))
+    now = [0.0]
+    monkeypatch.setattr("agent.file_monitor.WATCHED_FILES", files)
+    monkeypatch.setattr("agent.file_monitor.verify_cursor", 0)
+    monkeypatch.setattr("agent.file_monitor.SCAN_INTERVAL", 60)
+    monkeypatch.setattr("agent.file_monitor.VERIFY_BYTES_PER_SEC", 1000)
+    monkeypatch.setattr("agent.file_monitor.verify_bucket", TokenBucket(1000, clock=lambda: now[0]))
+    file_monitor.set_interval(60)
+    with patch("agent.file_monitor.check_file") as mock_check:
+        file_monitor.verify_sweep({}, set())
+        mock_check.reset_mock()
+        for verified in (60, 120):
+            now[0] += 60
+            file_monitor.verify_sweep({}, set())
+            assert mock_check.call_count == verified
+
+def test_create_watcher_poll_mode(monkeypatch):
+    monkeypatch.setattr("agent.file_monitor.WATCH_MODE", "poll")
+    assert file_monitor.create_watcher() is None
+
+@patch("agent.file_monitor.alerter.alert")
+def test_create_watcher_falls_back(mock_alert, monkeypatch):
+    monkeypatch.setattr("agent.file_monitor.WATCH_MODE", "inotify")
+    with patch("agent.file_monitor.inotify.FileWatcher", side_effect=OSError("ENOSYS")):
+        assert file_monitor.create_watcher() is None
+    mock_alert.assert_called_once()
+
+@patch("agent.file_monitor.alerter.alert")
+def test_rules_reload_updates_watched_files(mock_alert, tmp_path, store, monkeypatch):
+    for name in ("RULES", "RULESET", "RULES_FILE", "RULES_MTIME", "GENERATION"):
+        monkeypatch.setattr(rule_engine, name, getattr(rule_engine, name))
+    old_file = tmp_path / "old.conf"
+    new_file = tmp_path / "new.conf"
+    old_file.write_text("old")
+    new_file.write_text("new")
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"watched_files": [str(old_file)]}))
+    rule_engine.load_rules(str(rules_path))
+    monkeypatch.setattr("agent.file_monitor.WATCH_MODE", "inotify")
+    monkeypatch.setattr("agent.file_monitor.watcher", None)
+    monkeypatch.setattr("agent.file_monitor.watch_generation", None)
+    with patch("agent.file_monitor.inotify.FileWatcher") as mock_watcher:
+        mock_watcher.return_value.wait.return_value = set()
+        mock_watcher.return_value.overflows = 0
+        file_monitor.monitor_files()
+        assert file_monitor.WATCHED_FILES == [str(old_file)]
+        file_monitor.start_watcher()
+
+        rules_path.write_text(json.dumps({"watched_files": [str(old_file), str(new_file)]}))
+        rule_engine.load_rules(str(rules_path))
+        file_monitor.watch_changes(0)
+        assert set(mock_watcher.call_args[0][0]) == {str(old_file), str(new_file)}
+        assert file_monitor.get_store().get(str(new_file)) is not None
+        file_monitor.stop_watcher()
+
+@patch("agent.file_monitor.alerter.alert")
+def test_watch_changes_waits_when_restart_fails(mock_alert, store, monkeypatch):
+    monkeypatch.setattr("agent.file_monitor.WATCH_MODE", "auto")
+    monkeypatch.setattr("agent.file_monitor.watcher", object())
+    monkeypatch.setattr("agent.file_monitor.watcher_generation", None)
+    monkeypatch.setattr("agent.file_monitor.stop_watcher", lambda: None)
+    with patch("agent.file_monitor.inotify.FileWatcher", side_effect=OSError("EMFILE")), \
+            patch("agent.file_monitor.time.sleep") as mock_sleep:
+        file_monitor.watch_changes(1.0)
+        assert file_monitor.watcher is None
+        mock_alert.assert_called_once()
+        file_monitor.watch_changes(1.0)
+        mock_alert.assert_called_once()
+    assert mock_sleep.call_count == 2
+    mock_sleep.assert_called_with(1.0)
+
+@patch("agent.file_monitor.alerter.alert")
+def test_watch_overflow_triggers_full_scan(mock_alert, store, monkeypatch):
+    class OverflowingWatcher:
+        overflows = 0
+
+        def wait(self, timeout):
+            self.overflows += 1
+            return {"/etc/passwd"}
+
+    monkeypatch.setattr("agent.file_monitor.watcher", OverflowingWatcher())
+    monkeypatch.setattr("agent.file_monitor.watcher_generation", file_monitor.watch_generation)
+    monkeypatch.setattr("agent.file_monitor.watcher_overflows", 0)
+    overflows = file_monitor.WATCH_OVERFLOWS.value()
+    with patch("agent.file_monitor.monitor_files") as mock_scan, \
+            patch("agent.file_monitor.check_paths") as mock_check:
+        file_monitor.watch_changes(0)
+        file_monitor.watch_changes(0)
+    assert mock_scan.call_count == 2
+    mock_check.assert_not_called()
+    assert file_monitor.WATCH_OVERFLOWS.value() == overflows + 2
+    assert mock_alert.call_count == 2
+
+def test_expand_watch_entries(tmp_path):
+    (tmp_path / "etc" / "nginx" / "sites").mkdir(parents=True)
+    (tmp_path / "etc" / "nginx" / "nginx.conf").write_text("a")
+    (tmp_path / "etc" / "nginx" / "sites" / "default.conf").write_text("b")
+    (tmp_path / "etc" / "nginx" / "sites" / "notes.txt").write_text("c")
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "ls").write_text("d")
+    os.symlink(tmp_path / "etc", tmp_path / "bin" / "link-to-etc")
+    entries = [
+        str(tmp_path / "bin"),
+        str(tmp_path / "etc" / "**" / "*.conf"),
+        str(tmp_path / "missing.txt"),
+    ]
+    files = file_monitor.expand_watch_entries(entries)
+    assert sorted(files) == sorted([
+        str(tmp_path / "bin" / "ls"),
+        str(tmp_path / "etc" / "nginx" / "nginx.conf"),
+        str(tmp_path / "etc" / "nginx" / "sites" / "default.conf"),
+        str(tmp_path / "missing.txt"),
+    ])
+
+def test_calculate_hash_buffered_and_throttle(tmp_path, monkeypatch):
+    file = tmp_path / "big.bin"
+    data = os.urandom(300_000)
+    file.write_bytes(data)
+    monkeypatch.setattr("agent.file_monitor.READ_BUFFER", 64 * 1024)
+    bucket = TokenBucket(10 ** 9)
+    monkeypatch.setattr("agent.file_monitor.hash_bucket", bucket)
+    with patch.object(bucket, "throttle", wraps=bucket.throttle) as mock_throttle:
+        assert file_monitor.calculate_hash(str(file)) == hashlib.sha256(data).hexdigest()
+        assert sum(c[0][0] for c in mock_throttle.call_args_list) == len(data)
+
+def test_calculate_hash_survives_truncation(tmp_path, monkeypatch):
+    file = tmp_path / "access.log"
+    data = os.urandom(200_000)
+    file.write_bytes(data)
+    monkeypatch.setattr("agent.file_monitor.READ_BUFFER", 64 * 1024)
+    update = file_monitor._update
+
+    def truncate_after_first_block(sha256, chunk):
+        update(sha256, chunk)
+        os.truncate(file, 64 * 1024)
+
+    monkeypatch.setattr("agent.file_monitor._update", truncate_after_first_block)
+    assert file_monitor.calculate_hash(str(file)) == hashlib.sha256(data[:64 * 1024]).hexdigest()
+
+def test_hash_files_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr("agent.file_monitor.HASH_WORKERS", 4)
+    paths = []
+    for i in range(50):
+        file = tmp_path / f"f{i}"
+        file.write_bytes(os.urandom(1000 + i))
+        paths.append(str(file))
+    expected = [hashlib.sha256(open(p, "rb").read()).hexdigest() for p in paths]
+    assert file_monitor.hash_files(paths) == expected
+
+@patch("agent.file_monitor.alerter.alert")
+def test_check_paths_detects_change_in_tree(mock_alert, tmp_path, monkeypatch, store):
+    root = tmp_path / "www"
+    root.mkdir()
+    for i in range(10):
+        (root / f"page{i}.php").write_text(f"<?php echo {i};")
+    monkeypatch.setattr("agent.file_monitor.WATCH_ENTRIES", [str(root)])
+    file_monitor.monitor_files()
+    (root / "page3.php").write_text("<?php system($_GET['c']);")
+    file_monitor.monitor_files()
+    mock_alert.assert_called_once_with(f" Изменён файл: `{root / 'page3.php'}`", level="WARNING",
+                                       monitor="file", rule="modified", path=str(root / "page3.php"))
+
+@patch("agent.file_monitor.alerter.alert")
+def test_hashing_deferred_under_io_pressure(mock_alert, tmp_path, monkeypatch, store):
+    file = tmp_path / "test.txt"
+    file.write_text("hello")
+    monkeypatch.setattr("agent.file_monitor.deferred", set())
+    file_monitor.check_paths([str(file)])
+    file.write_text("changed")
+    monkeypatch.setattr("agent.governor.defer_io", lambda: True)
+    file_monitor.check_paths([str(file)], verify=False)
+    mock_alert.assert_not_called()
+    assert file_monitor.deferred == {str(file)}
+    # После спада нагрузки отложенный путь проверяется в любом следующем проходе.
+    monkeypatch.setattr("agent.governor.defer_io", lambda: False)
+    file_monitor.check_paths([], verify=False)
+    mock_alert.assert_called_once()
+    assert not file_monitor.deferred
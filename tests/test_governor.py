@@ -0,0 +1,105 @@
+import pytest
+from agent import governor
+from agent.governor import Governor, read_pressure
+from agent.scheduler import Scheduler
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.cpu = 0.0
+
+    def advance(self, seconds, cpu):
+        self.now += seconds
+        self.cpu += cpu
+
+def make(budget=0.02, pressure=None):
+    clock = Clock()
+    levels = pressure if pressure is not None else {}
+    sched = Scheduler(clock=lambda: clock.now)
+    sched.add("Process Monitor", lambda: None, 3)
+    sched.add("Network Monitor", lambda: None, 5)
+    gov = Governor(sched, budget=budget, cpu_clock=lambda: clock.cpu, clock=lambda: clock.now,
+                   pressure=lambda resource: levels.get(resource))
+    gov.govern("Process Monitor", 1, 30)
+    gov.govern("Network Monitor")
+    sched.tasks["Process Monitor"].last_cpu = 0.5
+    sched.tasks["Network Monitor"].last_cpu = 0.01
+    gov.tick()
+    return gov, sched, clock
+
+def test_over_budget_stretches_within_bounds():
+    gov, sched, clock = make()
+    clock.advance(10, 1.0)  # 10% ядра при бюджете 2%
+    gov.tick()
+    assert gov.decision == "over_budget"
+    assert sched.tasks["Process Monitor"].interval == 6
+    assert sched.tasks["Network Monitor"].interval == 10
+    for _ in range(10):
+        clock.advance(10, 1.0)
+        gov.tick()
+    assert sched.tasks["Process Monitor"].interval == 30
+    assert sched.tasks["Network Monitor"].interval == 50
+
+def test_cheap_task_not_stretched():
+    gov, sched, clock = make()
+    sched.tasks["Network Monitor"].last_cpu = 0.0001
+    clock.advance(10, 1.0)
+    gov.tick()
+    assert sched.tasks["Process Monitor"].interval == 6
+    assert sched.tasks["Network Monitor"].interval == 5
+
+def test_headroom_shrinks_to_minimum():
+    gov, sched, clock = make()
+    for _ in range(30):
+        clock.advance(10, 0.001)
+        gov.tick()
+    assert gov.decision == "headroom"
+    assert sched.tasks["Process Monitor"].interval == 1
+    assert sched.tasks["Network Monitor"].interval == 5
+    assert gov.stats()["intervals"] == {"Process Monitor": 1, "Network Monitor": 5}
+
+def test_host_cpu_pressure_backs_off():
+    gov, sched, clock = make(pressure={"cpu": 80.0})
+    clock.advance(10, 0.001)
+    gov.tick()
+    assert gov.decision == "host_busy"
+    assert sched.tasks["Process Monitor"].interval == 3.75
+
+def test_io_pressure_defers_hashing_for_limited_time():
+    levels = {"io": 50.0}
+    gov, sched, clock = make(pressure=levels)
+    assert gov.defer_io()
+    clock.advance(gov.io_defer_max + 1, 0)
+    assert not gov.defer_io()
+    levels["io"] = 1.0
+    gov.tick()
+    assert gov.io_busy_since is None and not gov.defer_io()
+
+def test_invalid_bounds_reported():
+    sched = Scheduler()
+    sched.add("Network Monitor", lambda: None, 5)
+    sched.add("File Monitor", lambda: None, 60)
+    gov = governor.init({"scan_interval_bounds": {"Network Monitor": [10, 2]}}, sched,
+                        {"Network Monitor": None, "File Monitor": None, "Snapshot": None})
+    assert [name for name, _ in gov.invalid] == ["Network Monitor"]
+    assert set(gov.bounds) == {"File Monitor"}
+    assert "Governor" in sched.tasks
+    governor.current = None
+
+def test_on_change_hook_and_disabled_budget():
+    seen = []
+    sched = Scheduler()
+    sched.add("Snapshot", lambda: None, 3)
+    gov = governor.init({"scan_interval_bounds": {"Snapshot": [5, 30]}}, sched, {"Snapshot": seen.append})
+    assert seen == [5] and sched.tasks["Snapshot"].interval == 5
+    gov = governor.init({"cpu_budget": 0}, Scheduler(), {"Snapshot": None})
+    assert not gov.bounds
+    governor.current = None
+
+def test_read_pressure(tmp_path, monkeypatch):
+    path = tmp_path / "io"
+    path.write_text("some avg10=12.50 avg60=3.00 avg300=1.00 total=123\nfull avg10=1.00 avg60=0 avg300=0 total=1\n")
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda p, *a, **k: real_open(path if p == "/proc/pressure/io" else p, *a, **k))
+    assert read_pressure("io") == 12.5
+    assert read_pressure("missing-resource") is None
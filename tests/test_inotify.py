@@ -0,0 +1,65 @@
+import os
+import platform
+import struct
+import pytest
+from agent import inotify
+
+pytestmark = pytest.mark.skipif(platform.system() != "Linux", reason="inotify is Linux-only")
+
+def test_parse_events():
+    data = (inotify.EVENT_HDR.pack(1, inotify.IN_MODIFY, 0, 16) + b"shadow".ljust(16, b"\0")
+            + inotify.EVENT_HDR.pack(2, inotify.IN_IGNORED, 0, 0))
+    assert inotify.parse_events(data) == [(1, inotify.IN_MODIFY, 0, "shadow"), (2, inotify.IN_IGNORED, 0, "")]
+
+def test_watch_detects_modification(tmp_path):
+    target = tmp_path / "passwd"
+    other = tmp_path / "unrelated"
+    target.write_text("root:x:0:0")
+    watcher = inotify.FileWatcher([str(target)], debounce=0.05)
+    try:
+        other.write_text("noise")
+        assert watcher.wait(0.2) == set()
+        with open(target, "a") as f:
+            f.write("\nmallory:x:0:0")
+        assert watcher.wait(2) == {str(target)}
+    finally:
+        watcher.close()
+
+def test_watch_detects_atomic_rename(tmp_path):
+    target = tmp_path / "sshd_config"
+    target.write_text("PermitRootLogin no")
+    watcher = inotify.FileWatcher([str(target)], debounce=0.05)
+    try:
+        tmp = tmp_path / ".sshd_config.swp"
+        tmp.write_text("PermitRootLogin yes")
+        os.rename(tmp, target)
+        assert watcher.wait(2) == {str(target)}
+        with open(target, "a") as f:
+            f.write("\n")
+        assert watcher.wait(2) == {str(target)}
+    finally:
+        watcher.close()
+
+def test_burst_is_debounced(tmp_path):
+    target = tmp_path / "hosts"
+    target.write_text("")
+    watcher = inotify.FileWatcher([str(target)], debounce=0.1)
+    try:
+        for i in range(50):
+            with open(target, "a") as f:
+                f.write(f"10.0.0.{i} host{i}\n")
+        assert watcher.wait(2) == {str(target)}
+        assert watcher.wait(0.2) == set()
+    finally:
+        watcher.close()
+
+def test_missing_directory_is_watched_later(tmp_path):
+    target = tmp_path / "later" / "file"
+    watcher = inotify.FileWatcher([str(target)], debounce=0.05)
+    try:
+        target.parent.mkdir()
+        assert watcher.wait(0.1) == set()
+        target.write_text("x")
+        assert watcher.wait(2) == {str(target)}
+    finally:
+        watcher.close()
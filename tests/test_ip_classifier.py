@@ -0,0 +1,52 @@
+import pytest
+from agent.ip_classifier import AddressClassifier, ALLOW, DENY, PUBLIC
+
+def test_builtin_ranges():
+    classifier = AddressClassifier()
+    assert classifier.classify("8.8.8.8") == PUBLIC
+    assert classifier.classify("10.1.2.3") == "private"
+    assert classifier.classify("172.31.255.1") == "private"
+    assert classifier.classify("172.32.0.1") == PUBLIC
+    assert classifier.classify("100.100.0.1") == "cgnat"
+    assert classifier.classify("169.254.169.254") == "link-local"
+    assert classifier.classify("239.255.255.250") == "multicast"
+    assert classifier.classify("::1") == "loopback"
+    assert classifier.classify("fe80::1%eth0") == "link-local"
+    assert classifier.classify("fd12:3456::1") == "private"
+    assert classifier.classify("ff02::1") == "multicast"
+    assert classifier.classify("2606:4700::1111") == PUBLIC
+
+def test_ipv4_mapped_ipv6():
+    classifier = AddressClassifier()
+    assert classifier.classify("::ffff:192.168.0.10") == "private"
+    assert classifier.classify("::ffff:8.8.8.8") == PUBLIC
+
+def test_invalid_input():
+    classifier = AddressClassifier()
+    assert classifier.classify("") is None
+    assert classifier.classify("not-an-ip") is None
+    assert classifier.is_public("not-an-ip") is False
+
+def test_allow_and_deny_lists():
+    classifier = AddressClassifier(allow=["8.8.0.0/16", "2001:4860::/32"], deny=["8.8.8.0/24", "10.66.0.0/16"])
+    assert classifier.classify("8.8.4.4") == ALLOW
+    assert classifier.classify("8.8.8.8") == DENY
+    assert classifier.classify("10.66.1.1") == DENY
+    assert classifier.classify("10.67.1.1") == "private"
+    assert classifier.classify("2001:4860::8888") == ALLOW
+    assert classifier.is_public("8.8.4.4") is False
+    assert classifier.is_public("10.66.1.1") is True
+
+def test_deny_wins_on_equal_prefix():
+    classifier = AddressClassifier(allow=["203.0.113.0/24"], deny=["203.0.113.0/24"])
+    assert classifier.classify("203.0.113.7") == DENY
+
+def test_invalid_cidr_is_reported():
+    classifier = AddressClassifier(allow=["300.1.1.0/24"])
+    assert classifier.invalid and classifier.invalid[0][0] == "300.1.1.0/24"
+
+def test_classify_many_and_large_lists():
+    allow = [f"11.{i // 256}.{i % 256}.0/24" for i in range(5000)]
+    classifier = AddressClassifier(allow=allow)
+    result = classifier.classify_many(["11.0.5.1", "11.19.135.9", "8.8.8.8", "11.0.5.1"])
+    assert result == {"11.0.5.1": ALLOW, "11.19.135.9": ALLOW, "8.8.8.8": PUBLIC}
@@ -0,0 +1,70 @@
+import pstats
+import urllib.request
+from agent import metrics
+from agent.metrics import Registry
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    alerts = registry.counter("secmon_test_alerts_total", "Alerts", ["level"])
+    depth = registry.gauge("secmon_test_depth", "Depth")
+    alerts.inc(level="WARNING")
+    alerts.inc(2, level="WARNING")
+    alerts.inc(level='we"ird')
+    depth.set(7)
+    text = registry.render()
+    assert "# TYPE secmon_test_alerts_total counter" in text
+    assert 'secmon_test_alerts_total{level="WARNING"} 3' in text
+    assert 'secmon_test_alerts_total{level="we\\"ird"} 1' in text
+    assert "secmon_test_depth 7" in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    scan = registry.histogram("secmon_test_scan_seconds", "Scan", ["monitor"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        scan.observe(value, monitor="network")
+    text = registry.render()
+    assert 'secmon_test_scan_seconds_bucket{monitor="network",le="0.1"} 1' in text
+    assert 'secmon_test_scan_seconds_bucket{monitor="network",le="1"} 3' in text
+    assert 'secmon_test_scan_seconds_bucket{monitor="network",le="+Inf"} 4' in text
+    assert 'secmon_test_scan_seconds_count{monitor="network"} 4' in text
+    assert scan.count(monitor="network") == 4
+
+def test_register_returns_existing_metric():
+    registry = Registry()
+    assert registry.counter("c", "help") is registry.counter("c", "help")
+
+def test_collectors_run_before_render():
+    registry = Registry()
+    gauge = registry.gauge("secmon_test_queue", "Queue")
+    registry.on_collect(lambda: gauge.set(42))
+    assert "secmon_test_queue 42" in registry.render()
+
+def test_http_endpoint_and_self_metrics():
+    server = metrics.start_http_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode()
+            assert response.headers["Content-Type"].startswith("text/plain")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert "secmon_process_resident_memory_bytes" in body
+    assert 'secmon_process_cpu_seconds{mode="user"}' in body
+
+def test_write_textfile(tmp_path):
+    registry = Registry()
+    registry.counter("secmon_test_total", "Test").inc()
+    path = tmp_path / "secmon.prom"
+    metrics.write_textfile(path, registry)
+    assert "secmon_test_total 1" in path.read_text()
+    assert list(tmp_path.iterdir()) == [path]
+
+def test_profiled_dumps_stats(tmp_path):
+    def scan():
+        return sum(range(1000))
+
+    wrapped = metrics.profiled("Network Monitor", scan, tmp_path)
+    assert wrapped() == sum(range(1000))
+    stats = pstats.Stats(str(tmp_path / "network_monitor.prof"))
+    assert any(func[2] == "scan" for func in stats.stats)
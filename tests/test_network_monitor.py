@@ -1,13 +1,19 @@
 import pytest
 import psutil
-from unittest.mock import patch, Mock
-from agent import network_monitor
+from unittest.mock import patch, Mock, MagicMock
+from agent import network_monitor, rule_engine
+from agent.conn_table import ConnectionTable
+from agent.proc_cache import ProcInfo
 
 def test_is_public_ip():
     assert network_monitor.is_public_ip("8.8.8.8") is True
     assert network_monitor.is_public_ip("192.168.1.1") is False
     assert network_monitor.is_public_ip("0.0.0.0") is False
     assert network_monitor.is_public_ip("") is False
+    assert network_monitor.is_public_ip("::1") is False
+    assert network_monitor.is_public_ip("fe80::1") is False
+    assert network_monitor.is_public_ip("100.64.1.1") is False
+    assert network_monitor.is_public_ip("2a00:1450:4001::1") is True
 
 @patch("psutil.net_connections")
 def test_monitor_network_access_denied(mock_net_connections):
@@ -22,14 +28,103 @@ def test_monitor_network_access_denied(mock_net_connections):
 def test_monitor_network_success(mock_net_connections, monkeypatch):
     mock_conn = Mock(laddr=Mock(ip="127.0.0.1", port=8080), raddr=Mock(ip="8.8.8.8", port=80), pid=123)
     mock_net_connections.return_value = [mock_conn]
-    monkeypatch.setattr("agent.network_monitor.known_conns", set())
-    monkeypatch.setattr("agent.network_monitor.get_process_info", lambda pid: ("cmd", "/bin/test"))
+    monkeypatch.setattr("agent.network_monitor.known_conns", ConnectionTable(network_monitor.CACHE_TTL))
+    monkeypatch.setattr("agent.network_monitor.get_process_info", lambda pid, snap=None: ("cmd", "/bin/test"))
     with patch("agent.network_monitor.alerter.alert") as mock_alert:
         network_monitor.monitor_network()
         mock_alert.assert_called()
 
-def test_clean_cache():
-    network_monitor.known_conns = {(123, "127.0.0.1", 8080, "8.8.8.8", 80, 0)}
+def test_clean_cache(monkeypatch):
+    table = ConnectionTable(network_monitor.CACHE_TTL)
+    table.touch((123, "127.0.0.1", 8080, "8.8.8.8", 80), now=0)
+    monkeypatch.setattr("agent.network_monitor.known_conns", table)
     with patch("time.time", return_value=network_monitor.CACHE_TTL + 1):
         network_monitor.clean_cache()
-        assert not network_monitor.known_conns  
+        assert not network_monitor.known_conns
+
+@patch("psutil.net_connections")
+def test_monitor_network_alerts_once_per_connection(mock_net_connections, monkeypatch):
+    mock_conn = Mock(laddr=Mock(ip="10.0.0.2", port=40000), raddr=Mock(ip="8.8.8.8", port=443), pid=7)
+    mock_net_connections.return_value = [mock_conn]
+    monkeypatch.setattr("agent.network_monitor.known_conns", ConnectionTable(network_monitor.CACHE_TTL))
+    monkeypatch.setattr("agent.network_monitor.get_process_info", lambda pid, snap=None: ("cmd", "/bin/test"))
+    with patch("agent.network_monitor.alerter.alert") as mock_alert:
+        network_monitor.monitor_network()
+        network_monitor.monitor_network()
+        assert mock_alert.call_count == 1
+
+
+def test_init_selects_backend(monkeypatch):
+    monkeypatch.setattr("agent.network_monitor.BACKEND", "psutil")
+    monkeypatch.setattr("agent.network_monitor.proc_net_reader", None)
+    network_monitor.init({"network_backend": "psutil"})
+    assert network_monitor.proc_net_reader is None
+    with patch("agent.network_monitor.ProcNetReader.available", return_value=True):
+        network_monitor.init({"network_backend": "procfs"})
+    assert network_monitor.BACKEND == "procfs"
+    with patch.object(network_monitor.proc_net_reader, "connections", return_value=["conn"]):
+        assert network_monitor.get_connections() == ["conn"]
+
+@patch("psutil.net_connections")
+def test_monitor_network_deny_cidr(mock_net_connections, monkeypatch):
+    mock_conn = Mock(laddr=Mock(ip="10.0.0.2", port=40000), raddr=Mock(ip="10.66.0.9", port=22), pid=7)
+    mock_net_connections.return_value = [mock_conn]
+    monkeypatch.setattr("agent.network_monitor.known_conns", ConnectionTable(network_monitor.CACHE_TTL))
+    monkeypatch.setattr("agent.network_monitor.get_process_info", lambda pid, snap=None: ("cmd", "/bin/test"))
+    monkeypatch.setattr("agent.network_monitor.proc_net_reader", None)
+    monkeypatch.setattr("agent.rule_engine.RULES", {"network_deny_cidrs": ["10.66.0.0/16"]})
+    monkeypatch.setattr("agent.rule_engine.GENERATION", rule_engine.GENERATION + 1)
+    monkeypatch.setattr("agent.network_monitor.CLASSIFIER", network_monitor.CLASSIFIER)
+    monkeypatch.setattr("agent.network_monitor.classifier_generation", None)
+    network_monitor.init({"network_backend": "psutil"})
+    with patch("agent.network_monitor.alerter.alert") as mock_alert:
+        network_monitor.monitor_network()
+        assert "запрещённой сетью" in mock_alert.call_args[0][0]
+
+def test_scan_records_metrics():
+    from agent import metrics
+    conn = Mock(laddr=Mock(ip="127.0.0.1", port=8080), raddr=None, pid=1)
+    before = metrics.SCAN_SECONDS.count(monitor="network")
+    with patch("agent.network_monitor.get_connections", return_value=[conn]):
+        network_monitor.monitor_network()
+    assert metrics.SCAN_SECONDS.count(monitor="network") == before + 1
+    assert metrics.SCAN_ITEMS.value(monitor="network") == 1
+
+def test_monitor_network_beacon(monkeypatch):
+    from agent import beacon
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.Ruleset(
+        {"beacon_rules": [{"id": "c2", "min_connections": 4, "min_interval": 10}]}))
+    monkeypatch.setattr("agent.beacon.tracker", beacon.BeaconTracker())
+    monkeypatch.setattr("agent.network_monitor.known_conns", ConnectionTable(network_monitor.CACHE_TTL))
+    monkeypatch.setattr("agent.network_monitor.get_process_info", lambda pid, snap=None: ("cmd", "/tmp/implant"))
+    alerts = []
+    for i in range(6):
+        conn = Mock(laddr=Mock(ip="10.0.0.2", port=40000 + i), raddr=Mock(ip="10.1.2.3", port=8443), pid=7)
+        with patch("agent.network_monitor.get_connections", return_value=[conn]), \
+                patch("time.time", return_value=1000 + i * 60), \
+                patch("agent.network_monitor.alerter.alert") as mock_alert:
+            network_monitor.monitor_network()
+        alerts += mock_alert.call_args_list
+    assert len(alerts) == 1
+    assert alerts[0].kwargs["rule"] == "beacon"
+    assert alerts[0].kwargs["rule_ids"] == ("c2",)
+    assert alerts[0].kwargs["key"] == ("/tmp/implant", "10.1.2.3", 8443)
+
+def test_get_process_info_without_pid():
+    with patch("agent.network_monitor.proc_cache.get") as mock_get:
+        assert network_monitor.get_process_info(None) == ("n/a", "n/a")
+        mock_get.assert_not_called()
+
+def test_get_process_info_rereads_after_exec():
+    stale = ProcInfo(4242, 1, 1.0, "bash", "/bin/bash", "bash", "sshd")
+    fresh = stale._replace(name="nc", exe="/bin/nc", cmdline="nc -e /bin/sh")
+    snap = MagicMock()
+    snap.process.return_value = stale
+    with patch("psutil.Process") as mock_process, \
+            patch("agent.network_monitor.proc_cache.get", return_value=fresh) as mock_get:
+        mock_process.return_value.exe.return_value = "/bin/nc"
+        assert network_monitor.get_process_info(4242, snap) == ("nc -e /bin/sh", "/bin/nc")
+        mock_get.assert_called_once_with(4242)
+        mock_process.return_value.exe.return_value = "/bin/bash"
+        assert network_monitor.get_process_info(4242, snap) == ("bash", "/bin/bash")
+        mock_get.assert_called_once()
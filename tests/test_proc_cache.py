@@ -0,0 +1,79 @@
+import os
+import pytest
+import psutil
+from unittest.mock import MagicMock
+from agent.proc_cache import ProcessCache
+
+def make_proc(pid, create_time, cmdline=("bash",), parent_name="init"):
+    proc = MagicMock()
+    proc.pid = pid
+    proc.create_time.return_value = create_time
+    proc.ppid.return_value = 1
+    proc.name.return_value = cmdline[0]
+    proc.exe.return_value = f"/bin/{cmdline[0]}"
+    proc.cmdline.return_value = list(cmdline)
+    proc.parent.return_value.name.return_value = parent_name
+    return proc
+
+def test_get_reads_process_once():
+    cache = ProcessCache()
+    proc = make_proc(100, 1.0, ("nc", "-lvp", "4444"), parent_name="bash")
+    for _ in range(100):
+        info = cache.get(proc)
+    assert info.cmdline == "nc -lvp 4444"
+    assert info.exe == "/bin/nc"
+    assert info.parent_name == "bash"
+    assert proc.cmdline.call_count == 1
+    assert proc.parent.call_count == 1
+    assert cache.hits == 99 and cache.misses == 1
+
+def test_pid_reuse_is_detected():
+    cache = ProcessCache()
+    assert cache.get(make_proc(100, 1.0, ("sshd",))).name == "sshd"
+    assert cache.get(make_proc(100, 2.0, ("nc",))).name == "nc"
+    assert len(cache) == 1
+
+def test_exec_is_detected_on_hit():
+    # exec сохраняет (pid, create_time), но меняет exe - запись перечитывается.
+    cache = ProcessCache()
+    proc = make_proc(100, 1.0, ("bash",))
+    assert cache.get(proc).exe == "/bin/bash"
+    proc.exe.return_value = "/bin/nc"
+    proc.name.return_value = "nc"
+    proc.cmdline.return_value = ["nc", "-e", "/bin/sh"]
+    info = cache.get(proc)
+    assert (info.exe, info.cmdline) == ("/bin/nc", "nc -e /bin/sh")
+    assert cache.misses == 2 and len(cache) == 1
+
+def test_lru_bound():
+    cache = ProcessCache(maxsize=2)
+    first = make_proc(1, 1.0)
+    cache.get(first)
+    cache.get(make_proc(2, 1.0))
+    cache.get(first)
+    cache.get(make_proc(3, 1.0))
+    assert len(cache) == 2
+    cache.get(first)
+    assert first.cmdline.call_count == 1
+
+def test_prune_and_invalidate():
+    cache = ProcessCache()
+    for pid in (1, 2, 3):
+        cache.get(make_proc(pid, 1.0))
+    assert cache.prune([1, 2]) == 1
+    cache.invalidate(2)
+    assert len(cache) == 1
+
+def test_live_process():
+    cache = ProcessCache()
+    info = cache.get(os.getpid())
+    assert info.pid == os.getpid()
+    assert info.create_time == psutil.Process().create_time()
+
+def test_exited_process_raises():
+    cache = ProcessCache()
+    proc = make_proc(100, 1.0)
+    proc.cmdline.side_effect = psutil.NoSuchProcess(100)
+    with pytest.raises(psutil.NoSuchProcess):
+        cache.get(proc)
+    assert len(cache) == 0
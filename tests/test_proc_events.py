@@ -0,0 +1,71 @@
+import errno
+import struct
+import pytest
+from unittest.mock import MagicMock, patch
+from agent import proc_events
+from agent.proc_events import PollingSource, parse_message
+
+def netlink_message(what, *fields):
+    body = struct.pack("=IIQ", what, 0, 5_000_000_000) + struct.pack("=" + "I" * len(fields), *fields)
+    cn_msg = proc_events.CN_MSG_HDR.pack(proc_events.CN_IDX_PROC, proc_events.CN_VAL_PROC, 0, 0, len(body), 0) + body
+    return proc_events.NLMSG_HDR.pack(16 + len(cn_msg), proc_events.NLMSG_DONE, 0, 0, 0) + cn_msg
+
+def test_parse_fork_exec_exit():
+    data = (netlink_message(proc_events.PROC_EVENT_FORK, 10, 10, 20, 20)
+            + netlink_message(proc_events.PROC_EVENT_EXEC, 20, 20)
+            + netlink_message(proc_events.PROC_EVENT_EXIT, 20, 20, 0, 17))
+    events = parse_message(data)
+    assert [(e.kind, e.pid, e.ppid) for e in events] == [("fork", 20, 10), ("exec", 20, None), ("exit", 20, None)]
+    assert events[0].timestamp == 5.0
+
+def test_parse_ignores_threads_and_unknown_events():
+    data = (netlink_message(proc_events.PROC_EVENT_FORK, 10, 10, 21, 20)
+            + netlink_message(proc_events.PROC_EVENT_EXIT, 21, 20, 0, 0)
+            + netlink_message(0x40, 1, 1))
+    assert parse_message(data) == []
+
+def test_parse_truncated_message():
+    assert parse_message(b"\x00" * 8) == []
+
+def test_polling_source_diffs_pids():
+    source = PollingSource()
+    with patch("psutil.pids", return_value=[1, 2, 3]):
+        assert source.poll() == []
+    with patch("psutil.pids", return_value=[1, 3, 4]):
+        events = source.poll()
+    assert sorted((e.kind, e.pid) for e in events) == [("exec", 4), ("exit", 2)]
+
+def test_create_source_falls_back_to_polling():
+    with patch("agent.proc_events.NetlinkSource", side_effect=PermissionError):
+        assert isinstance(proc_events.create_source("auto"), PollingSource)
+        with pytest.raises(PermissionError):
+            proc_events.create_source("netlink")
+    assert isinstance(proc_events.create_source("poll"), PollingSource)
+
+def start_netlink(recv_results, pids):
+    sock = MagicMock()
+    sock.recv.side_effect = recv_results
+    with patch("agent.proc_events.socket.socket", return_value=sock), patch("psutil.pids", return_value=pids):
+        source = proc_events.NetlinkSource()
+    source._thread.join(5)
+    return source
+
+def test_netlink_loss_forces_resync():
+    lost_before = proc_events.LOST.value()
+    source = start_netlink([OSError(errno.ENOBUFS, "ENOBUFS"),
+                            netlink_message(proc_events.PROC_EVENT_EXIT, 2, 2, 0, 0),
+                            OSError(errno.EBADF, "EBADF")], [1, 2, 3])
+    assert source.lost == 1
+    assert proc_events.LOST.value() == lost_before + 1
+    with patch("psutil.pids", return_value=[1, 4, 5]):
+        events = source.poll()
+    assert sorted((e.kind, e.pid) for e in events) == [("exec", 4), ("exec", 5), ("exit", 2), ("exit", 3)]
+    assert source.known == {1, 4, 5}
+    with patch("psutil.pids") as mock_pids:
+        assert source.poll() == []
+        mock_pids.assert_not_called()
+
+def test_netlink_reader_failure_is_reported():
+    source = start_netlink([OSError(errno.EBADF, "EBADF")], [1])
+    assert source.failed is not None and source.failed.errno == errno.EBADF
+    assert source.lost == 0
@@ -0,0 +1,178 @@
+import os
+import socket
+import pytest
+from agent import proc_net
+from agent.proc_net import Addr, ProcNetReader
+
+TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+TCP_LINES = [
+    "   0: 0100007F:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 1001 1 0 100 0 0 10 0\n",
+    "   1: 0200000A:9C40 08080808:01BB 01 00000000:00000000 00:00000000 00000000  1000        0 1002 1 0 100 0 0 10 0\n",
+]
+TCP6_LINES = [
+    "   0: 00000000000000000000000001000000:0016 00000000000000000000000000000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 2001 1 0 100 0 0 10 0\n",
+]
+UDP_LINES = [
+    "  0: 00000000:0044 00000000:0000 07 00000000:00000000 00:00000000 00000000     0        0 3001 2 0 0\n",
+]
+
+def make_proc(root, pids):
+    net = root / "net"
+    net.mkdir(parents=True, exist_ok=True)
+    (net / "tcp").write_text(TCP_HEADER + "".join(TCP_LINES))
+    (net / "tcp6").write_text(TCP_HEADER + "".join(TCP6_LINES))
+    (net / "udp").write_text(TCP_HEADER + "".join(UDP_LINES))
+    (net / "udp6").write_text(TCP_HEADER)
+    for pid, targets in pids.items():
+        add_fds(root, pid, targets)
+    return str(root)
+
+def write_stat(root, pid, starttime=1000, comm="worker"):
+    # Поле 22 - starttime; comm в скобках может содержать пробелы.
+    (root / str(pid) / "stat").write_text(f"{pid} ({comm}) S 1 " + "0 " * 17 + f"{starttime} 0 0\n")
+
+def add_fds(root, pid, targets):
+    fd_dir = root / str(pid) / "fd"
+    fd_dir.mkdir(parents=True, exist_ok=True)
+    if not (root / str(pid) / "stat").exists():
+        write_stat(root, pid)
+    for fd, target in targets.items():
+        os.symlink(target, fd_dir / str(fd))
+
+def by_inode_order(conns):
+    return {(c.laddr.ip, c.laddr.port): c for c in conns}
+
+def test_decode_address():
+    assert proc_net.decode_address("0100007F:1F90", socket.AF_INET) == Addr("127.0.0.1", 8080)
+    assert proc_net.decode_address("00000000000000000000000001000000:0016", socket.AF_INET6) == Addr("::1", 22)
+
+def test_connections_from_fixture_tree(tmp_path):
+    root = make_proc(tmp_path, {
+        100: {0: "/dev/null", 3: "socket:[1001]"},
+        200: {4: "socket:[1002]", 5: "socket:[2001]"},
+    })
+    conns = by_inode_order(ProcNetReader(root).connections())
+    listen = conns[("127.0.0.1", 8080)]
+    assert listen.pid == 100
+    assert listen.status == "LISTEN"
+    assert listen.raddr == ()
+    established = conns[("10.0.0.2", 40000)]
+    assert established.pid == 200
+    assert established.raddr == Addr("8.8.8.8", 443)
+    assert established.status == "ESTABLISHED"
+    assert conns[("::1", 22)].pid == 200
+    udp = conns[("0.0.0.0", 68)]
+    assert udp.type == socket.SOCK_DGRAM
+    assert udp.status == "NONE"
+    assert udp.pid is None
+
+def test_only_new_fds_are_read(tmp_path, monkeypatch):
+    root = make_proc(tmp_path, {100: {3: "socket:[1001]"}, 200: {4: "socket:[1002]"}})
+    reader = ProcNetReader(root)
+    reader.connections()
+
+    reads = []
+    real_readlink = os.readlink
+    monkeypatch.setattr(proc_net.os, "readlink", lambda p: reads.append(p) or real_readlink(p))
+    reader.connections()
+    # Все сокеты уже в карте, а сокеты без владельца запомнены
+    # и не вызывают повторного перескана.
+    assert reads == []
+
+    with open(tmp_path / "net" / "tcp", "a") as f:
+        f.write("   2: 0200000A:9C41 08080404:0050 01 00000000:00000000 00:00000000 00000000  1000        0 1003 1 0 100 0 0 10 0\n")
+    add_fds(tmp_path, 200, {5: "socket:[1003]"})
+    conns = by_inode_order(reader.connections())
+    assert conns[("10.0.0.2", 40001)].pid == 200
+    assert reads == [os.path.join(root, "200", "fd", "5")]
+
+def test_exited_pid_is_dropped(tmp_path):
+    root = make_proc(tmp_path, {100: {3: "socket:[1001]"}})
+    reader = ProcNetReader(root)
+    assert by_inode_order(reader.connections())[("127.0.0.1", 8080)].pid == 100
+    for entry in (tmp_path / "100" / "fd").iterdir():
+        entry.unlink()
+    (tmp_path / "100" / "fd").rmdir()
+    (tmp_path / "100" / "stat").unlink()
+    (tmp_path / "100").rmdir()
+    assert by_inode_order(reader.connections())[("127.0.0.1", 8080)].pid is None
+
+@pytest.mark.skipif(not ProcNetReader.available(), reason="requires Linux /proc/net")
+def test_live_proc_finds_own_socket():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        conns = ProcNetReader().connections()
+        own = [c for c in conns if c.laddr.port == port and c.status == "LISTEN"]
+        assert own and own[0].pid == os.getpid()
+    finally:
+        server.close()
+
+def test_reused_fd_reads_only_changed_pid(tmp_path, monkeypatch):
+    root = make_proc(tmp_path, {100: {3: "socket:[1001]"}, 200: {4: "socket:[1002]", 5: "/dev/null"}})
+    now = [0.0]
+    reader = ProcNetReader(root, clock=lambda: now[0])
+    reader.connections()
+
+    reads = []
+    real_readlink = os.readlink
+    monkeypatch.setattr(proc_net.os, "readlink", lambda p: reads.append(p) or real_readlink(p))
+    # PID 100 закрыл сокет 1001 и открыл новый на том же номере fd 3.
+    (tmp_path / "net" / "tcp").write_text(TCP_HEADER + TCP_LINES[1] +
+        "   2: 0200000A:9C41 08080404:0050 01 00000000:00000000 00:00000000 00000000  1000        0 1003 1 0 100 0 0 10 0\n")
+    (tmp_path / "100" / "fd" / "3").unlink()
+    add_fds(tmp_path, 100, {3: "socket:[1003]"})
+    assert by_inode_order(reader.connections())[("10.0.0.2", 40001)].pid == 100
+    assert reads == [os.path.join(root, "100", "fd", "3")]
+
+def test_full_rescan_is_rate_limited(tmp_path, monkeypatch):
+    root = make_proc(tmp_path, {100: {3: "socket:[1001]"}, 200: {4: "socket:[1002]", 5: "/dev/null"}})
+    now = [0.0]
+    reader = ProcNetReader(root, clock=lambda: now[0])
+    reader.connections()
+    # Файловый fd 5 у PID 200 стал сокетом: найти его можно только полным перечитом.
+    with open(tmp_path / "net" / "tcp", "a") as f:
+        f.write("   2: 0200000A:9C41 08080404:0050 01 00000000:00000000 00:00000000 00000000  1000        0 1003 1 0 100 0 0 10 0\n")
+    (tmp_path / "200" / "fd" / "5").unlink()
+    add_fds(tmp_path, 200, {5: "socket:[1003]"})
+    assert by_inode_order(reader.connections())[("10.0.0.2", 40001)].pid == 200
+
+    reads = []
+    real_readlink = os.readlink
+    monkeypatch.setattr(proc_net.os, "readlink", lambda p: reads.append(p) or real_readlink(p))
+    with open(tmp_path / "net" / "tcp", "a") as f:
+        f.write("   3: 0200000A:9C42 08080404:0050 01 00000000:00000000 00:00000000 00000000  1000        0 1004 1 0 100 0 0 10 0\n")
+    (tmp_path / "100" / "fd" / "3").unlink()
+    add_fds(tmp_path, 100, {3: "/dev/null", 6: "/dev/zero"})
+    (tmp_path / "100" / "fd" / "3").unlink()
+    add_fds(tmp_path, 100, {3: "socket:[1004]"})
+    now[0] = 10
+    conns = by_inode_order(reader.connections())
+    assert conns[("10.0.0.2", 40002)].pid is None
+    # Прочитан только новый fd 6, полного перечита до истечения интервала нет.
+    assert reads == [os.path.join(root, "100", "fd", "6")]
+    reader.connections()
+    assert len(reads) == 1
+    now[0] = proc_net.FULL_RESCAN_INTERVAL + 1
+    assert by_inode_order(reader.connections())[("10.0.0.2", 40002)].pid == 100
+
+def test_identity_is_starttime(tmp_path, monkeypatch):
+    root = make_proc(tmp_path, {100: {3: "socket:[1001]"}, 200: {4: "socket:[1002]"}})
+    write_stat(tmp_path, 200, starttime=5555, comm="evil) S 1 2 (x")
+    reader = ProcNetReader(root)
+    assert reader.scan_pids() == {100: 1000, 200: 5555}
+    reader.connections()
+
+    reads = []
+    real_readlink = os.readlink
+    monkeypatch.setattr(proc_net.os, "readlink", lambda p: reads.append(p) or real_readlink(p))
+    # Смена ctime каталога (inode procfs пересоздан) - тот же процесс.
+    os.chmod(tmp_path / "100", 0o755)
+    reader.connections()
+    assert reads == []
+    # Новый starttime - новый процесс с тем же PID: его fd читаются заново.
+    write_stat(tmp_path, 100, starttime=2000)
+    reader.connections()
+    assert reads == [os.path.join(root, "100", "fd", "3")]
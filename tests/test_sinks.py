@@ -0,0 +1,98 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agent.events import make_event
+from agent.sinks import JsonLinesSink, Sink, SyslogSink, WebhookSink, create_sink
+
+def test_jsonl_sink_flushes_by_size(tmp_path):
+    path = tmp_path / "events.jsonl"
+    sink = JsonLinesSink(path, batch_size=10, flush_interval=60)
+    sink.start()
+    for i in range(10):
+        sink.put(make_event(f"event {i}", monitor="file", path=f"/etc/{i}"))
+    deadline = time.time() + 5
+    while not path.exists() or len(path.read_text().splitlines()) < 10:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    sink.stop()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["path"] for line in lines] == [f"/etc/{i}" for i in range(10)]
+
+def test_jsonl_sink_flushes_on_stop(tmp_path):
+    path = tmp_path / "events.jsonl"
+    sink = JsonLinesSink(path, batch_size=1000, flush_interval=60)
+    sink.start()
+    sink.put(make_event("one"))
+    sink.stop()
+    assert json.loads(path.read_text())["message"] == "one"
+
+def test_syslog_sink_sends_datagrams(tmp_path):
+    address = str(tmp_path / "log.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    server.bind(address)
+    server.settimeout(5)
+    sink = SyslogSink(address, flush_interval=0.01)
+    sink.start()
+    sink.put(make_event("alarm", level="ERROR", monitor="process", pid=5))
+    data = server.recv(65536).decode()
+    sink.stop()
+    server.close()
+    assert data.startswith("<35>secmon[")
+    assert json.loads(data.split(": ", 1)[1])["pid"] == 5
+
+class WebhookStub(BaseHTTPRequestHandler):
+    received = []
+
+    def do_POST(self):
+        WebhookStub.received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def test_webhook_sink_posts_batches():
+    WebhookStub.received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sink = WebhookSink(f"http://127.0.0.1:{server.server_address[1]}/hook", batch_size=5, flush_interval=60)
+    sink.start()
+    for i in range(5):
+        sink.put(make_event(f"e{i}"))
+    sink.stop()
+    server.shutdown()
+    server.server_close()
+    assert [[e["message"] for e in batch] for batch in WebhookStub.received] == [["e0", "e1", "e2", "e3", "e4"]]
+
+def test_slow_sink_does_not_block_others(tmp_path):
+    release = threading.Event()
+
+    class SlowSink(Sink):
+        def write(self, batch):
+            release.wait(5)
+
+    slow = SlowSink("slow", flush_interval=0.01)
+    fast = JsonLinesSink(tmp_path / "fast.jsonl", flush_interval=0.01)
+    slow.start()
+    fast.start()
+    for i in range(3):
+        event = make_event(f"e{i}")
+        slow.put(event)
+        fast.put(event)
+    deadline = time.time() + 5
+    while fast.stats()["sent"] < 3:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert slow.stats()["sent"] == 0
+    release.set()
+    slow.stop()
+    fast.stop()
+
+def test_create_sink_rejects_unknown_type():
+    with pytest.raises(ValueError, match="Unknown sink type"):
+        create_sink({"type": "kafka"})
@@ -0,0 +1,102 @@
+import os
+import pytest
+from unittest.mock import patch
+from agent import network_monitor, snapshot
+from agent.conn_table import ConnectionTable
+from agent.proc_cache import ProcInfo
+from agent.proc_events import EXEC, EXIT
+from agent.proc_net import ProcNetReader
+from agent.snapshot import SnapshotCollector, SnapshotSource
+
+TCP = ("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+       "   0: 0200000A:9C40 08080808:01BB 01 00000000:00000000 00:00000000 00000000  1000        0 1002 1 0 100 0 0 10 0\n")
+
+def make_proc(root, pids):
+    (root / "net").mkdir(parents=True, exist_ok=True)
+    (root / "net" / "tcp").write_text(TCP)
+    for pid, targets in pids.items():
+        fd_dir = root / str(pid) / "fd"
+        fd_dir.mkdir(parents=True, exist_ok=True)
+        (root / str(pid) / "stat").write_text(f"{pid} (proc{pid}) S 1 " + "0 " * 17 + f"{pid} 0 0\n")
+        for fd, target in targets.items():
+            os.symlink(target, fd_dir / str(fd))
+    return str(root)
+
+def fake_info(pid):
+    return ProcInfo(pid, 1, float(pid), f"proc{pid}", f"/usr/bin/proc{pid}", f"proc{pid} --serve", "systemd")
+
+@pytest.fixture
+def reads(monkeypatch):
+    calls = []
+
+    def get(pid):
+        calls.append(pid)
+        return fake_info(pid)
+    monkeypatch.setattr("agent.proc_cache.get", get)
+    return calls
+
+def test_collect_reads_proc_once_per_tick(tmp_path, reads):
+    reader = ProcNetReader(make_proc(tmp_path, {100: {3: "/dev/null"}, 200: {4: "socket:[1002]"}}))
+    collector = SnapshotCollector(reader)
+    with patch.object(reader, "_list_pids", wraps=reader._list_pids) as listing:
+        snap = collector.collect()
+        assert listing.call_count == 1
+    assert set(snap.processes) == {100, 200}
+    assert snap.connections[0].pid == 200
+    assert snap.process(200).exe == "/usr/bin/proc200"
+    with pytest.raises(TypeError):
+        snap.processes[300] = fake_info(300)
+
+def test_only_new_processes_are_read(tmp_path, reads):
+    root = tmp_path / "proc"
+    reader = ProcNetReader(make_proc(root, {100: {}, 200: {}}))
+    collector = SnapshotCollector(reader)
+    collector.collect()
+    assert sorted(reads) == [100, 200]
+    make_proc(root, {300: {}})
+    (root / "100" / "fd").rmdir()
+    (root / "100" / "stat").unlink()
+    (root / "100").rmdir()
+    snap = collector.collect()
+    assert sorted(reads) == [100, 200, 300]
+    assert set(snap.processes) == {200, 300}
+    assert snap.tick == 2
+
+def test_get_reuses_fresh_snapshot(tmp_path, reads):
+    now = [0.0]
+    collector = SnapshotCollector(ProcNetReader(make_proc(tmp_path, {100: {}})), clock=lambda: now[0])
+    first = collector.get(max_age=3)
+    now[0] = 2.0
+    assert collector.get(max_age=3) is first
+    now[0] = 3.5
+    assert collector.get(max_age=3).tick == 2
+
+def test_snapshot_source_diffs_ticks(tmp_path, reads, monkeypatch):
+    root = tmp_path / "proc"
+    collector = SnapshotCollector(ProcNetReader(make_proc(root, {100: {}})))
+    monkeypatch.setattr("agent.snapshot.collector", collector)
+    source = SnapshotSource()
+    assert source.poll() == []
+    make_proc(root, {300: {}})
+    (root / "100" / "fd").rmdir()
+    (root / "100" / "stat").unlink()
+    (root / "100").rmdir()
+    collector.collect()
+    events = source.poll()
+    assert [(e.kind, e.pid) for e in events] == [(EXIT, 100), (EXEC, 300)]
+    assert events[1].info.cmdline == "proc300 --serve"
+    assert source.poll() == []
+
+def test_network_monitor_uses_snapshot(tmp_path, reads, monkeypatch):
+    reader = ProcNetReader(make_proc(tmp_path, {200: {4: "socket:[1002]"}}))
+    collector = SnapshotCollector(reader)
+    collector.collect()
+    monkeypatch.setattr("agent.snapshot.collector", collector)
+    monkeypatch.setattr("agent.network_monitor.known_conns", ConnectionTable(network_monitor.CACHE_TTL))
+    # PID 200 из фикстуры может существовать на хосте: сверку exe не делаем.
+    with patch("agent.network_monitor.alerter.alert") as mock_alert, \
+            patch("agent.network_monitor.proc_cache.is_current", return_value=True), \
+            patch("agent.network_monitor.proc_cache.get", side_effect=AssertionError("re-read")):
+        network_monitor.monitor_network()
+    assert "`EXE:` /usr/bin/proc200" in mock_alert.call_args[0][0]
+    assert reads == [200]